@@ -1,6 +1,78 @@
 from django.contrib import admin
+from django.contrib.admin.views.main import ChangeList
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
-from .models import User, Course, Enrollment, Lesson, Quiz, QuizAttempt, Activity, Recommendation, Feedback, PDFReadingProgress, ReadingSession, ChatMessage
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from .models import User, Course, Enrollment, Lesson, Quiz, QuizAttempt, Activity, Recommendation, Feedback, PDFReadingProgress, ReadingSession, ChatMessage, CoursePage, CourseContent, BackgroundJob, SegmentRecommendation, CourseTrend, CounterShard, UserNeighbors
+from .sharding import fan_out, history_aliases
+
+
+class ShardedChangeList(ChangeList):
+    def url_for_result(self, result):
+        # Primary keys repeat across shards: name the shard of the row
+        return f'{super().url_for_result(result)}?_shard={result._state.db}'
+
+
+class ShardedModelAdmin(admin.ModelAdmin):
+    """
+    Admin for a model stored in user shards (core.sharding)
+
+    The change list fans out over the shards and merges their rows. Related
+    users and courses live in 'default', so they are prefetched rather than
+    joined, searched by id and not sortable. Bulk actions are disabled since
+    a selected primary key does not identify a single row.
+    """
+    list_select_related = []
+
+    def _foreign_keys(self):
+        return {field.name for field in self.model._meta.concrete_fields if field.is_relation}
+
+    def get_queryset(self, request):
+        related = [name for name in self.list_display if name in self._foreign_keys()]
+        return fan_out(super().get_queryset(request).prefetch_related(*related))
+
+    def get_changelist(self, request, **kwargs):
+        return ShardedChangeList
+
+    def get_sortable_by(self, request):
+        return [name for name in self.get_list_display(request) if name not in self._foreign_keys()]
+
+    def get_actions(self, request):
+        return {}
+
+    def get_readonly_fields(self, request, obj=None):
+        readonly = list(super().get_readonly_fields(request, obj))
+        # Changing the user would move the row to another shard
+        return readonly + ['user'] if obj is not None else readonly
+
+    def get_search_results(self, request, queryset, search_term):
+        foreign_keys = self._foreign_keys()
+        for term in search_term.split():
+            condition = Q()
+            for name in self.get_search_fields(request):
+                relation, _, lookup = name.partition('__')
+                if relation in foreign_keys and lookup:
+                    related_model = self.model._meta.get_field(relation).related_model
+                    ids = list(related_model._default_manager.filter(**{f'{lookup}__icontains': term})
+                               .values_list('pk', flat=True))
+                    condition |= Q(**{f'{relation}_id__in': ids})
+                else:
+                    condition |= Q(**{f'{name}__icontains': term})
+            queryset = queryset.filter(condition)
+        return queryset, False
+
+    def get_object(self, request, object_id, from_field=None):
+        shard = request.GET.get('_shard')
+        aliases = [shard] if shard in history_aliases() else history_aliases()
+        queryset = super().get_queryset(request)
+        matches = []
+        for alias in aliases:
+            try:
+                matches.append(queryset.using(alias).get(pk=object_id))
+            except (self.model.DoesNotExist, ValidationError, ValueError):
+                continue
+        # Without the shard, an id found on several shards is ambiguous
+        return matches[0] if len(matches) == 1 else None
 
 
 @admin.register(User)
@@ -21,7 +93,7 @@ class UserAdmin(BaseUserAdmin):
 
 @admin.register(Course)
 class CourseAdmin(admin.ModelAdmin):
-    list_display = ['title', 'category', 'level', 'enrolled_count', 'rating', 'duration_hours']
+    list_display = ['title', 'category', 'level', 'enrolled_count', 'completion_count', 'rating', 'duration_hours']
     list_filter = ['category', 'level', 'created_at']
     search_fields = ['title', 'description']
     readonly_fields = ['created_at', 'updated_at']
@@ -49,14 +121,14 @@ class QuizAdmin(admin.ModelAdmin):
 
 
 @admin.register(QuizAttempt)
-class QuizAttemptAdmin(admin.ModelAdmin):
+class QuizAttemptAdmin(ShardedModelAdmin):
     list_display = ['user', 'quiz', 'is_correct', 'score', 'attempted_at']
     list_filter = ['is_correct', 'attempted_at']
     readonly_fields = ['attempted_at']
 
 
 @admin.register(Activity)
-class ActivityAdmin(admin.ModelAdmin):
+class ActivityAdmin(ShardedModelAdmin):
     list_display = ['user', 'activity_type', 'timestamp', 'session_duration']
     list_filter = ['activity_type', 'timestamp']
     search_fields = ['user__username']
@@ -72,20 +144,35 @@ class RecommendationAdmin(admin.ModelAdmin):
 
 
 @admin.register(PDFReadingProgress)
-class PDFReadingProgressAdmin(admin.ModelAdmin):
+class PDFReadingProgressAdmin(ShardedModelAdmin):
     list_display = ['user', 'course', 'last_page_read', 'updated_at']
     list_filter = ['course', 'updated_at']
     search_fields = ['user__username', 'course__title']
 
 
+@admin.register(CoursePage)
+class CoursePageAdmin(admin.ModelAdmin):
+    list_display = ['course', 'page_number', 'size_bytes', 'created_at']
+    list_filter = ['course']
+    readonly_fields = ['created_at']
+
+
+@admin.register(CourseContent)
+class CourseContentAdmin(admin.ModelAdmin):
+    list_display = ['course', 'page_count', 'source_path', 'ingested_at']
+    search_fields = ['course__title', 'source_path']
+    readonly_fields = ['content_hash', 'ingested_at']
+    exclude = ['page_text']
+
+
 @admin.register(ReadingSession)
-class ReadingSessionAdmin(admin.ModelAdmin):
+class ReadingSessionAdmin(ShardedModelAdmin):
     list_display = ['user', 'course', 'started_at', 'ended_at', 'pages_read', 'duration_minutes']
     list_filter = ['course', 'started_at']
 
 
 @admin.register(ChatMessage)
-class ChatMessageAdmin(admin.ModelAdmin):
+class ChatMessageAdmin(ShardedModelAdmin):
     list_display = ['user', 'course', 'role', 'created_at']
     list_filter = ['role', 'course', 'created_at']
     search_fields = ['user__username', 'content']
@@ -96,4 +183,38 @@ class FeedbackAdmin(admin.ModelAdmin):
     list_display = ['user', 'feedback_type', 'title', 'is_read', 'is_dismissed', 'created_at']
     list_filter = ['feedback_type', 'is_read', 'is_dismissed', 'created_at']
     search_fields = ['user__username', 'title']
-    readonly_fields = ['created_at']
\ No newline at end of file
+    readonly_fields = ['created_at']
+
+
+@admin.register(BackgroundJob)
+class BackgroundJobAdmin(admin.ModelAdmin):
+    list_display = ['id', 'kind', 'user', 'status', 'progress', 'attempts', 'created_at', 'finished_at']
+    list_filter = ['kind', 'status', 'created_at']
+    search_fields = ['user__username', 'dedupe_key']
+    readonly_fields = ['created_at', 'started_at', 'finished_at']
+
+
+@admin.register(SegmentRecommendation)
+class SegmentRecommendationAdmin(admin.ModelAdmin):
+    list_display = ['interest', 'skill_level', 'content_type', 'catalog_version', 'generated_at']
+    list_filter = ['skill_level', 'content_type']
+    readonly_fields = ['generated_at']
+
+
+@admin.register(CourseTrend)
+class CourseTrendAdmin(admin.ModelAdmin):
+    list_display = ['course', 'shard', 'enroll_score', 'read_score', 'completion_score', 'reference']
+    search_fields = ['course__title']
+
+
+@admin.register(CounterShard)
+class CounterShardAdmin(admin.ModelAdmin):
+    list_display = ['course', 'field', 'shard', 'delta']
+    list_filter = ['field']
+
+
+@admin.register(UserNeighbors)
+class UserNeighborsAdmin(admin.ModelAdmin):
+    list_display = ['user', 'built_at']
+    search_fields = ['user__username']
+    readonly_fields = ['built_at']
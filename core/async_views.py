@@ -0,0 +1,149 @@
+"""
+Async views for I/O-bound endpoints.
+
+These use the async ORM and are meant to be served by an ASGI server
+(learnai.asgi:application) so slow requests do not hold a worker thread.
+They still work under WSGI, just without the concurrency benefit.
+"""
+
+import json
+from datetime import timedelta
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth.decorators import login_required
+from django.db.models import Avg, Count, Sum
+from django.http import JsonResponse, StreamingHttpResponse
+from django.urls import reverse
+from django.utils import timezone
+
+from .chatbot import NO_COURSE_ANSWER, answer_question, apersist_exchange
+from .jobs import enqueue
+from .models import Activity, Course, Enrollment, QuizAttempt
+from .services import AIRecommendationEngine
+
+
+def _sse(event, data):
+    """Encode one server-sent event."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+@login_required
+async def api_chat_stream(request):
+    """Chatbot over server-sent events: passages first, then the answer word by word."""
+    if request.method != 'POST':
+        return JsonResponse({'success': False, 'error': 'Method not allowed'})
+    try:
+        data = json.loads(request.body) if request.body else {}
+        course_id = data.get('course_id')
+        message = (data.get('message') or '').strip()
+    except (ValueError, TypeError):
+        return JsonResponse({'success': False, 'error': 'Invalid payload'})
+    if not message:
+        return JsonResponse({'success': False, 'error': 'Message is required'})
+
+    user = await request.auser()
+    course = None
+    if course_id:
+        course = await (
+            Course.objects.filter(id=course_id, enrollments__user=user)
+            .select_related('content').defer('content__page_text')
+            .afirst()
+        )
+    passages = []
+    if course:
+        answer, passages = await sync_to_async(answer_question)(course, message)
+    else:
+        answer = NO_COURSE_ANSWER
+    # Persist before streaming so a client disconnect cannot lose the exchange
+    await apersist_exchange(user, course, message, answer)
+
+    async def events():
+        for passage in passages:
+            yield _sse('passage', {'page': passage['page'], 'text': passage['text']})
+        words = answer.split(' ')
+        for i, word in enumerate(words):
+            yield _sse('token', {'text': word + (' ' if i < len(words) - 1 else '')})
+        yield _sse('done', {'answer': answer})
+
+    response = StreamingHttpResponse(events(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # let nginx pass events through unbuffered
+    return response
+
+
+@login_required
+async def api_stats_async(request):
+    """Async version of api_stats (same JSON)."""
+    user = await request.auser()
+    enrollment_totals = await Enrollment.objects.filter(user=user).aaggregate(
+        count=Count('id'), lessons=Sum('lessons_completed')
+    )
+    quiz_totals = await QuizAttempt.objects.for_user(user).aaggregate(count=Count('id'), average=Avg('score'))
+    learning_time = await Activity.objects.for_user(user).filter(activity_type='learning_time').acount()
+
+    stats = {
+        'courses_enrolled': enrollment_totals['count'],
+        'lessons_completed': enrollment_totals['lessons'] or 0,
+        'quizzes_taken': quiz_totals['count'],
+        'quiz_average': 0,
+        'total_learning_hours': learning_time,
+        'last_updated': timezone.now().isoformat()
+    }
+    if stats['quizzes_taken'] > 0:
+        stats['quiz_average'] = round(quiz_totals['average'] or 0, 1)
+    return JsonResponse(stats)
+
+
+@login_required
+async def api_progress_async(request):
+    """Async version of api_progress (same JSON)."""
+    user = await request.auser()
+    now = timezone.now()
+    daily_progress = {}
+    for i in range(7):
+        daily_progress[(now - timedelta(days=i)).date().strftime('%a')] = 0
+
+    completed = Activity.objects.for_user(user).filter(
+        activity_type='lesson_completed', timestamp__gte=now - timedelta(days=7)
+    ).values_list('timestamp', flat=True)
+    async for timestamp in completed:
+        day = timestamp.strftime('%a')
+        daily_progress[day] = daily_progress.get(day, 0) + 1
+
+    return JsonResponse({
+        'weekly_progress': daily_progress,
+        'last_updated': now.isoformat()
+    })
+
+
+@login_required
+async def search_internet_async(request):
+    """Async version of search_internet: lookups use httpx instead of a blocked thread."""
+    if request.method != 'POST':
+        return JsonResponse({'success': False, 'error': 'Method not allowed'})
+
+    query = request.POST.get('query', '').strip()
+    if not query:
+        return JsonResponse({'success': False, 'error': 'Query is required'})
+
+    try:
+        engine = AIRecommendationEngine()
+        resources = await engine.aget_internet_resources(query, 'general', limit=10)
+        return JsonResponse({'success': True, 'resources': resources})
+    except Exception as e:
+        return JsonResponse({'success': False, 'error': str(e)})
+
+
+@login_required
+async def refresh_recommendations_async(request):
+    """Async version of refresh_recommendations: queues the same deduplicated job."""
+    user = await request.auser()
+    job = await sync_to_async(enqueue)(
+        'refresh_recommendations', user=user, dedupe_key=f'refresh_recommendations:{user.id}',
+    )
+    return JsonResponse({
+        'success': True,
+        'job_id': job.id,
+        'status': job.status,
+        'status_url': reverse('core:job_status', args=[job.id]),
+    })
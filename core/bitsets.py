@@ -0,0 +1,64 @@
+"""
+Course id bitsets.
+
+A set of course ids is stored as one Python int with bit `id` set, so a
+learner's enrolled courses take catalog/8 bytes in the cache and the
+courses they can still be recommended are `catalog & ~enrolled`, a
+word-wise operation on two ints. The per-user enrolled bitset is kept
+current by Enrollment signals (see core.signals).
+"""
+
+from django.core.cache import cache
+
+from .models import Enrollment
+
+ENROLLED_BITSET_TTL = 60 * 60
+
+
+# Set bit positions of every byte value
+_BYTE_BITS = [tuple(bit for bit in range(8) if value >> bit & 1) for value in range(256)]
+
+
+def to_bitset(ids):
+    # Built as bytes: `bits |= 1 << id` would copy the whole int once per id
+    ids = list(ids)
+    if not ids:
+        return 0
+    data = bytearray(max(ids) // 8 + 1)
+    for course_id in ids:
+        data[course_id >> 3] |= 1 << (course_id & 7)
+    return int.from_bytes(data, 'little')
+
+
+def iter_bits(bits):
+    """Set bit positions (course ids) in ascending order."""
+    data = bits.to_bytes((bits.bit_length() + 7) // 8, 'little')
+    for index, value in enumerate(data):
+        if value:
+            base = index << 3
+            for bit in _BYTE_BITS[value]:
+                yield base + bit
+
+
+def _enrolled_key(user_id):
+    return f'enrolled:bits:{user_id}'
+
+
+def refresh_enrolled_bitset(user_id):
+    """Rebuild a user's enrolled-course bitset from the database and cache it."""
+    bits = to_bitset(Enrollment.objects.filter(user_id=user_id).values_list('course_id', flat=True))
+    cache.set(_enrolled_key(user_id), bits, ENROLLED_BITSET_TTL)
+    return bits
+
+
+def enrolled_bitset(user_id):
+    """Bitset of the courses a user is enrolled in (cached)."""
+    bits = cache.get(_enrolled_key(user_id))
+    if bits is None:
+        bits = refresh_enrolled_bitset(user_id)
+    return bits
+
+
+def enrolled_course_ids(user_id):
+    """Sorted ids of the courses a user is enrolled in."""
+    return list(iter_bits(enrolled_bitset(user_id)))
@@ -0,0 +1,174 @@
+"""
+Two-tier cache backend: a per-process LRU in front of a shared cache.
+
+Reads are served from a small in-process LRU when possible and otherwise
+from the shared backend (file-based by default, or Django's database cache
+on SQLite), whose value is then kept locally for a few seconds. Writes and
+deletes go to the shared backend and update the local copy of this
+process. Other processes may keep serving their local copy for up to
+LOCAL_TIMEOUT seconds, so values that must change everywhere at once
+should be stored under versioned keys (see core.catalog.cached_for_version)
+rather than overwritten.
+
+Configure it in CACHES:
+
+    'BACKEND': 'core.cache.TieredCache',
+    'LOCATION': <location of the shared backend>,
+    'OPTIONS': {
+        'SHARED_BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCAL_MAX_ENTRIES': 1024,
+        'LOCAL_TIMEOUT': 5,
+        # remaining options are passed to the shared backend
+    },
+"""
+
+import pickle
+import threading
+import time
+from collections import OrderedDict
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+from django.utils.module_loading import import_string
+
+from . import metrics
+
+_MISSING = object()
+
+
+class LocalLRU:
+    """Bounded LRU of pickled values with per-entry expiry."""
+
+    def __init__(self, max_entries=1024):
+        self.max_entries = max_entries
+        # key -> (expires at, pickled value)
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=_MISSING):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return default
+            if entry[0] <= time.monotonic():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+        # Unpickled per read, like LocMemCache, so callers never share a mutable value
+        return pickle.loads(entry[1])
+
+    def set(self, key, value, timeout):
+        if timeout <= 0:
+            self.delete(key)
+            return
+        pickled = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        with self._lock:
+            self._data[key] = (time.monotonic() + timeout, pickled)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class TieredCache(BaseCache):
+    """Django cache backend reading through a per-process LRU into a shared backend."""
+
+    def __init__(self, location, params):
+        options = dict(params.get('OPTIONS', {}))
+        shared_backend = options.pop('SHARED_BACKEND', 'django.core.cache.backends.filebased.FileBasedCache')
+        self.local_timeout = options.pop('LOCAL_TIMEOUT', 5)
+        local_max_entries = options.pop('LOCAL_MAX_ENTRIES', 1024)
+        params = {**params, 'OPTIONS': options}
+        super().__init__(params)
+        self.shared = import_string(shared_backend)(location, params)
+        self.local = LocalLRU(local_max_entries)
+
+    def _local_timeout(self, timeout):
+        timeout = self.get_backend_timeout(timeout)
+        return self.local_timeout if timeout is None else min(self.local_timeout, timeout - time.time())
+
+    def get(self, key, default=None, version=None):
+        local_key = self.make_and_validate_key(key, version=version)
+        value = self.local.get(local_key)
+        if value is not _MISSING:
+            metrics.cache_requests.inc(cache='local_tier', result='hit')
+            return value
+        metrics.cache_requests.inc(cache='local_tier', result='miss')
+        value = self.shared.get(key, _MISSING, version=version)
+        if value is _MISSING:
+            return default
+        self.local.set(local_key, value, self.local_timeout)
+        return value
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self.shared.set(key, value, timeout, version=version)
+        self.local.set(self.make_and_validate_key(key, version=version), value, self._local_timeout(timeout))
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        added = self.shared.add(key, value, timeout, version=version)
+        if added:
+            self.local.set(self.make_and_validate_key(key, version=version), value, self._local_timeout(timeout))
+        return added
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        return self.shared.touch(key, timeout, version=version)
+
+    def delete(self, key, version=None):
+        self.local.delete(self.make_and_validate_key(key, version=version))
+        return self.shared.delete(key, version=version)
+
+    def has_key(self, key, version=None):
+        if self.local.get(self.make_and_validate_key(key, version=version)) is not _MISSING:
+            return True
+        return self.shared.has_key(key, version=version)
+
+    def incr(self, key, delta=1, version=None):
+        # Counters live in the shared backend only
+        self.local.delete(self.make_and_validate_key(key, version=version))
+        return self.shared.incr(key, delta, version=version)
+
+    def get_many(self, keys, version=None):
+        found, missing = {}, []
+        for key in keys:
+            value = self.local.get(self.make_and_validate_key(key, version=version))
+            if value is _MISSING:
+                missing.append(key)
+            else:
+                found[key] = value
+        metrics.cache_requests.inc(len(found), cache='local_tier', result='hit')
+        metrics.cache_requests.inc(len(missing), cache='local_tier', result='miss')
+        if missing:
+            fetched = self.shared.get_many(missing, version=version)
+            for key, value in fetched.items():
+                self.local.set(self.make_and_validate_key(key, version=version), value, self.local_timeout)
+            found.update(fetched)
+        return found
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        failed = self.shared.set_many(data, timeout, version=version)
+        local_timeout = self._local_timeout(timeout)
+        for key, value in data.items():
+            if key not in failed:
+                self.local.set(self.make_and_validate_key(key, version=version), value, local_timeout)
+        return failed
+
+    def delete_many(self, keys, version=None):
+        for key in keys:
+            self.local.delete(self.make_and_validate_key(key, version=version))
+        self.shared.delete_many(keys, version=version)
+
+    def clear(self):
+        self.local.clear()
+        self.shared.clear()
+
+    def close(self, **kwargs):
+        self.shared.close(**kwargs)
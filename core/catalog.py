@@ -0,0 +1,141 @@
+"""
+Catalog version: a short token that changes whenever a course is added, edited or removed.
+
+Precomputed results derived from the whole catalog (segment recommendation
+lists, memoized score vectors) are stored alongside the version they were
+computed from and are treated as stale once it changes. Page data and
+template fragments put the version into their cache key instead
+(cached_for_version). The version is derived from the course table
+itself, so every process computes the same value; the cache only saves
+the aggregate query.
+
+Course.popularity_score is refolded periodically from trending activity
+and is left out of the catalog version so that catalog pages stay cached.
+Results that depend on popularity (scores, segment lists) use
+scoring_version() instead, which changes with either.
+
+The enrollment, completion and page-view counts are reconciled from
+their counter shards every minute and are left out of both, or every
+run would invalidate the catalog caches. A view that renders the counts
+keys its cache on counter_version().
+"""
+
+import hashlib
+import threading
+
+from django.core.cache import cache
+from django.db.models import Count, Max, Sum
+
+from .bitsets import to_bitset
+from .models import Course
+
+CATALOG_VERSION_KEY = 'catalog:version'
+POPULARITY_VERSION_KEY = 'catalog:popularity-version'
+COUNTER_VERSION_KEY = 'catalog:counter-version'
+# Upper bound on how long another process may keep serving an old version
+CATALOG_VERSION_TTL = 60
+# Lifetime of values cached per catalog version (see cached_for_version)
+CATALOG_CACHE_TIMEOUT = 3600
+
+
+def catalog_version():
+    """Current catalog version (cached)."""
+    version = cache.get(CATALOG_VERSION_KEY)
+    if version is None:
+        totals = Course.objects.aggregate(count=Count('id'), latest=Max('updated_at'), top=Max('id'))
+        raw = f"{totals['count']}:{totals['top']}:{totals['latest'].isoformat() if totals['latest'] else ''}"
+        version = hashlib.sha1(raw.encode('utf-8')).hexdigest()[:12]
+        cache.set(CATALOG_VERSION_KEY, version, CATALOG_VERSION_TTL)
+    return version
+
+
+def bump_catalog_version():
+    """Forget the cached version so the next read recomputes it from the course table."""
+    cache.delete(CATALOG_VERSION_KEY)
+
+
+def popularity_version():
+    """Token of the current folded popularity scores (cached)."""
+    version = cache.get(POPULARITY_VERSION_KEY)
+    if version is None:
+        totals = Course.objects.aggregate(count=Count('popularity_score'), total=Sum('popularity_score'))
+        raw = f"{totals['count']}:{totals['total'] or 0:.6f}"
+        version = hashlib.sha1(raw.encode('utf-8')).hexdigest()[:12]
+        cache.set(POPULARITY_VERSION_KEY, version, CATALOG_VERSION_TTL)
+    return version
+
+
+def bump_popularity_version():
+    """Forget the cached popularity version after popularity scores were refolded."""
+    cache.delete(POPULARITY_VERSION_KEY)
+
+
+def counter_version():
+    """Token of the reconciled Course counter columns (cached)."""
+    version = cache.get(COUNTER_VERSION_KEY)
+    if version is None:
+        totals = Course.objects.aggregate(
+            enrolled=Sum('enrolled_count'), completed=Sum('completion_count'), viewed=Sum('page_view_count'),
+        )
+        raw = f"{totals['enrolled'] or 0}:{totals['completed'] or 0}:{totals['viewed'] or 0}"
+        version = hashlib.sha1(raw.encode('utf-8')).hexdigest()[:12]
+        cache.set(COUNTER_VERSION_KEY, version, CATALOG_VERSION_TTL)
+    return version
+
+
+def bump_counter_version():
+    """Forget the cached counter version after counter deltas were reconciled."""
+    cache.delete(COUNTER_VERSION_KEY)
+
+
+def scoring_version():
+    """Version of everything course scores depend on: the catalog and the popularity scores."""
+    return f'{catalog_version()}-{popularity_version()}'
+
+
+def cached_for_version(name, build, timeout=CATALOG_CACHE_TIMEOUT):
+    """
+    Value derived from the catalog, built once per catalog version
+
+    The key contains the version, so a course write switches every process
+    to a fresh key instead of having to invalidate old entries.
+
+    Args:
+        name: Cache key suffix unique to the derived value
+        build: Function returning the value; None results are not cached
+        timeout: Seconds an entry outlives its version at most
+
+    Returns:
+        The cached or newly built value
+    """
+    key = f'catalog:{catalog_version()}:{name}'
+    value = cache.get(key)
+    if value is None:
+        value = build()
+        if value is not None:
+            cache.set(key, value, timeout)
+    return value
+
+
+# Per-process (version, course id bitset, courses by id), replaced when the scoring version changes
+_snapshot = (None, 0, {})
+_snapshot_lock = threading.Lock()
+
+
+def catalog_snapshot():
+    """
+    All courses of the current catalog and popularity version, loaded once per process
+
+    Returns:
+        Tuple of (bitset of course ids, dictionary of course id -> Course)
+    """
+    global _snapshot
+    version = scoring_version()
+    snapshot = _snapshot
+    if snapshot[0] != version:
+        with _snapshot_lock:
+            if _snapshot[0] != version:
+                courses = {course.id: course for course in Course.objects.all()}
+                _snapshot = (version, to_bitset(courses), courses)
+            snapshot = _snapshot
+    return snapshot[1], snapshot[2]
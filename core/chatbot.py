@@ -0,0 +1,407 @@
+"""
+Course chatbot: page-level retrieval index, answer cache and chat history writes.
+
+Each course gets a BM25 index over page-sized text chunks (from the ingested
+PDF text, or the chat summary when no PDF text exists). The index is built
+once per course content version, persisted under CHAT_INDEX_DIR and kept in
+memory per process, so answering a message is a few dictionary lookups.
+Answers to repeated questions come from an LRU/TTL cache, and each exchange
+is stored with one bulk insert (optionally from a background writer).
+"""
+
+import atexit
+import gzip
+import hashlib
+import json
+import logging
+import math
+import os
+import re
+import threading
+import time
+from collections import Counter, OrderedDict
+from pathlib import Path
+
+from django.conf import settings
+from django.db import close_old_connections
+
+from . import metrics
+from .models import ChatMessage, CourseContent
+
+logger = logging.getLogger(__name__)
+
+
+NO_COURSE_ANSWER = (
+    "I can only answer questions about a course you're currently learning. Open a course and ask again, "
+    "or ask about one of your enrolled courses."
+)
+
+CHUNK_WORDS = 80
+TOP_PASSAGES = 3
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+TOKEN_RE = re.compile(r'[a-z0-9]+')
+SENTENCE_RE = re.compile(r'(?<=[.!?])\s+')
+STOPWORDS = {
+    'a', 'an', 'and', 'are', 'as', 'at', 'be', 'by', 'can', 'do', 'does', 'for', 'from', 'how', 'i',
+    'in', 'is', 'it', 'me', 'of', 'on', 'or', 'that', 'the', 'this', 'to', 'what', 'when', 'where',
+    'which', 'who', 'why', 'with', 'you', 'your', 'explain', 'define', 'tell', 'about',
+}
+
+
+def tokenize(text):
+    """Lowercase word tokens without stopwords, with a light plural strip."""
+    tokens = []
+    for token in TOKEN_RE.findall(text.lower()):
+        if token in STOPWORDS or len(token) < 2:
+            continue
+        if len(token) > 3 and token.endswith('s') and not token.endswith('ss'):
+            token = token[:-1]
+        tokens.append(token)
+    return tokens
+
+
+def _get_content(course):
+    try:
+        return course.content
+    except CourseContent.DoesNotExist:
+        return None
+
+
+def course_content_version(course):
+    """Short hash identifying the text the chatbot answers from."""
+    content = _get_content(course)
+    digest = hashlib.sha1()
+    digest.update((content.content_hash if content else '').encode('utf-8'))
+    digest.update(course.summary_for_chat.encode('utf-8'))
+    digest.update((course.description or '').encode('utf-8'))
+    return digest.hexdigest()[:16]
+
+
+def course_chunks(course):
+    """
+    Split course text into retrievable chunks
+
+    Returns:
+        List of (page_number or None, text) tuples
+    """
+    chunks = []
+    content = _get_content(course)
+    if content:
+        for page_number, text in enumerate(content.get_pages(), start=1):
+            words = text.split()
+            for start in range(0, len(words), CHUNK_WORDS):
+                chunks.append((page_number, ' '.join(words[start:start + CHUNK_WORDS])))
+    if not chunks:
+        context = course.summary_for_chat + '\n' + (course.description or '')
+        for sentence in SENTENCE_RE.split(context):
+            sentence = sentence.strip()
+            if sentence:
+                chunks.append((None, sentence))
+    return chunks
+
+
+class CourseIndex:
+    """BM25 index over the text chunks of one course."""
+
+    def __init__(self, version, chunks, postings, idf, doc_lengths):
+        self.version = version
+        self.chunks = chunks
+        self.postings = postings
+        self.idf = idf
+        self.doc_lengths = doc_lengths
+        self.avg_length = (sum(doc_lengths) / len(doc_lengths)) if doc_lengths else 0.0
+
+    @classmethod
+    def build(cls, version, chunks):
+        postings = {}
+        doc_lengths = []
+        for doc_id, (_, text) in enumerate(chunks):
+            tokens = tokenize(text)
+            doc_lengths.append(len(tokens))
+            for term, tf in Counter(tokens).items():
+                postings.setdefault(term, []).append((doc_id, tf))
+        n = len(chunks)
+        idf = {
+            term: math.log(1 + (n - len(docs) + 0.5) / (len(docs) + 0.5))
+            for term, docs in postings.items()
+        }
+        return cls(version, chunks, postings, idf, doc_lengths)
+
+    def search(self, query, k=TOP_PASSAGES):
+        """
+        Top-k chunks for a query
+
+        Returns:
+            List of dictionaries with 'page', 'text' and 'score'
+        """
+        scores = {}
+        avg_length = self.avg_length or 1.0
+        for term in set(tokenize(query)):
+            idf = self.idf.get(term)
+            if idf is None:
+                continue
+            for doc_id, tf in self.postings[term]:
+                norm = BM25_K1 * (1 - BM25_B + BM25_B * self.doc_lengths[doc_id] / avg_length)
+                scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (BM25_K1 + 1) / (tf + norm)
+        best = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+        return [
+            {'page': self.chunks[doc_id][0], 'text': self.chunks[doc_id][1], 'score': round(score, 3)}
+            for doc_id, score in best
+        ]
+
+    def to_dict(self):
+        return {
+            'version': self.version,
+            'chunks': self.chunks,
+            'postings': self.postings,
+            'idf': self.idf,
+            'doc_lengths': self.doc_lengths,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        chunks = [tuple(chunk) for chunk in data['chunks']]
+        postings = {term: [tuple(p) for p in docs] for term, docs in data['postings'].items()}
+        return cls(data['version'], chunks, postings, data['idf'], data['doc_lengths'])
+
+
+# course_id -> CourseIndex; one entry per course, replaced when its version changes
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def _index_path(course_id, version):
+    return Path(settings.CHAT_INDEX_DIR) / f'course-{course_id}-{version}.json.gz'
+
+
+def _write_index(path, index):
+    """Write atomically and drop older versions for the same course."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(f'.tmp{os.getpid()}')
+    with gzip.open(tmp, 'wt', encoding='utf-8') as fh:
+        json.dump(index.to_dict(), fh)
+    os.replace(tmp, path)
+    prefix = path.name.rsplit('-', 1)[0] + '-'
+    for old in path.parent.glob(prefix + '*.json.gz'):
+        if old != path:
+            old.unlink(missing_ok=True)
+
+
+def build_course_index(course, force=False):
+    """Build (or load) the course index for its current content version and persist it."""
+    version = course_content_version(course)
+    path = _index_path(course.id, version)
+    index = None
+    if not force and path.exists():
+        try:
+            with gzip.open(path, 'rt', encoding='utf-8') as fh:
+                index = CourseIndex.from_dict(json.load(fh))
+        except (OSError, ValueError, KeyError):
+            index = None
+    if index is None:
+        index = CourseIndex.build(version, course_chunks(course))
+        _write_index(path, index)
+    with _indexes_lock:
+        _indexes[course.id] = index
+    return index
+
+
+def get_course_index(course):
+    """In-memory index for the course, (re)loaded only when the content version changes."""
+    index = _indexes.get(course.id)
+    if index is not None and index.version == course_content_version(course):
+        return index
+    return build_course_index(course)
+
+
+def _cite(passage):
+    return f" (page {passage['page']})" if passage['page'] else ''
+
+
+def compose_answer(question, passages, course_title):
+    """Short answer built from retrieved passages, citing their pages."""
+    if not passages:
+        return (f"I couldn't find that in {course_title}. Try rephrasing your question "
+                f"with terms used in the course.")
+    q = question.lower()
+    best = passages[0]
+    if 'how' in q.split():
+        lead = f"The course '{course_title}' covers this step by step: "
+    else:
+        lead = f"According to {course_title}: "
+    answer = lead + best['text'].rstrip('.') + '.' + _cite(best)
+    related = [p for p in passages[1:] if p['page'] != best['page'] or not p['page']]
+    if related:
+        pages = sorted({p['page'] for p in related if p['page']})
+        if pages:
+            answer += ' See also page' + ('s ' if len(pages) > 1 else ' ') + ', '.join(map(str, pages)) + '.'
+    return answer
+
+
+class AnswerCache:
+    """Thread-safe LRU cache whose entries also expire after a TTL."""
+
+    def __init__(self, max_entries=1024, ttl=3600):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self._data[key]
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+_cache_settings = getattr(settings, 'CHAT_ANSWER_CACHE', {})
+answer_cache = AnswerCache(
+    max_entries=_cache_settings.get('MAX_ENTRIES', 1024),
+    ttl=_cache_settings.get('TTL', 3600),
+)
+
+
+def normalize_question(question):
+    """Cache key form of a question: lowercase words, punctuation and spacing ignored."""
+    return ' '.join(TOKEN_RE.findall(question.lower()))
+
+
+def answer_question(course, question):
+    """
+    Answer a learner question from the course index
+
+    Returns:
+        Tuple of (answer text, list of passage dictionaries)
+    """
+    index = get_course_index(course)
+    key = (course.id, index.version, normalize_question(question))
+    cached = answer_cache.get(key)
+    metrics.cache_requests.inc(cache='chat_answers', result='miss' if cached is None else 'hit')
+    if cached is not None:
+        return cached
+    passages = index.search(question)
+    result = (compose_answer(question, passages, course.title), passages)
+    answer_cache.set(key, result)
+    return result
+
+
+class ChatHistoryWriter:
+    """
+    Buffers chat messages and writes them with bulk_create from a daemon thread
+
+    Used when CHAT_ASYNC_HISTORY is on so chat latency does not include the
+    database write. Messages still buffered at interpreter exit are flushed.
+    A failed write (e.g. the database is locked) is retried on the next
+    flushes; after max_attempts failures in a row the batch is dropped and
+    counted in metrics.chat_history_dropped.
+    """
+
+    def __init__(self, max_batch=200, flush_interval=1.0, max_attempts=5):
+        self.max_batch = max_batch
+        self.flush_interval = flush_interval
+        self.max_attempts = max_attempts
+        self._failures = 0
+        self._buffer = []
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+
+    def add(self, messages):
+        with self._lock:
+            self._buffer.extend(messages)
+            pending = len(self._buffer)
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='chat-history-writer', daemon=True)
+                self._thread.start()
+        metrics.chat_history_buffer_depth.set(pending)
+        if pending >= self.max_batch:
+            self._wakeup.set()
+
+    def depth(self):
+        return len(self._buffer)
+
+    def flush(self):
+        with self._lock:
+            batch, self._buffer = self._buffer, []
+        if not batch:
+            return 0
+        metrics.chat_history_buffer_depth.set(self.depth())
+        try:
+            with metrics.chat_history_flush_seconds.time():
+                ChatMessage.objects.bulk_create(batch, batch_size=self.max_batch)
+        except Exception:
+            # Messages that got a primary key were written (e.g. to another user shard)
+            unsaved = [message for message in batch if message.pk is None]
+            self._failures += 1
+            if self._failures >= self.max_attempts:
+                logger.exception('Dropping %d chat messages after %d failed writes', len(unsaved), self._failures)
+                metrics.chat_history_dropped.inc(len(unsaved))
+                self._failures = 0
+            else:
+                logger.warning('Failed to write %d chat messages, will retry', len(unsaved), exc_info=True)
+                with self._lock:
+                    self._buffer[:0] = unsaved
+                metrics.chat_history_buffer_depth.set(self.depth())
+            return 0
+        self._failures = 0
+        return len(batch)
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            self.flush()
+            close_old_connections()
+
+
+history_writer = ChatHistoryWriter()
+atexit.register(history_writer.flush)
+
+
+def _exchange_messages(user, course, question, answer):
+    return [
+        ChatMessage(user=user, course=course, role='user', content=question),
+        ChatMessage(user=user, course=course, role='assistant', content=answer),
+    ]
+
+
+def persist_exchange(user, course, question, answer):
+    """Store the user message and the assistant answer together."""
+    messages = _exchange_messages(user, course, question, answer)
+    if getattr(settings, 'CHAT_ASYNC_HISTORY', False):
+        history_writer.add(messages)
+    else:
+        ChatMessage.objects.bulk_create(messages)
+
+
+async def apersist_exchange(user, course, question, answer):
+    """Async version of persist_exchange for ASGI views."""
+    messages = _exchange_messages(user, course, question, answer)
+    if getattr(settings, 'CHAT_ASYNC_HISTORY', False):
+        history_writer.add(messages)
+    else:
+        await ChatMessage.objects.abulk_create(messages)
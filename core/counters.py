@@ -0,0 +1,66 @@
+"""
+Sharded counters for hot Course aggregate fields.
+
+Writers never touch the Course row: each increment adds to one of
+COUNTER_SHARDS delta rows for the (course, field) pair, picked at random,
+so concurrent enrollments on a popular course rarely hit the same row.
+`reconcile()` (run periodically through `manage.py reconcile_counters`)
+moves the accumulated deltas into the Course columns.
+"""
+
+import random
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F
+
+from .catalog import bump_counter_version
+from .models import Course, CounterShard
+
+SHARD_COUNT = getattr(settings, 'COUNTER_SHARDS', 8)
+COUNTER_FIELDS = [field for field, _ in CounterShard.FIELDS]
+
+
+def increment(course_id, field, amount=1):
+    """Add `amount` to a Course counter field through a random shard."""
+    if field not in COUNTER_FIELDS:
+        raise ValueError(f'Not a sharded counter: {field}')
+    shard = random.randrange(SHARD_COUNT)
+    rows = CounterShard.objects.filter(course_id=course_id, field=field, shard=shard)
+    if rows.update(delta=F('delta') + amount):
+        return
+    try:
+        with transaction.atomic():
+            CounterShard.objects.create(course_id=course_id, field=field, shard=shard, delta=amount)
+    except IntegrityError:
+        # Another writer created the shard first
+        rows.update(delta=F('delta') + amount)
+
+
+def reconcile():
+    """
+    Write accumulated shard deltas back to the Course columns
+
+    Each shard is decremented by the amount read rather than reset, so
+    increments that land while reconciling are kept for the next run.
+
+    Returns:
+        Number of (course, field) totals applied
+    """
+    applied = 0
+    with transaction.atomic():
+        shards = list(CounterShard.objects.exclude(delta=0).values_list('id', 'course_id', 'field', 'delta'))
+        totals = {}
+        for shard_id, course_id, field, delta in shards:
+            CounterShard.objects.filter(id=shard_id).update(delta=F('delta') - delta)
+            totals.setdefault(course_id, {}).setdefault(field, 0)
+            totals[course_id][field] += delta
+        for course_id, fields in totals.items():
+            # updated_at stays: counts are not part of the catalog version (see core.catalog)
+            Course.objects.filter(id=course_id).update(
+                **{field: F(field) + delta for field, delta in fields.items()}
+            )
+            applied += len(fields)
+    if applied:
+        bump_counter_version()
+    return applied
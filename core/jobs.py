@@ -0,0 +1,158 @@
+"""
+Lightweight background job queue backed by the BackgroundJob table.
+
+Views enqueue work and return a job id immediately; worker processes
+started with `manage.py run_job_workers` claim queued jobs, report
+progress and store the result. Jobs with the same dedupe key are
+coalesced while one of them is still queued or running.
+"""
+
+import logging
+import os
+import socket
+import time
+import traceback
+from datetime import timedelta
+
+from django.db import IntegrityError, close_old_connections, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import BackgroundJob, Recommendation
+from .services import AIRecommendationEngine, ColdStartRecommender
+
+logger = logging.getLogger(__name__)
+
+# Minimum change (percentage points) before progress is written back
+PROGRESS_STEP = 5.0
+
+_handlers = {}
+
+
+def job_handler(kind):
+    """Register a function(job, report_progress) -> result dict for a job kind."""
+    def decorator(func):
+        _handlers[kind] = func
+        return func
+    return decorator
+
+
+def enqueue(kind, user=None, payload=None, dedupe_key=''):
+    """
+    Queue a job, or return the active job with the same dedupe key
+
+    Returns:
+        BackgroundJob (new or coalesced)
+    """
+    if kind not in _handlers:
+        raise ValueError(f'Unknown job kind: {kind}')
+    for _ in range(2):
+        if dedupe_key:
+            existing = BackgroundJob.objects.filter(
+                dedupe_key=dedupe_key, status__in=BackgroundJob.ACTIVE_STATUSES
+            ).first()
+            if existing:
+                return existing
+        try:
+            with transaction.atomic():
+                return BackgroundJob.objects.create(kind=kind, user=user, payload=payload or {}, dedupe_key=dedupe_key)
+        except IntegrityError:
+            # Lost the race against a concurrent enqueue of the same key; that job may
+            # already have finished by now, in which case the insert is tried again
+            continue
+    return BackgroundJob.objects.filter(dedupe_key=dedupe_key).order_by('-created_at', '-id').first()
+
+
+def claim_next(worker_id):
+    """Atomically move the oldest queued job to running. Returns it, or None."""
+    while True:
+        job_id = (
+            BackgroundJob.objects.filter(status='queued')
+            .order_by('created_at', 'id')
+            .values_list('id', flat=True)
+            .first()
+        )
+        if job_id is None:
+            return None
+        claimed = BackgroundJob.objects.filter(id=job_id, status='queued').update(
+            status='running', worker=worker_id, started_at=timezone.now(), attempts=F('attempts') + 1,
+        )
+        if claimed:
+            return BackgroundJob.objects.select_related('user').get(id=job_id)
+        # Another worker got it first; try the next one
+
+
+def _progress_reporter(job):
+    last = {'value': job.progress}
+
+    def report(percent):
+        percent = max(0.0, min(100.0, float(percent)))
+        if percent - last['value'] >= PROGRESS_STEP or percent >= 100.0:
+            BackgroundJob.objects.filter(id=job.id).update(progress=round(percent, 1))
+            last['value'] = percent
+    return report
+
+
+def run_job(job):
+    """Execute a claimed job and record its outcome."""
+    handler = _handlers.get(job.kind)
+    try:
+        if handler is None:
+            raise ValueError(f'No handler for job kind {job.kind!r}')
+        result = handler(job, _progress_reporter(job)) or {}
+    except Exception:
+        logger.exception('Job %s failed', job.id)
+        BackgroundJob.objects.filter(id=job.id).update(
+            status='failed', error=traceback.format_exc(limit=20), finished_at=timezone.now(),
+        )
+        return False
+    BackgroundJob.objects.filter(id=job.id).update(
+        status='done', progress=100.0, result=result, finished_at=timezone.now(),
+    )
+    return True
+
+
+def requeue_stale(older_than=timedelta(minutes=30)):
+    """Put jobs left running by a dead worker back in the queue. Returns how many."""
+    return BackgroundJob.objects.filter(
+        status='running', started_at__lt=timezone.now() - older_than
+    ).update(status='queued', worker='')
+
+
+def work(poll_interval=1.0, stop=None, burst=False):
+    """
+    Worker loop: claim and run jobs until stopped
+
+    Args:
+        poll_interval: Seconds to sleep when the queue is empty
+        stop: Optional object with is_set() (e.g. multiprocessing.Event)
+        burst: Exit once the queue is empty
+    """
+    worker_id = f'{socket.gethostname()}:{os.getpid()}'
+    while stop is None or not stop.is_set():
+        close_old_connections()
+        job = claim_next(worker_id)
+        if job is None:
+            if burst:
+                return
+            time.sleep(poll_interval)
+            continue
+        run_job(job)
+
+
+# ==================== Job handlers ====================
+
+@job_handler('refresh_recommendations')
+def refresh_recommendations_job(job, report_progress):
+    """Regenerate all recommendations for the job's user."""
+    Recommendation.objects.filter(user=job.user).delete()
+    recommendations = AIRecommendationEngine().generate_recommendations(
+        job.user, progress_callback=report_progress
+    )
+    return {'count': len(recommendations)}
+
+
+@job_handler('build_segment_recommendations')
+def build_segment_recommendations_job(job, report_progress):
+    """Rebuild the cold-start segment lists for the current catalog."""
+    return {'segments': ColdStartRecommender().build_all(progress_callback=report_progress)}
@@ -0,0 +1,176 @@
+"""Benchmark the recommendation engine, behavior analyzer and feedback generator on synthetic data."""
+import json
+import random
+import statistics
+import tempfile
+import time
+from contextlib import ExitStack
+from itertools import product
+from pathlib import Path
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.test.utils import CaptureQueriesContext, override_settings
+
+from core import synthetic
+from core.sharding import shard_aliases
+from core.services import AIRecommendationEngine, BehaviorAnalyzer, FeedbackGenerator, profile_score_cache
+
+OPERATIONS = {
+    'generate_recommendations': lambda user: AIRecommendationEngine(internet_lookups=False).generate_recommendations(user),
+    'analyze_user_behavior': lambda user: BehaviorAnalyzer().analyze_user_behavior(user),
+    'generate_feedback': lambda user: FeedbackGenerator().generate_feedback(user),
+}
+# Timing differences below this are noise, whatever the relative change
+MIN_REGRESSION_MS = 2.0
+
+
+def _databases():
+    """The default database and the user shards, if any."""
+    return [DEFAULT_DB_ALIAS, *shard_aliases()]
+
+
+def _reset_caches():
+    cache.clear()
+    profile_score_cache.clear()
+
+
+def _measure(operation, users):
+    """Time one operation over the sample users; the first call runs with empty caches."""
+    _reset_caches()
+    timings, queries = [], []
+    for user in users:
+        with ExitStack() as stack:
+            captured = [stack.enter_context(CaptureQueriesContext(connections[alias])) for alias in _databases()]
+            start = time.perf_counter()
+            operation(user)
+            timings.append((time.perf_counter() - start) * 1000)
+        queries.append(sum(len(context.captured_queries) for context in captured))
+    warm = timings[1:] or timings
+    return {
+        'cold_ms': round(timings[0], 2),
+        'median_ms': round(statistics.median(warm), 2),
+        'min_ms': round(min(warm), 2),
+        'max_ms': round(max(warm), 2),
+        'queries': max(queries),
+    }
+
+
+def compare(results, baseline, tolerance):
+    """
+    Regressions of results against a baseline report
+
+    Returns:
+        List of human-readable regression descriptions
+    """
+    previous = {scenario['name']: scenario['operations'] for scenario in baseline.get('scenarios', [])}
+    regressions = []
+    for scenario in results['scenarios']:
+        for name, current in scenario['operations'].items():
+            before = previous.get(scenario['name'], {}).get(name)
+            if before is None:
+                continue
+            limit = before['median_ms'] * (1 + tolerance)
+            if current['median_ms'] > limit and current['median_ms'] - before['median_ms'] > MIN_REGRESSION_MS:
+                regressions.append(
+                    f"{scenario['name']} {name}: {current['median_ms']}ms vs baseline {before['median_ms']}ms"
+                )
+            if current['queries'] > before['queries']:
+                regressions.append(
+                    f"{scenario['name']} {name}: {current['queries']} queries vs baseline {before['queries']}"
+                )
+    return regressions
+
+
+class Command(BaseCommand):
+    help = 'Time recommendation, behavior analysis and feedback generation on reproducible synthetic data'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--courses', type=int, nargs='+', default=[100, 1000],
+                            help='Catalog sizes to benchmark (e.g. 100 1000 10000 100000)')
+        parser.add_argument('--activities', type=int, nargs='+', default=[1000, 10000],
+                            help='History sizes to benchmark (e.g. 1000 100000 1000000)')
+        parser.add_argument('--users', type=int, default=None,
+                            help='Learners per scenario (default: activities / 50, at least 20)')
+        parser.add_argument('--samples', type=int, default=5, help='Learners timed per operation')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output', help='Write the JSON report to this file instead of stdout')
+        parser.add_argument('--baseline', help='Fail if results regress against this JSON report')
+        parser.add_argument('--tolerance', type=float, default=0.25,
+                            help='Allowed relative slowdown against the baseline (0.25 = 25%%)')
+
+    def handle(self, *args, **options):
+        baseline = None
+        if options['baseline']:
+            try:
+                baseline = json.loads(Path(options['baseline']).read_text())
+            except (OSError, ValueError) as e:
+                raise CommandError(f"Cannot read baseline {options['baseline']}: {e}")
+
+        # Never touch real data, the real offline models or the running site's cache
+        old_names = {
+            alias: connections[alias].creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+            for alias in _databases()
+        }
+        try:
+            with tempfile.TemporaryDirectory() as scratch, override_settings(
+                COURSE_TRANSITIONS_PATH=Path(scratch) / 'course_transitions.json.gz',
+                # Same backends as configured, so timings include the real cache tiers
+                CACHES={
+                    alias: {**config, 'LOCATION': str(Path(scratch) / f'cache-{alias}')}
+                    for alias, config in settings.CACHES.items()
+                },
+            ):
+                results = {'seed': options['seed'], 'samples': options['samples'], 'scenarios': []}
+                for n_courses, n_activities in product(options['courses'], options['activities']):
+                    results['scenarios'].append(self._run_scenario(n_courses, n_activities, options))
+                _reset_caches()
+        finally:
+            for alias, old_name in old_names.items():
+                connections[alias].creation.destroy_test_db(old_name, verbosity=0)
+
+        report = json.dumps(results, indent=2)
+        if options['output']:
+            Path(options['output']).write_text(report + '\n')
+            self.stderr.write(f"Wrote {options['output']}")
+        else:
+            self.stdout.write(report)
+
+        if baseline is not None:
+            regressions = compare(results, baseline, options['tolerance'])
+            if regressions:
+                raise CommandError('Performance regressions:\n  ' + '\n  '.join(regressions))
+            self.stderr.write(self.style.SUCCESS('No regressions against baseline.'))
+
+    def _run_scenario(self, n_courses, n_activities, options):
+        name = f'courses={n_courses},activities={n_activities}'
+        self.stderr.write(f'Scenario {name}')
+        for alias in _databases():
+            call_command('flush', database=alias, interactive=False, verbosity=0)
+        _reset_caches()
+
+        seed = options['seed']
+        n_users = options['users'] or max(20, n_activities // 50)
+        start = time.perf_counter()
+        courses, quizzes = synthetic.generate_catalog(n_courses, seed=seed)
+        users = synthetic.generate_users(n_users, seed=seed)
+        rows = synthetic.generate_history(users, courses, quizzes, n_activities, seed=seed)
+        setup_seconds = time.perf_counter() - start
+
+        sample = random.Random(seed).sample(users, min(options['samples'], len(users)))
+        operations = {}
+        for operation_name, operation in OPERATIONS.items():
+            operations[operation_name] = _measure(operation, sample)
+            self.stderr.write(f"  {operation_name}: {operations[operation_name]['median_ms']}ms median")
+        return {
+            'name': name,
+            'courses': n_courses,
+            'users': n_users,
+            'activities': n_activities,
+            'rows': rows,
+            'setup_seconds': round(setup_seconds, 2),
+            'operations': operations,
+        }
@@ -0,0 +1,191 @@
+"""Compare throughput of the development and production SQLite profiles under concurrent reads and writes."""
+import json
+import multiprocessing
+import random
+import shutil
+import statistics
+import tempfile
+import time
+from datetime import timedelta
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS, OperationalError, connections, transaction
+from django.utils import timezone
+
+from core.models import Activity, Course, Enrollment, PDFReadingProgress, ReadingSession, User
+
+# Profile -> (writer OPTIONS, reader OPTIONS or None to read through the writer alias)
+PROFILES = {
+    'development': ({}, None),
+    'production': (
+        {'init_command': settings.SQLITE_INIT_COMMAND, 'transaction_mode': 'IMMEDIATE'},
+        {'init_command': settings.SQLITE_INIT_COMMAND + ';PRAGMA query_only=ON'},
+    ),
+}
+
+
+def _register(alias, path, options):
+    """Add a database alias for a benchmark file at runtime."""
+    configured = connections.configure_settings({
+        DEFAULT_DB_ALIAS: connections.settings[DEFAULT_DB_ALIAS],
+        alias: {'ENGINE': 'django.db.backends.sqlite3', 'NAME': str(path), 'OPTIONS': options},
+    })
+    connections.settings[alias] = configured[alias]
+
+
+def _unregister(alias):
+    connections[alias].close()
+    del connections[alias]
+    del connections.settings[alias]
+
+
+def _seed(alias, n_users, n_courses, seed):
+    """Learners, each enrolled in a few courses with PDF progress."""
+    rng = random.Random(seed)
+    courses = Course.objects.using(alias).bulk_create([
+        Course(title=f'Course {i}', description='Benchmark course', category='programming', level='beginner',
+               duration_hours=5, total_pages=300)
+        for i in range(n_courses)
+    ])
+    users = User.objects.using(alias).bulk_create([
+        User(username=f'bench{i}', password='!') for i in range(n_users)
+    ])
+    pairs = [(user, course) for user in users for course in rng.sample(courses, min(5, len(courses)))]
+    Enrollment.objects.using(alias).bulk_create([Enrollment(user=u, course=c) for u, c in pairs])
+    PDFReadingProgress.objects.using(alias).bulk_create([PDFReadingProgress(user=u, course=c) for u, c in pairs])
+    return [(u.id, c.id) for u, c in pairs]
+
+
+def _save_progress(alias, user_id, course_id, page):
+    """What a progress save does: read the progress row, then write it, a reading session and an activity."""
+    with transaction.atomic(using=alias):
+        progress = PDFReadingProgress.objects.using(alias).get(user_id=user_id, course_id=course_id)
+        progress.last_page_read = page
+        progress.save(using=alias)
+        ReadingSession.objects.using(alias).create(
+            user_id=user_id, course_id=course_id, pages_read=1, duration_minutes=1.0,
+        )
+        Activity.objects.using(alias).create(
+            user_id=user_id, activity_type='content_viewed', details={'course_id': course_id, 'content_type': 'pdf'},
+        )
+
+
+def _read_dashboard(alias, user_id):
+    """What a dashboard view reads."""
+    list(Enrollment.objects.using(alias).filter(user_id=user_id).select_related('course'))
+    dict(PDFReadingProgress.objects.using(alias).filter(user_id=user_id).order_by()
+         .values_list('course_id', 'last_page_read'))
+    Activity.objects.using(alias).filter(user_id=user_id, timestamp__gte=timezone.now() - timedelta(days=30)).count()
+
+
+def _worker(writer, reader, pairs, write_ratio, deadline, seed, results):
+    """One worker process (like one gunicorn worker) with its own connections."""
+    rng = random.Random(seed)
+    latencies = {'read': [], 'write': []}
+    errors = 0
+    try:
+        while time.perf_counter() < deadline:
+            user_id, course_id = rng.choice(pairs)
+            kind = 'write' if rng.random() < write_ratio else 'read'
+            start = time.perf_counter()
+            try:
+                if kind == 'write':
+                    _save_progress(writer, user_id, course_id, rng.randint(1, 300))
+                else:
+                    _read_dashboard(reader, user_id)
+            except OperationalError:
+                # "database is locked" after the busy timeout ran out
+                errors += 1
+                continue
+            latencies[kind].append((time.perf_counter() - start) * 1000)
+    finally:
+        connections[writer].close()
+        connections[reader].close()
+    results.put((latencies, errors))
+
+
+def _p95(values):
+    return round(statistics.quantiles(values, n=20)[-1], 2) if len(values) >= 2 else round(sum(values), 2)
+
+
+def _run(writer, reader, pairs, n_workers, seconds, write_ratio, seed):
+    # Forked workers inherit the registered aliases; connections are opened after the fork
+    context = multiprocessing.get_context('fork')
+    queue = context.Queue()
+    deadline = time.perf_counter() + seconds
+    workers = [
+        context.Process(target=_worker, args=(writer, reader, pairs, write_ratio, deadline, seed + i, queue))
+        for i in range(n_workers)
+    ]
+    for worker in workers:
+        worker.start()
+    results = [queue.get() for _ in workers]
+    for worker in workers:
+        worker.join()
+    reads = [ms for latencies, _ in results for ms in latencies['read']]
+    writes = [ms for latencies, _ in results for ms in latencies['write']]
+    return {
+        'workers': n_workers,
+        'ops_per_second': round((len(reads) + len(writes)) / seconds, 1),
+        'writes_per_second': round(len(writes) / seconds, 1),
+        'read_p95_ms': _p95(reads),
+        'write_p95_ms': _p95(writes),
+        'locked_errors': sum(errors for _, errors in results),
+    }
+
+
+class Command(BaseCommand):
+    help = 'Run concurrent progress saves and dashboard reads against the development and production SQLite profiles'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, nargs='+', default=[1, 4, 16],
+                            help='Concurrent worker processes, each with its own connections')
+        parser.add_argument('--seconds', type=float, default=5.0, help='Duration of each run')
+        parser.add_argument('--write-ratio', type=float, default=0.3, help='Share of operations that are writes')
+        parser.add_argument('--users', type=int, default=200)
+        parser.add_argument('--courses', type=int, default=50)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output', help='Write the JSON report to this file instead of stdout')
+
+    def handle(self, *args, **options):
+        workdir = Path(tempfile.mkdtemp(prefix='sqlite-bench-'))
+        template = workdir / 'template.sqlite3'
+        try:
+            # One seeded file, copied per run so every run starts from the same data and journal mode
+            _register('bench_template', template, {})
+            call_command('migrate', database='bench_template', verbosity=0)
+            pairs = _seed('bench_template', options['users'], options['courses'], options['seed'])
+            _unregister('bench_template')
+
+            results = {'write_ratio': options['write_ratio'], 'seconds': options['seconds'], 'profiles': {}}
+            for profile, (writer_options, reader_options) in PROFILES.items():
+                runs = []
+                for n_workers in options['workers']:
+                    path = workdir / f'{profile}-{n_workers}.sqlite3'
+                    shutil.copyfile(template, path)
+                    _register('bench_writer', path, writer_options)
+                    _register('bench_reader', path, reader_options if reader_options is not None else writer_options)
+                    try:
+                        run = _run('bench_writer', 'bench_reader', pairs, n_workers, options['seconds'],
+                                   options['write_ratio'], options['seed'])
+                    finally:
+                        _unregister('bench_writer')
+                        _unregister('bench_reader')
+                    self.stderr.write(
+                        f"{profile} workers={n_workers}: {run['ops_per_second']} ops/s, "
+                        f"write p95 {run['write_p95_ms']}ms, {run['locked_errors']} locked"
+                    )
+                    runs.append(run)
+                results['profiles'][profile] = runs
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+        report = json.dumps(results, indent=2)
+        if options['output']:
+            Path(options['output']).write_text(report + '\n')
+            self.stderr.write(f"Wrote {options['output']}")
+        else:
+            self.stdout.write(report)
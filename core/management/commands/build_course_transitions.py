@@ -0,0 +1,14 @@
+"""Update the next-course transition model from enrollments made since the last build."""
+from django.core.management.base import BaseCommand
+from core.transitions import build_transitions, model_path
+
+
+class Command(BaseCommand):
+    help = 'Count course-to-next-course transitions in enrollment order (incremental from a high-water mark)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true', help='Rebuild from all enrollments')
+
+    def handle(self, *args, **options):
+        added = build_transitions(full=options['full'])
+        self.stdout.write(self.style.SUCCESS(f'Added {added} transitions to {model_path()}.'))
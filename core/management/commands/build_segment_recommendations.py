@@ -0,0 +1,11 @@
+"""Precompute cold-start recommendation lists for every learner profile segment."""
+from django.core.management.base import BaseCommand
+from core.services import ColdStartRecommender
+
+
+class Command(BaseCommand):
+    help = 'Score the catalog once per (interest, skill level, content type) segment for new learners'
+
+    def handle(self, *args, **options):
+        count = ColdStartRecommender().build_all()
+        self.stdout.write(self.style.SUCCESS(f'Built {count} segment recommendation lists.'))
@@ -0,0 +1,23 @@
+"""Precompute "learners like you" neighbor lists (blocked NumPy similarity across worker processes)."""
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+from core import neighbors
+
+
+class Command(BaseCommand):
+    help = 'Find the top-k most similar learners for every learner with activity'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='Worker processes')
+        parser.add_argument('--k', type=int, default=neighbors.TOP_K, help='Neighbors kept per learner')
+        parser.add_argument('--block-size', type=int, default=neighbors.BLOCK_SIZE,
+                            help='Users per similarity block (memory per worker grows with its square)')
+
+    def handle(self, *args, **options):
+        if neighbors.np is None:
+            raise CommandError('numpy is required to build neighbors (pip install numpy)')
+        count = neighbors.build_neighbors(
+            workers=max(1, options['workers']), k=options['k'], block_size=max(1, options['block_size']),
+        )
+        self.stdout.write(self.style.SUCCESS(f'Stored neighbors for {count} learners.'))
@@ -0,0 +1,11 @@
+"""Fold time-decayed trending counters into Course.popularity_score (run periodically, e.g. hourly)."""
+from django.core.management.base import BaseCommand
+from core.trending import fold_popularity
+
+
+class Command(BaseCommand):
+    help = 'Recompute course popularity scores from ratings and decayed enrollment/read/completion counters'
+
+    def handle(self, *args, **options):
+        count = fold_popularity()
+        self.stdout.write(self.style.SUCCESS(f'Updated popularity for {count} courses.'))
@@ -0,0 +1,197 @@
+"""Bulk-generate production-sized synthetic data (users, courses, enrollments, progress, sessions, quizzes, activities)."""
+import os
+import random
+import sqlite3
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from core import synthetic
+from core.catalog import bump_catalog_version
+from core.models import Course, Enrollment, Quiz, User
+from core.sharding import shard_count
+
+INSERT_BATCH = 20000
+
+
+def _converters(model, columns, conn):
+    """Per-column functions turning Python values into database values (datetimes, JSON)."""
+    fields = {field.attname: field for field in model._meta.concrete_fields}
+    converters = []
+    for column in columns:
+        field = fields[column]
+        internal = field.get_internal_type()
+        if internal == 'DateTimeField':
+            converters.append(conn.ops.adapt_datetimefield_value)
+        elif internal == 'JSONField':
+            converters.append(lambda value, encoder=field.encoder: conn.ops.adapt_json_value(value, encoder))
+        else:
+            converters.append(None)
+    return converters
+
+
+def _db_rows(key, rows, conn):
+    converters = _converters(synthetic.LOAD_MODELS[key], synthetic.LOAD_COLUMNS[key], conn)
+    if not any(converters):
+        return rows
+    return [
+        tuple(value if convert is None else convert(value) for convert, value in zip(converters, row))
+        for row in rows
+    ]
+
+
+def _quoted(columns):
+    return ', '.join(connection.ops.quote_name(column) for column in columns)
+
+
+def _shard_worker(path, user_ids, catalog, means, seed, now):
+    """Process target: generate history for a slice of users into its own SQLite file."""
+    import django
+    from django.apps import apps
+    if not apps.ready:
+        django.setup()
+    from django.db import connection as conn
+
+    rows = synthetic.learner_history(user_ids, catalog, means, seed=seed, now=now)
+    db = sqlite3.connect(path)
+    db.execute('PRAGMA journal_mode=OFF')
+    db.execute('PRAGMA synchronous=OFF')
+    counts = {}
+    for key, columns in synthetic.LOAD_COLUMNS.items():
+        table = synthetic.LOAD_MODELS[key]._meta.db_table
+        db.execute(f'CREATE TABLE "{table}" ({", ".join(columns)})')
+        placeholders = ', '.join('?' for _ in columns)
+        db.executemany(f'INSERT INTO "{table}" VALUES ({placeholders})', _db_rows(key, rows[key], conn))
+        counts[key] = len(rows[key])
+    db.commit()
+    db.close()
+    return counts
+
+
+class Command(BaseCommand):
+    help = 'Bulk-insert large volumes of realistic synthetic data for load testing'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--courses', type=int, default=200)
+        parser.add_argument('--enrollments', type=int, default=None, help='Total enrollments (default: 5 per user)')
+        parser.add_argument('--sessions', type=int, default=None, help='Total reading sessions (default: 10 per user)')
+        parser.add_argument('--quiz-attempts', type=int, default=None, help='Total quiz attempts (default: 5 per user)')
+        parser.add_argument('--activities', type=int, default=None, help='Total activities (default: 50 per user)')
+        parser.add_argument('--workers', type=int, default=1,
+                            help='Generate history in this many processes, one SQLite shard each (SQLite only)')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--prefix', default='load', help='Username prefix for generated learners')
+
+    def handle(self, *args, **options):
+        n_users = max(1, options['users'])
+        workers = max(1, options['workers'])
+        if workers > 1 and connection.vendor != 'sqlite':
+            raise CommandError('--workers > 1 merges SQLite shards and needs the sqlite3 backend')
+        if User.objects.filter(username=f"{options['prefix']}0").exists():
+            raise CommandError(f"Users with prefix {options['prefix']!r} already exist; pass a different --prefix")
+
+        means = {
+            'enrollments': (options['enrollments'] if options['enrollments'] is not None else n_users * 5) / n_users,
+            'sessions': (options['sessions'] if options['sessions'] is not None else n_users * 10) / n_users,
+            'quiz_attempts': (options['quiz_attempts'] if options['quiz_attempts'] is not None else n_users * 5) / n_users,
+            'activities': (options['activities'] if options['activities'] is not None else n_users * 50) / n_users,
+        }
+        started = time.perf_counter()
+
+        courses, quizzes = synthetic.generate_catalog(options['courses'], seed=options['seed'])
+        users = synthetic.generate_users(n_users, seed=options['seed'], prefix=options['prefix'])
+        self.stdout.write(f'  {len(courses)} courses, {len(users)} users ({time.perf_counter() - started:.1f}s)')
+
+        course_ids = [course.id for course in courses]
+        random.Random(options['seed']).shuffle(course_ids)  # popularity rank independent of id
+        quizzes_by_course = {}
+        for quiz_id, course_id in Quiz.objects.filter(lesson__course_id__in=course_ids).values_list('id', 'lesson__course_id'):
+            quizzes_by_course.setdefault(course_id, []).append(quiz_id)
+        catalog = {
+            'course_ids': course_ids,
+            'cumulative': synthetic.zipf_cumulative(len(course_ids)),
+            'pages': {course.id: course.total_pages for course in courses},
+            'quizzes': quizzes_by_course,
+        }
+        user_ids = [user.id for user in users]
+        now = timezone.now()
+
+        if workers == 1:
+            counts = self._insert(synthetic.learner_history(user_ids, catalog, means, seed=options['seed'], now=now))
+        else:
+            counts = self._generate_sharded(user_ids, catalog, means, options['seed'], now, workers)
+
+        # Denormalized counters follow the generated enrollments
+        Course.objects.filter(id__in=course_ids).update(enrolled_count=Coalesce(Subquery(
+            Enrollment.objects.filter(course=OuterRef('pk')).values('course').annotate(n=Count('id')).values('n')
+        ), Value(0)))
+        bump_catalog_version()
+
+        if shard_count():
+            # History was written to 'default'; move it into the user shards
+            call_command('reshard', source_shards=0, stdout=self.stdout)
+
+        for key, count in counts.items():
+            self.stdout.write(f'  {key}: {count}')
+        self.stdout.write(self.style.SUCCESS(f'Generated load data in {time.perf_counter() - started:.1f}s.'))
+
+    def _insert(self, rows):
+        """Write generated rows to the default database with batched executemany."""
+        counts = {}
+        with transaction.atomic(), connection.cursor() as cursor:
+            for key, columns in synthetic.LOAD_COLUMNS.items():
+                table = connection.ops.quote_name(synthetic.LOAD_MODELS[key]._meta.db_table)
+                placeholders = ', '.join(['%s'] * len(columns))
+                sql = f'INSERT INTO {table} ({_quoted(columns)}) VALUES ({placeholders})'
+                data = rows[key]
+                for start in range(0, len(data), INSERT_BATCH):
+                    cursor.executemany(sql, _db_rows(key, data[start:start + INSERT_BATCH], connection))
+                counts[key] = len(data)
+        return counts
+
+    def _generate_sharded(self, user_ids, catalog, means, seed, now, workers):
+        """Generate shards in parallel, then merge each one with ATTACH + INSERT ... SELECT."""
+        workdir = Path(tempfile.mkdtemp(prefix='load-shards-'))
+        slices = [user_ids[i::workers] for i in range(workers)]
+        paths = [str(workdir / f'shard-{i}.sqlite3') for i in range(workers)]
+        counts = {key: 0 for key in synthetic.LOAD_COLUMNS}
+        # Children must not inherit the parent's open database connection
+        connection.close()
+        try:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                futures = [
+                    pool.submit(_shard_worker, path, part, catalog, means, seed * 1000 + shard, now)
+                    for shard, (path, part) in enumerate(zip(paths, slices))
+                ]
+                for future in futures:
+                    for key, count in future.result().items():
+                        counts[key] += count
+
+            with connection.cursor() as cursor:
+                for path in paths:
+                    # ATTACH is not allowed inside a transaction
+                    cursor.execute('ATTACH DATABASE %s AS shard', [path])
+                    try:
+                        with transaction.atomic():
+                            for key, columns in synthetic.LOAD_COLUMNS.items():
+                                table = connection.ops.quote_name(synthetic.LOAD_MODELS[key]._meta.db_table)
+                                cursor.execute(
+                                    f'INSERT INTO {table} ({_quoted(columns)}) '
+                                    f'SELECT {_quoted(columns)} FROM shard.{table}'
+                                )
+                    finally:
+                        cursor.execute('DETACH DATABASE shard')
+        finally:
+            for path in paths:
+                Path(path).unlink(missing_ok=True)
+            os.rmdir(workdir)
+        return counts
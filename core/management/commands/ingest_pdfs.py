@@ -0,0 +1,178 @@
+"""Ingest a directory of course PDFs: extract text/outline in parallel and upsert Course rows."""
+import os
+import shutil
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from core.catalog import bump_catalog_version
+from core.chatbot import build_course_index
+from core.models import Course, CourseContent
+from core.pdf_text import PdfReader, extract_pdf, file_sha256
+
+
+CATEGORY_KEYS = {key for key, _ in Course.CATEGORIES}
+LEVEL_KEYS = {key for key, _ in Course.LEVELS}
+SUMMARY_CHARS = 1500
+DESCRIPTION_CHARS = 300
+MINUTES_PER_PAGE = 3
+
+
+def _title_from_path(path):
+    return Path(path).stem.replace('_', ' ').replace('-', ' ').strip().title()
+
+
+def _build_summary(title, extracted):
+    """Chatbot summary: outline headings plus the opening text of the PDF."""
+    headings = [entry['title'] for entry in extracted['outline'] if entry['level'] == 0]
+    parts = []
+    if headings:
+        parts.append(f"{title} covers: " + ', '.join(headings) + '.')
+    parts.append(' '.join(extracted['pages'][:3]))
+    return ' '.join(parts)[:SUMMARY_CHARS].strip()
+
+
+class Command(BaseCommand):
+    help = 'Ingest course PDFs from a directory (parallel extraction, incremental by content hash)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('directory', help='Directory to walk for *.pdf files')
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                            help='Worker processes for hashing and extraction')
+        parser.add_argument('--category', default='web_development', choices=sorted(CATEGORY_KEYS),
+                            help='Category when the parent folder is not a category name')
+        parser.add_argument('--level', default='beginner', choices=sorted(LEVEL_KEYS),
+                            help='Level for newly created courses')
+        parser.add_argument('--force', action='store_true',
+                            help='Re-extract files even if their content hash is unchanged')
+        parser.add_argument('--split-pages', action='store_true',
+                            help='Also split ingested PDFs into per-page assets')
+
+    def handle(self, *args, **options):
+        if PdfReader is None:
+            raise CommandError('pypdf is required to ingest PDFs (pip install pypdf)')
+        root = Path(options['directory']).resolve()
+        if not root.is_dir():
+            raise CommandError(f'{root} is not a directory')
+
+        paths = sorted(str(p) for p in root.rglob('*.pdf') if p.is_file())
+        if not paths:
+            self.stdout.write('No PDFs found.')
+            return
+        workers = max(1, options['workers'])
+        chunksize = max(1, len(paths) // (workers * 4))
+
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            hashes = dict(zip(paths, pool.map(file_sha256, paths, chunksize=chunksize)))
+
+            known = dict(CourseContent.objects.filter(source_path__in=paths)
+                         .values_list('source_path', 'content_hash'))
+            changed = [p for p in paths if options['force'] or known.get(p) != hashes[p]]
+            self.stdout.write(f'{len(paths)} PDFs found, {len(paths) - len(changed)} unchanged')
+
+            extracted = list(pool.map(extract_pdf, changed, chunksize=chunksize))
+
+        ok = []
+        for result in extracted:
+            if result['error']:
+                self.stderr.write(self.style.ERROR(f"  Failed: {result['path']}: {result['error']}"))
+            else:
+                ok.append(result)
+
+        courses = self._upsert(ok, hashes, options)
+
+        # Chatbot index is built once per content version, here rather than on the first question
+        for course in Course.objects.filter(id__in=[c.id for c in courses]).select_related('content'):
+            build_course_index(course, force=True)
+
+        if options['split_pages'] and courses:
+            from core.pdf_pages import PDFSplitError, split_course_pdf
+            for course in courses:
+                try:
+                    split_course_pdf(course, force=True)
+                except PDFSplitError as e:
+                    self.stderr.write(self.style.ERROR(f'  Split failed: {course.title}: {e}'))
+
+        self.stdout.write(self.style.SUCCESS(f'Ingested {len(courses)} PDF courses.'))
+
+    def _media_name(self, path, content_hash):
+        """Storage name for the PDF, copying it under MEDIA_ROOT/courses/ when it lives elsewhere."""
+        media_root = Path(settings.MEDIA_ROOT).resolve()
+        source = Path(path)
+        if media_root in source.parents:
+            return source.relative_to(media_root).as_posix()
+        # Named by content, so same-named PDFs from different folders never share a copy
+        target = media_root / 'courses' / f'{content_hash[:12]}-{source.name}'
+        target.parent.mkdir(parents=True, exist_ok=True)
+        if not target.exists():
+            shutil.copyfile(path, target)
+        return target.relative_to(media_root).as_posix()
+
+    def _upsert(self, results, hashes, options):
+        """Create/update Course and CourseContent rows in bulk. Returns the affected courses."""
+        if not results:
+            return []
+        now = timezone.now()
+        existing = {
+            c.source_path: c.course
+            for c in CourseContent.objects.filter(
+                source_path__in=[r['path'] for r in results]
+            ).select_related('course')
+        }
+
+        to_create, to_update, pairs = [], [], []
+        for result in results:
+            path = result['path']
+            parent = Path(path).parent.name
+            title = result['title'] or _title_from_path(path)
+            course = existing.get(path)
+            created = course is None
+            if created:
+                course = Course(
+                    title=title[:200],
+                    category=parent if parent in CATEGORY_KEYS else options['category'],
+                    level=options['level'],
+                )
+                to_create.append(course)
+            else:
+                to_update.append(course)
+            course.description = ' '.join(result['pages'][:1])[:DESCRIPTION_CHARS] or title
+            course.total_pages = max(result['page_count'], 1)
+            course.duration_hours = max(1, round(result['page_count'] * MINUTES_PER_PAGE / 60))
+            course.summary_for_chat = _build_summary(course.title, result)
+            course.pdf_file.name = self._media_name(path, hashes[path])
+            course.updated_at = now
+            pairs.append((course, result, created))
+
+        with transaction.atomic():
+            Course.objects.bulk_create(to_create)
+            Course.objects.bulk_update(to_update, [
+                'description', 'total_pages', 'duration_hours', 'summary_for_chat', 'pdf_file', 'updated_at',
+            ])
+            CourseContent.objects.bulk_create(
+                [
+                    CourseContent(
+                        course=course,
+                        source_path=result['path'],
+                        content_hash=hashes[result['path']],
+                        page_count=result['page_count'],
+                        page_text=CourseContent.pack_pages(result['pages']),
+                        outline=result['outline'],
+                        ingested_at=now,
+                    )
+                    for course, result, _ in pairs
+                ],
+                update_conflicts=True,
+                unique_fields=['source_path'],
+                update_fields=['content_hash', 'page_count', 'page_text', 'outline', 'ingested_at'],
+            )
+        # bulk_create/bulk_update send no post_save signals
+        bump_catalog_version()
+
+        for course, _, created in pairs:
+            self.stdout.write(f'  {"Created" if created else "Updated"}: {course.title} ({course.total_pages} pages)')
+        return [course for course, _, _ in pairs]
@@ -0,0 +1,11 @@
+"""Apply sharded counter deltas to the Course columns (run periodically, e.g. every minute)."""
+from django.core.management.base import BaseCommand
+from core.counters import reconcile
+
+
+class Command(BaseCommand):
+    help = 'Write accumulated enrollment/completion/page-view counter shards back to Course'
+
+    def handle(self, *args, **options):
+        count = reconcile()
+        self.stdout.write(self.style.SUCCESS(f'Reconciled {count} course counters.'))
@@ -0,0 +1,117 @@
+"""Move user-sharded history rows to their shard after settings.USER_SHARDS changed."""
+import time
+from pathlib import Path
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, transaction
+
+from core.sharding import (
+    ensure_alias, history_aliases, shard_alias, shard_count, shard_database, shard_for_user, sharded_models,
+)
+
+DELETE_BATCH = 500
+
+
+class Command(BaseCommand):
+    help = 'Redistribute the user-sharded history tables from an old shard count to settings.USER_SHARDS'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--from', dest='source_shards', type=int, required=True,
+                            help="Shard count the rows are stored under now (0: all in 'default')")
+        parser.add_argument('--batch-size', type=int, default=5000, help='Rows read from a source per batch')
+        parser.add_argument('--dry-run', action='store_true', help='Only count the rows that would move')
+
+    def handle(self, *args, **options):
+        source_count, target_count = options['source_shards'], shard_count()
+        if source_count < 0:
+            raise CommandError('--from must be 0 or a positive shard count')
+        if source_count == target_count:
+            self.stdout.write(f'Already on {target_count} shard(s); nothing to move.')
+            return
+
+        # Shards dropped from settings are registered from the naming scheme
+        for index in range(source_count):
+            if index >= target_count:
+                path = Path(shard_database(index)['NAME'])
+                if not path.exists():
+                    raise CommandError(f'Source shard {index} not found at {path}')
+            ensure_alias(shard_alias(index), shard_database(index))
+        if not options['dry_run']:
+            for alias in history_aliases(target_count):
+                call_command('migrate', database=alias, verbosity=0)
+
+        started = time.perf_counter()
+        totals = {}
+        for source in history_aliases(source_count):
+            for model in sharded_models():
+                moved = self._move(model, source, target_count, options['batch_size'], options['dry_run'])
+                totals[model._meta.model_name] = totals.get(model._meta.model_name, 0) + moved
+
+        verb = 'would move' if options['dry_run'] else 'moved'
+        for name, count in totals.items():
+            self.stdout.write(f'  {name}: {count} rows {verb}')
+        if options['dry_run']:
+            return
+        self.stdout.write(self.style.SUCCESS(
+            f'Resharded from {source_count} to {target_count} shard(s) in {time.perf_counter() - started:.1f}s. '
+            'Moved rows have new primary keys.'
+        ))
+        if source_count > target_count:
+            emptied = ', '.join(shard_database(index)['NAME'] for index in range(target_count, source_count))
+            self.stdout.write(f'No longer used and now empty: {emptied}')
+
+    def _move(self, model, source, target_count, batch_size, dry_run):
+        """
+        Copy the rows of one model that belong elsewhere out of a source database
+
+        Rows are copied as stored (timestamps included) without their id,
+        then deleted from the source, one batch at a time. Run it with the
+        application stopped: rows written meanwhile may land on the old shard.
+
+        Returns:
+            Number of rows moved (or that would move)
+        """
+        connection = connections[source]
+        quote = connection.ops.quote_name
+        table = model._meta.db_table
+        if table not in connection.introspection.table_names():
+            return 0
+        columns = [field.column for field in model._meta.concrete_fields if not field.primary_key]
+        user_index = columns.index(model._meta.get_field('user').column)
+        select = (
+            f'SELECT {quote("id")}, {", ".join(quote(column) for column in columns)} FROM {quote(table)} '
+            f'WHERE {quote("id")} > %s ORDER BY {quote("id")} LIMIT %s'
+        )
+        insert = (
+            f'INSERT INTO {quote(table)} ({", ".join(quote(column) for column in columns)}) '
+            f'VALUES ({", ".join(["%s"] * len(columns))})'
+        )
+
+        moved, last_id = 0, 0
+        while True:
+            with connection.cursor() as cursor:
+                cursor.execute(select, [last_id, batch_size])
+                rows = cursor.fetchall()
+            if not rows:
+                return moved
+            last_id = rows[-1][0]
+            by_target = {}
+            for row in rows:
+                target = shard_for_user(row[1 + user_index], target_count)
+                if target != source:
+                    by_target.setdefault(target, []).append(row)
+            moved_ids = [row[0] for group in by_target.values() for row in group]
+            moved += len(moved_ids)
+            if dry_run or not moved_ids:
+                continue
+
+            for target, group in by_target.items():
+                with transaction.atomic(using=target), connections[target].cursor() as cursor:
+                    cursor.executemany(insert, [row[1:] for row in group])
+            with transaction.atomic(using=source), connection.cursor() as cursor:
+                for start in range(0, len(moved_ids), DELETE_BATCH):
+                    chunk = moved_ids[start:start + DELETE_BATCH]
+                    cursor.execute(
+                        f'DELETE FROM {quote(table)} WHERE {quote("id")} IN ({", ".join(["%s"] * len(chunk))})', chunk,
+                    )
@@ -0,0 +1,74 @@
+"""Run background job worker processes (recommendation refreshes and other queued jobs)."""
+import multiprocessing
+import signal
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+
+def _worker_entry(poll_interval, stop, burst):
+    """Process target: make sure Django is set up (spawn start method) and run the loop."""
+    import django
+    from django.conf import settings
+    if not settings.configured or not django.apps.apps.ready:
+        django.setup()
+    # Let the parent handle Ctrl+C and tell us to stop through the event
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    from core.jobs import work
+    work(poll_interval=poll_interval, stop=stop, burst=burst)
+
+
+class Command(BaseCommand):
+    help = 'Start worker processes that execute queued background jobs'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=2, help='Number of worker processes')
+        parser.add_argument('--poll-interval', type=float, default=1.0,
+                            help='Seconds between polls when the queue is empty')
+        parser.add_argument('--burst', action='store_true', help='Exit once the queue is empty')
+        parser.add_argument('--stale-minutes', type=int, default=30,
+                            help='Requeue jobs left running longer than this by a dead worker')
+
+    def handle(self, *args, **options):
+        from core.jobs import requeue_stale, work
+
+        requeued = requeue_stale(timedelta(minutes=options['stale_minutes']))
+        if requeued:
+            self.stdout.write(f'Requeued {requeued} stale job(s)')
+
+        workers = max(1, options['workers'])
+        if workers == 1:
+            self.stdout.write('Worker running (Ctrl+C to stop)')
+            try:
+                work(poll_interval=options['poll_interval'], burst=options['burst'])
+            except KeyboardInterrupt:
+                pass
+            return
+
+        # Children must not inherit the parent's open database connections
+        connections.close_all()
+        stop = multiprocessing.Event()
+        processes = [
+            multiprocessing.Process(
+                target=_worker_entry,
+                args=(options['poll_interval'], stop, options['burst']),
+                name=f'job-worker-{i}',
+            )
+            for i in range(workers)
+        ]
+        for process in processes:
+            process.start()
+        self.stdout.write(f'{workers} workers running (Ctrl+C to stop)')
+
+        def shutdown(*_):
+            stop.set()
+        signal.signal(signal.SIGTERM, shutdown)
+        try:
+            for process in processes:
+                process.join()
+        except KeyboardInterrupt:
+            stop.set()
+            for process in processes:
+                process.join()
+        self.stdout.write(self.style.SUCCESS('Workers stopped.'))
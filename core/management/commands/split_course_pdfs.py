@@ -0,0 +1,31 @@
+"""Split course PDFs into per-page assets (and previews) for lazy page delivery."""
+from django.core.management.base import BaseCommand
+from core.models import Course
+from core.pdf_pages import PDFSplitError, split_course_pdf
+
+
+class Command(BaseCommand):
+    help = 'Split each course PDF into single-page PDFs with lightweight preview renders'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--course', type=int, action='append', dest='course_ids',
+                            help='Only split this course id (repeatable)')
+        parser.add_argument('--force', action='store_true',
+                            help='Re-split courses that already have pages')
+
+    def handle(self, *args, **options):
+        courses = Course.objects.exclude(pdf_file='').exclude(pdf_file__isnull=True).order_by('id')
+        if options['course_ids']:
+            courses = courses.filter(id__in=options['course_ids'])
+
+        for course in courses:
+            try:
+                count = split_course_pdf(course, force=options['force'])
+            except PDFSplitError as e:
+                self.stderr.write(self.style.ERROR(f'  Failed: {course.title}: {e}'))
+                continue
+            if count:
+                self.stdout.write(f'  Split: {course.title} ({count} pages)')
+            else:
+                self.stdout.write(f'  Skipped: {course.title} (already split)')
+        self.stdout.write(self.style.SUCCESS('Course PDFs split.'))
@@ -0,0 +1,122 @@
+"""Check with EXPLAIN QUERY PLAN that the hot queries are served by their indexes."""
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.utils import timezone
+
+from core.models import (
+    Activity, Course, Enrollment, Feedback, PDFReadingProgress, QuizAttempt, ReadingSession, Recommendation,
+)
+
+# (description, function(user_id, since) -> queryset, model, index that must be used or None).
+# The index is given by its fields, or by name for partial indexes. None only requires that the model's table is searched through some index rather than scanned.
+HOT_QUERIES = [
+    ('recent quiz attempts',
+     lambda uid, since: QuizAttempt.objects.filter(user_id=uid, attempted_at__gte=since),
+     QuizAttempt, ['user', '-attempted_at']),
+    ('reading sessions, newest first',
+     lambda uid, since: ReadingSession.objects.filter(user_id=uid),
+     ReadingSession, ['user', '-started_at']),
+    # Counted, so without the default ordering
+    ('completed enrollments',
+     lambda uid, since: Enrollment.objects.filter(user_id=uid, is_completed=True).order_by(),
+     Enrollment, 'core_enrollment_completed_idx'),
+    ('enrollments, newest first',
+     lambda uid, since: Enrollment.objects.filter(user_id=uid).select_related('course'),
+     Enrollment, ['user', '-enrolled_at']),
+    ('enrollments by course category',
+     lambda uid, since: Enrollment.objects.filter(user_id=uid, course__category='programming'),
+     Enrollment, None),
+    # Marked read with update(), so without the default ordering
+    ('unread feedback',
+     lambda uid, since: Feedback.objects.filter(user_id=uid, is_read=False).order_by(),
+     Feedback, 'core_feedback_unread_idx'),
+    ('latest feedback',
+     lambda uid, since: Feedback.objects.filter(user_id=uid).order_by('-created_at')[:20],
+     Feedback, ['user', '-created_at']),
+    ('recent activity',
+     lambda uid, since: Activity.objects.filter(user_id=uid, timestamp__gte=since),
+     Activity, ['user', '-timestamp']),
+    ('recent recommendations',
+     lambda uid, since: Recommendation.objects.filter(user_id=uid, generated_at__gte=since)[:6],
+     Recommendation, ['user', '-generated_at']),
+    ('PDF progress of a user',
+     lambda uid, since: (
+         PDFReadingProgress.objects.filter(user_id=uid).order_by().values_list('course_id', 'last_page_read')
+     ),
+     PDFReadingProgress, None),
+    ('chat-ready PDF courses',
+     lambda uid, since: Course.objects.exclude(summary_for_chat='').order_by('id')[:4],
+     Course, 'core_course_chat_ready_idx'),
+    ('related courses by category',
+     lambda uid, since: Course.objects.filter(total_pages__gte=1, category__in=['programming', 'data_science'])[:6],
+     Course, ['category', 'total_pages']),
+]
+
+
+def _index_name(model, fields):
+    if isinstance(fields, str):
+        return fields
+    for index in model._meta.indexes:
+        if index.condition is None and list(index.fields) == list(fields):
+            return index.name
+    raise CommandError(f'{model.__name__} has no index on {fields}')
+
+
+def check_plan(plan, table, index_name):
+    """
+    Problems with one query plan
+
+    Args:
+        plan: Detail strings of EXPLAIN QUERY PLAN rows
+        table: Table that must be read through an index
+        index_name: Index that must be used, or None for any index
+
+    Returns:
+        List of problem descriptions (empty when the plan is fine)
+    """
+    lines = [line for line in plan if line.split(' ')[1:2] == [table]]
+    if not lines:
+        return [f'{table} does not appear in the plan']
+    problems = []
+    for line in lines:
+        if index_name is None:
+            if 'INDEX' not in line and 'PRIMARY KEY' not in line:
+                problems.append(f'full scan: {line}')
+        elif f'INDEX {index_name}' not in line:
+            problems.append(f'expected {index_name}: {line}')
+    return problems
+
+
+class Command(BaseCommand):
+    help = 'Verify with EXPLAIN QUERY PLAN that each hot query uses the index meant for it (SQLite)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default='default')
+
+    def handle(self, *args, **options):
+        connection = connections[options['database']]
+        if connection.vendor != 'sqlite':
+            raise CommandError('EXPLAIN QUERY PLAN checks need the sqlite3 backend')
+
+        since = timezone.now() - timedelta(days=30)
+        failures = 0
+        for description, build, model, fields in HOT_QUERIES:
+            index_name = _index_name(model, fields) if fields else None
+            sql, params = build(0, since).query.sql_with_params()
+            with connection.cursor() as cursor:
+                cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+                plan = [row[3] for row in cursor.fetchall()]
+            problems = check_plan(plan, model._meta.db_table, index_name)
+            if problems:
+                failures += 1
+                self.stdout.write(self.style.ERROR(f'FAIL {description}'))
+                for problem in problems:
+                    self.stdout.write(f'    {problem}')
+            else:
+                self.stdout.write(f'ok   {description}: {"; ".join(plan)}')
+
+        if failures:
+            raise CommandError(f'{failures} of {len(HOT_QUERIES)} hot queries do not use their index')
+        self.stdout.write(self.style.SUCCESS(f'All {len(HOT_QUERIES)} hot queries use their indexes.'))
@@ -0,0 +1,189 @@
+"""
+Course media serving with HTTP caching and byte-range support.
+
+Files under MEDIA_ROOT/courses/ are served with a content-derived ETag,
+Last-Modified, 304 handling and single-range `Range` requests so PDF viewers
+can fetch partial content. When MEDIA_SENDFILE_BACKEND is configured the
+actual bytes are handed off to the front-end web server instead.
+"""
+
+import hashlib
+import mimetypes
+import os
+import re
+import threading
+
+from django.conf import settings
+from django.http import FileResponse, Http404, HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+
+CHUNK_SIZE = 64 * 1024
+ONE_YEAR = 365 * 24 * 60 * 60
+
+_RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+# abs path -> (size, mtime_ns, etag); hashing a PDF once per change is enough
+_etag_cache = {}
+_etag_lock = threading.Lock()
+_ETAG_CACHE_MAX = 2048
+
+
+def file_etag(path, stat=None):
+    """Strong ETag derived from file content, cached until size/mtime change."""
+    stat = stat or os.stat(path)
+    key = (stat.st_size, stat.st_mtime_ns)
+    cached = _etag_cache.get(path)
+    if cached and cached[:2] == key:
+        return cached[2]
+
+    digest = hashlib.sha1()
+    with open(path, 'rb') as fh:
+        for chunk in iter(lambda: fh.read(CHUNK_SIZE), b''):
+            digest.update(chunk)
+    etag = '"%s"' % digest.hexdigest()[:32]
+
+    with _etag_lock:
+        if len(_etag_cache) >= _ETAG_CACHE_MAX:
+            _etag_cache.clear()
+        _etag_cache[path] = key + (etag,)
+    return etag
+
+
+def versioned_media_url(fieldfile):
+    """URL for a stored file with its content version appended (?v=...), safe to cache for a year."""
+    if not fieldfile:
+        return None
+    try:
+        etag = file_etag(fieldfile.path)
+    except (OSError, NotImplementedError, ValueError):
+        return fieldfile.url
+    return '%s?v=%s' % (fieldfile.url, etag_version(etag))
+
+
+def etag_version(etag):
+    """The ?v= value versioned_media_url puts in URLs for a file with this ETag."""
+    return etag.strip('"')[:12]
+
+
+def _parse_range(header, size):
+    """
+    Parse a single `bytes=` range
+
+    Returns:
+        (start, end) inclusive, None if the header should be ignored,
+        or False if the range cannot be satisfied
+    """
+    match = _RANGE_RE.match(header.strip())
+    if not match:
+        return None  # multi-range or other units: fall back to a full response
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        length = int(last)
+        if length == 0:
+            return False
+        return max(size - length, 0), size - 1
+    start = int(first)
+    end = int(last) if last else size - 1
+    if start >= size or end < start:
+        return False
+    return start, min(end, size - 1)
+
+
+def _iter_range(path, start, length):
+    with open(path, 'rb') as fh:
+        fh.seek(start)
+        remaining = length
+        while remaining > 0:
+            chunk = fh.read(min(CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+
+def _sendfile_response(path, content_type):
+    """Empty response telling nginx/Apache to send the file itself."""
+    backend = getattr(settings, 'MEDIA_SENDFILE_BACKEND', None)
+    response = HttpResponse(content_type=content_type)
+    if backend == 'nginx':
+        relative = os.path.relpath(path, settings.MEDIA_ROOT).replace(os.sep, '/')
+        response['X-Accel-Redirect'] = settings.MEDIA_SENDFILE_PREFIX.rstrip('/') + '/' + relative
+    else:
+        response['X-Sendfile'] = path
+    return response
+
+
+def serve_media_file(request, path, content_type=None, max_age=None, version=None):
+    """
+    Serve a file from disk with conditional GET, Range and cache headers
+
+    Args:
+        request: HttpRequest
+        path: Absolute path of the file
+        content_type: Override the guessed content type
+        max_age: Cache lifetime in seconds; defaults to a year when the
+                 URL's ?v= matches the current version and revalidate-always otherwise
+        version: Current version for the ?v= check; defaults to the file's ETag
+
+    Returns:
+        HttpResponse (200, 206, 304 or 416)
+    """
+    try:
+        stat = os.stat(path)
+    except OSError:
+        raise Http404('File not found')
+    if not os.path.isfile(path):
+        raise Http404('File not found')
+
+    etag = file_etag(path, stat)
+    last_modified = int(stat.st_mtime)
+    if max_age is None:
+        # An old or made-up ?v= must not pin whatever is served now for a year
+        current = version if version is not None else etag_version(etag)
+        max_age = ONE_YEAR if request.GET.get('v') == current else 0
+    cache_control = f'private, max-age={max_age}'
+    if max_age >= ONE_YEAR:
+        cache_control += ', immutable'
+    elif max_age == 0:
+        cache_control += ', must-revalidate'
+
+    not_modified = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if not_modified is not None:
+        not_modified['Cache-Control'] = cache_control
+        return not_modified
+
+    content_type = content_type or mimetypes.guess_type(path)[0] or 'application/octet-stream'
+    size = stat.st_size
+
+    if getattr(settings, 'MEDIA_SENDFILE_BACKEND', None):
+        response = _sendfile_response(path, content_type)
+    else:
+        byte_range = None
+        range_header = request.META.get('HTTP_RANGE')
+        if range_header and request.method in ('GET', 'HEAD'):
+            if_range = request.META.get('HTTP_IF_RANGE')
+            if not if_range or if_range == etag:
+                byte_range = _parse_range(range_header, size)
+
+        if byte_range is False:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{size}'
+            return response
+        if byte_range:
+            start, end = byte_range
+            length = end - start + 1
+            response = StreamingHttpResponse(_iter_range(path, start, length), status=206,
+                                             content_type=content_type)
+            response['Content-Range'] = f'bytes {start}-{end}/{size}'
+            response['Content-Length'] = str(length)
+        else:
+            response = FileResponse(open(path, 'rb'), content_type=content_type)
+
+    response['Accept-Ranges'] = 'bytes'
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    response['Cache-Control'] = cache_control
+    return response
@@ -0,0 +1,433 @@
+"""
+Prometheus text-format metrics shared by all worker processes.
+
+Each process writes its samples into its own memory-mapped file under
+METRICS['DIR'] (`<pid>.db`), so recording a value is a dictionary lookup
+and an in-place write, with no locking across processes. `/metrics`
+reads every file in the directory and adds the values up, so all gunicorn
+workers report combined totals without an external collector. Gauges
+only count processes that are still alive.
+
+Counters from exited workers keep contributing, as Prometheus expects of
+counters: a worker folds its file into `merged.db` when it exits, and a
+starting worker folds in the files of workers that died without doing so,
+so the directory holds one file per live process plus `merged.db`.
+"""
+
+import atexit
+import json
+import mmap
+import os
+import struct
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+from django.conf import settings
+
+try:
+    import fcntl
+except ImportError:  # not on Windows; exited workers' files are then kept as they are
+    fcntl = None
+
+_metrics_settings = getattr(settings, 'METRICS', {})
+ENABLED = _metrics_settings.get('ENABLED', True)
+METRICS_DIR = Path(_metrics_settings.get('DIR', Path(settings.DATA_DIR) / 'metrics'))
+# `Authorization: Bearer <TOKEN>` lets a scraper read /metrics; without it only staff sessions can
+SCRAPE_TOKEN = _metrics_settings.get('TOKEN', '')
+# Counter and histogram values of exited processes
+MERGED_NAME = 'merged.db'
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+COUNT_BUCKETS = (0, 1, 5, 10, 25, 50, 100, 250, 500, 1000, 5000)
+
+_INITIAL_SIZE = 64 * 1024
+# File header: bytes used (4) + padding (4); entries: key length (4), key padded to 8, double (8)
+_HEADER = 8
+
+
+class MmapValues:
+    """
+    String key -> float store in a growable memory-mapped file
+
+    Only the owning process writes; readers of other processes' files use
+    read_all(). Values are 8-byte aligned doubles, written in one store.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, 'a+b')
+        if os.fstat(self._file.fileno()).st_size < _INITIAL_SIZE:
+            self._file.truncate(_INITIAL_SIZE)
+        self._capacity = os.fstat(self._file.fileno()).st_size
+        self._map = mmap.mmap(self._file.fileno(), self._capacity)
+        self._positions = {}
+        self._used = struct.unpack_from('i', self._map, 0)[0] or _HEADER
+        for key, _, position in _entries(self._map, self._used):
+            self._positions[key] = position
+
+    def _add_key(self, key):
+        encoded = key.encode('utf-8')
+        padded = encoded + b' ' * (8 - (len(encoded) + 4) % 8)
+        size = 4 + len(padded) + 8
+        while self._used + size > self._capacity:
+            self._capacity *= 2
+            self._file.truncate(self._capacity)
+            self._map.close()
+            self._map = mmap.mmap(self._file.fileno(), self._capacity)
+        struct.pack_into(f'i{len(padded)}sd', self._map, self._used, len(encoded), padded, 0.0)
+        self._used += size
+        struct.pack_into('i', self._map, 0, self._used)
+        position = self._used - 8
+        self._positions[key] = position
+        return position
+
+    def add(self, key, amount):
+        position = self._positions.get(key)
+        if position is None:
+            position = self._add_key(key)
+        value = struct.unpack_from('d', self._map, position)[0]
+        struct.pack_into('d', self._map, position, value + amount)
+
+    def set(self, key, value):
+        position = self._positions.get(key)
+        if position is None:
+            position = self._add_key(key)
+        struct.pack_into('d', self._map, position, value)
+
+    def close(self):
+        self._map.close()
+        self._file.close()
+
+
+def _entries(buffer, used):
+    """(key, value, value offset) for every entry in a mapped file."""
+    position = _HEADER
+    while position < used:
+        length = struct.unpack_from('i', buffer, position)[0]
+        key_end = position + 4 + length
+        position += 4 + length + (8 - (length + 4) % 8)
+        value = struct.unpack_from('d', buffer, position)[0]
+        yield buffer[key_end - length:key_end].decode('utf-8'), value, position
+        position += 8
+
+
+def read_all(path):
+    """All (key, value) pairs of a metrics file."""
+    with open(path, 'rb') as fh:
+        data = fh.read()
+    if len(data) < _HEADER:
+        return []
+    used = min(struct.unpack_from('i', data, 0)[0], len(data))
+    return [(key, value) for key, value, _ in _entries(data, used)]
+
+
+_values = None
+_values_pid = None
+_values_lock = threading.Lock()
+
+
+def _process_values():
+    """This process's value file, reopened after a fork."""
+    global _values, _values_pid
+    pid = os.getpid()
+    if _values_pid != pid:
+        METRICS_DIR.mkdir(parents=True, exist_ok=True)
+        fold_dead_processes()
+        _values = MmapValues(METRICS_DIR / f'{pid}.db')
+        if _values_pid is None:
+            atexit.register(_fold_own_file)
+        _values_pid = pid
+    return _values
+
+
+@contextmanager
+def _directory_lock(exclusive, directory=None):
+    """Shared lock for scrapes, exclusive while files are folded into merged.db."""
+    if fcntl is None:
+        yield
+        return
+    directory = directory or METRICS_DIR
+    directory.mkdir(parents=True, exist_ok=True)
+    with open(directory / '.lock', 'a') as fh:
+        fcntl.flock(fh, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+        try:
+            yield
+        finally:
+            fcntl.flock(fh, fcntl.LOCK_UN)
+
+
+def _fold(paths, directory):
+    """Add the counter and histogram values of `paths` to merged.db in `directory` and delete them (lock held)."""
+    merged = MmapValues(directory / MERGED_NAME)
+    try:
+        for path in paths:
+            try:
+                pairs = read_all(path)
+            except OSError:
+                continue
+            for key, value in pairs:
+                metric = REGISTRY.get(json.loads(key)[0])
+                # Gauges of exited processes no longer count
+                if value and not (metric is not None and metric.kind == 'gauge'):
+                    merged.add(key, value)
+            path.unlink(missing_ok=True)
+    finally:
+        merged.close()
+
+
+def fold_dead_processes():
+    """Fold the value files of processes that are no longer running into merged.db."""
+    if fcntl is None:
+        return
+    with _directory_lock(exclusive=True):
+        dead = [
+            path for path in METRICS_DIR.glob('*.db')
+            if path.stem.isdigit() and int(path.stem) != os.getpid() and not _live(int(path.stem))
+        ]
+        if dead:
+            _fold(dead, METRICS_DIR)
+
+
+def _fold_own_file():
+    """atexit hook: hand this process's values over to merged.db."""
+    global _values, _values_pid
+    if fcntl is None or _values_pid != os.getpid():
+        return
+    # The directory the file was opened in, also if METRICS_DIR was swapped since (tests)
+    directory = _values.path.parent
+    with _values_lock, _directory_lock(exclusive=True, directory=directory):
+        _values.close()
+        _fold([_values.path], directory)
+        _values = _values_pid = None
+
+
+def _write(method, key, value):
+    if not ENABLED:
+        return
+    with _values_lock:
+        getattr(_process_values(), method)(key, value)
+
+
+def clear_metrics_dir():
+    """Delete all value files, merged.db included (optional, before workers start, to reset counters)."""
+    for path in METRICS_DIR.glob('*.db'):
+        path.unlink(missing_ok=True)
+
+
+# ==================== Metric types ====================
+
+REGISTRY = {}
+
+
+class Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        REGISTRY[name] = self
+
+    def _key(self, sample, labels, **extra):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f'{self.name} expects labels {self.labelnames}, got {tuple(labels)}')
+        return json.dumps([self.name, sample, {**labels, **extra}], sort_keys=True)
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        _write('add', self._key(self.name + '_total', labels), amount)
+
+
+class Gauge(Metric):
+    """Gauge summed over live processes."""
+
+    kind = 'gauge'
+
+    def set(self, value, **labels):
+        _write('set', self._key(self.name, labels), value)
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        # Stored per bucket; made cumulative when exported
+        bound = next((b for b in self.buckets if value <= b), None)
+        le = 'inf' if bound is None else repr(float(bound))
+        _write('add', self._key(self.name + '_bucket', labels, le=le), 1)
+        _write('add', self._key(self.name + '_sum', labels), value)
+        _write('add', self._key(self.name + '_count', labels), 1)
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe the duration of the enclosed block in seconds."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+
+# ==================== Application metrics ====================
+
+recommendation_seconds = Histogram(
+    'learnai_recommendation_generation_seconds', 'Time to generate recommendations for one learner', ['mode'],
+)
+recommendation_candidates = Histogram(
+    'learnai_recommendation_candidates', 'Courses fully scored per recommendation run', buckets=COUNT_BUCKETS,
+)
+behavior_analysis_seconds = Histogram(
+    'learnai_behavior_analysis_seconds', 'Time to analyze one learner\'s recent behavior',
+)
+feedback_generated = Counter(
+    'learnai_feedback_generated', 'Feedback items created, by type', ['type'],
+)
+chat_history_buffer_depth = Gauge(
+    'learnai_chat_history_buffer_depth', 'Chat messages waiting in the background history writer',
+)
+chat_history_flush_seconds = Histogram(
+    'learnai_chat_history_flush_seconds', 'Time to write one batch of buffered chat messages',
+)
+chat_history_dropped = Counter(
+    'learnai_chat_history_dropped', 'Buffered chat messages discarded after repeated failed writes',
+)
+cache_requests = Counter(
+    'learnai_cache_requests', 'In-process cache lookups, by cache and result (hit or miss)', ['cache', 'result'],
+)
+progress_saves = Counter(
+    'learnai_progress_saves', 'PDF reading progress saves',
+)
+
+
+# ==================== Exposition ====================
+
+def _live(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def collect():
+    """
+    Values of all processes added up
+
+    Returns:
+        Dictionary of (metric name, sample name, sorted label items) -> value
+    """
+    if not METRICS_DIR.is_dir():
+        return {}
+    with _directory_lock(exclusive=False):
+        return _collect()
+
+
+def _collect():
+    totals = {}
+    for path in METRICS_DIR.glob('*.db'):
+        try:
+            # merged.db holds no gauges, so its pid is never looked at
+            pid = None if path.name == MERGED_NAME else int(path.stem)
+            pairs = read_all(path)
+        except (ValueError, OSError):
+            continue
+        alive = None
+        for key, value in pairs:
+            name, sample, labels = json.loads(key)
+            metric = REGISTRY.get(name)
+            if metric is None:
+                continue
+            if metric.kind == 'gauge':
+                alive = _live(pid) if alive is None else alive
+                if not alive:
+                    continue
+            sample_key = (name, sample, tuple(sorted(labels.items())))
+            totals[sample_key] = totals.get(sample_key, 0.0) + value
+    return totals
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(items):
+    if not items:
+        return ''
+    return '{' + ','.join(f'{key}="{_escape(value)}"' for key, value in items) + '}'
+
+
+def _format_value(value):
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+def render_metrics():
+    """All registered metrics in the Prometheus text exposition format (version 0.0.4)."""
+    totals = collect()
+    by_metric = {}
+    for (name, sample, labels), value in totals.items():
+        by_metric.setdefault(name, []).append(((sample, labels), value))
+
+    lines = []
+    for name, metric in sorted(REGISTRY.items()):
+        samples = sorted(by_metric.get(name, []))
+        lines.append(f'# HELP {name} {metric.documentation}')
+        lines.append(f'# TYPE {name} {metric.kind}')
+        if metric.kind == 'histogram':
+            lines.extend(_histogram_lines(metric, samples))
+            continue
+        if not samples and not metric.labelnames:
+            samples = [((name + '_total' if metric.kind == 'counter' else name, ()), 0.0)]
+        for (sample, labels), value in samples:
+            lines.append(f'{sample}{_format_labels(labels)} {_format_value(value)}')
+
+    # Hit ratios derived from the cache lookup counters
+    lookups = {}
+    for (sample, labels), value in by_metric.get(cache_requests.name, []):
+        labels = dict(labels)
+        hits, total = lookups.get(labels['cache'], (0.0, 0.0))
+        lookups[labels['cache']] = (hits + (value if labels['result'] == 'hit' else 0.0), total + value)
+    lines.append('# HELP learnai_cache_hit_ratio Share of in-process cache lookups that were hits')
+    lines.append('# TYPE learnai_cache_hit_ratio gauge')
+    for cache_name, (hits, total) in sorted(lookups.items()):
+        ratio = hits / total if total else 0.0
+        lines.append(f'learnai_cache_hit_ratio{_format_labels([("cache", cache_name)])} {_format_value(ratio)}')
+    return '\n'.join(lines) + '\n'
+
+
+def _histogram_lines(metric, samples):
+    """Cumulative _bucket lines plus _sum and _count for every label set of a histogram."""
+    series = {}
+    for (sample, labels), value in samples:
+        items = dict(labels)
+        le = items.pop('le', None)
+        entry = series.setdefault(tuple(sorted(items.items())), {'buckets': {}, 'sum': 0.0, 'count': 0.0})
+        if sample == metric.name + '_bucket':
+            entry['buckets'][le] = value
+        elif sample == metric.name + '_sum':
+            entry['sum'] = value
+        elif sample == metric.name + '_count':
+            entry['count'] = value
+    if not series and not metric.labelnames:
+        series[()] = {'buckets': {}, 'sum': 0.0, 'count': 0.0}
+
+    lines = []
+    for labels, entry in sorted(series.items()):
+        cumulative = 0.0
+        for bound in [repr(float(b)) for b in metric.buckets] + ['inf']:
+            cumulative += entry['buckets'].get(bound, 0.0)
+            le = '+Inf' if bound == 'inf' else bound
+            lines.append(f"{metric.name}_bucket{_format_labels(labels + (('le', le),))} {_format_value(cumulative)}")
+        lines.append(f"{metric.name}_sum{_format_labels(labels)} {_format_value(entry['sum'])}")
+        lines.append(f"{metric.name}_count{_format_labels(labels)} {_format_value(entry['count'])}")
+    return lines
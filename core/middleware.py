@@ -0,0 +1,243 @@
+"""
+Per-view query and latency instrumentation.
+
+QueryMetricsMiddleware samples requests (QUERY_METRICS['SAMPLE_RATE']) and,
+for each resolved URL name, records the number of SQL queries, total SQL
+time, wall time and repeated query signatures (the same SQL run more than
+once in one request, usually an N+1 loop). Values go into rolling
+histograms kept per process; `query_metrics_snapshot()` returns them and
+the staff-only `/api/query-metrics/` endpoint serves them as JSON.
+
+With a sample rate of 0 the middleware only forwards the request. It is
+sync and async capable, so under ASGI async views are not pushed into a
+thread on its account.
+"""
+
+import random
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+
+_metrics_settings = getattr(settings, 'QUERY_METRICS', {})
+SAMPLE_RATE = _metrics_settings.get('SAMPLE_RATE', 0.0)
+# Adds X-Query-Count / X-Query-Time / X-Query-Duplicates to sampled responses
+RESPONSE_HEADER = _metrics_settings.get('HEADER', False)
+WINDOW_SECONDS = _metrics_settings.get('WINDOW_SECONDS', 60)
+WINDOWS = _metrics_settings.get('WINDOWS', 15)
+# Repeated signatures kept per view, most frequent first
+MAX_SIGNATURES = 20
+
+# Histogram bucket upper bounds (the last bucket is open-ended)
+QUERY_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+MS_BUCKETS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+
+class RollingHistogram:
+    """
+    Bucketed counts over the last `windows` time windows
+
+    Old windows are dropped as time moves on, so the histogram always
+    describes recent traffic.
+    """
+
+    def __init__(self, bounds, window_seconds=WINDOW_SECONDS, windows=WINDOWS):
+        self.bounds = bounds
+        self.window_seconds = window_seconds
+        self.windows = windows
+        # window index -> [bucket counts, sum, count]
+        self._slots = {}
+
+    def _bucket(self, value):
+        for index, bound in enumerate(self.bounds):
+            if value <= bound:
+                return index
+        return len(self.bounds)
+
+    def observe(self, value, now=None):
+        window = int((now if now is not None else time.time()) // self.window_seconds)
+        slot = self._slots.get(window)
+        if slot is None:
+            slot = self._slots[window] = [[0] * (len(self.bounds) + 1), 0.0, 0]
+            for stale in [w for w in self._slots if w <= window - self.windows]:
+                del self._slots[stale]
+        slot[0][self._bucket(value)] += 1
+        slot[1] += value
+        slot[2] += 1
+
+    def snapshot(self, now=None):
+        """Counts per bucket (keyed by upper bound, '+Inf' last), plus sum, count and mean."""
+        oldest = int((now if now is not None else time.time()) // self.window_seconds) - self.windows
+        buckets = [0] * (len(self.bounds) + 1)
+        total, count = 0.0, 0
+        for window, (counts, slot_sum, slot_count) in list(self._slots.items()):
+            if window <= oldest:
+                continue
+            buckets = [a + b for a, b in zip(buckets, counts)]
+            total += slot_sum
+            count += slot_count
+        labels = [str(bound) for bound in self.bounds] + ['+Inf']
+        return {
+            'buckets': dict(zip(labels, buckets)),
+            'sum': round(total, 3),
+            'count': count,
+            'mean': round(total / count, 3) if count else 0,
+        }
+
+
+class ViewMetrics:
+    """Histograms and repeated-query signatures for one URL name."""
+
+    def __init__(self):
+        self.queries = RollingHistogram(QUERY_BUCKETS)
+        self.sql_ms = RollingHistogram(MS_BUCKETS)
+        self.wall_ms = RollingHistogram(MS_BUCKETS)
+        self.duplicates = RollingHistogram(QUERY_BUCKETS)
+        self.signatures = Counter()
+
+    def record(self, queries, sql_ms, wall_ms, repeated):
+        now = time.time()
+        self.queries.observe(queries, now)
+        self.sql_ms.observe(sql_ms, now)
+        self.wall_ms.observe(wall_ms, now)
+        self.duplicates.observe(sum(repeated.values()), now)
+        self.signatures.update(repeated)
+        if len(self.signatures) > MAX_SIGNATURES * 2:
+            self.signatures = Counter(dict(self.signatures.most_common(MAX_SIGNATURES)))
+
+    def snapshot(self):
+        now = time.time()
+        return {
+            'queries': self.queries.snapshot(now),
+            'sql_ms': self.sql_ms.snapshot(now),
+            'wall_ms': self.wall_ms.snapshot(now),
+            'duplicate_queries': self.duplicates.snapshot(now),
+            'repeated_signatures': [
+                {'sql': sql, 'extra_executions': count}
+                for sql, count in self.signatures.most_common(MAX_SIGNATURES)
+            ],
+        }
+
+
+_views = {}
+_lock = threading.Lock()
+
+
+def record_request(view_name, queries, sql_ms, wall_ms, repeated):
+    """Add one request's measurements to the per-process metrics."""
+    with _lock:
+        metrics = _views.get(view_name)
+        if metrics is None:
+            metrics = _views[view_name] = ViewMetrics()
+        metrics.record(queries, sql_ms, wall_ms, repeated)
+
+
+def query_metrics_snapshot():
+    """Dictionary of URL name -> histogram snapshots for this process."""
+    with _lock:
+        return {name: metrics.snapshot() for name, metrics in sorted(_views.items())}
+
+
+def reset_query_metrics():
+    with _lock:
+        _views.clear()
+
+
+class QueryRecorder:
+    """connection.execute_wrapper callable that times queries and counts SQL signatures."""
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.signatures = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.seconds += time.perf_counter() - start
+            self.count += 1
+            # Parameters are not part of the SQL text, so an N+1 loop repeats one signature
+            self.signatures[sql] += 1
+
+    def repeated(self):
+        """Signature -> executions beyond the first, for SQL run more than once."""
+        return {sql: count - 1 for sql, count in self.signatures.items() if count > 1}
+
+
+# Recorder of the request being measured. A context variable rather than a
+# per-connection wrapper: the ORM calls of an async view run in a worker
+# thread on that thread's connection, and sync_to_async copies the context.
+_active_recorder = ContextVar('query_recorder', default=None)
+
+
+def dispatch_query(execute, sql, params, many, context):
+    """Execute wrapper installed on every connection; hands the query to the active recorder, if any."""
+    recorder = _active_recorder.get()
+    if recorder is None:
+        return execute(sql, params, many, context)
+    return recorder(execute, sql, params, many, context)
+
+
+@contextmanager
+def recording(recorder):
+    """Pass the queries of this context, on every database alias, through `recorder`."""
+    token = _active_recorder.set(recorder)
+    try:
+        yield recorder
+    finally:
+        _active_recorder.reset(token)
+
+
+class QueryMetricsMiddleware:
+    """Record per-view query counts, SQL time, repeated queries and wall time for sampled requests."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.sample_rate = SAMPLE_RATE
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def _sampled(self):
+        return self.sample_rate and random.random() < self.sample_rate
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not self._sampled():
+            return self.get_response(request)
+        start = time.perf_counter()
+        with recording(QueryRecorder()) as recorder:
+            response = self.get_response(request)
+        return self._record(request, response, recorder, start)
+
+    async def __acall__(self, request):
+        if not self._sampled():
+            return await self.get_response(request)
+        start = time.perf_counter()
+        with recording(QueryRecorder()) as recorder:
+            response = await self.get_response(request)
+        return self._record(request, response, recorder, start)
+
+    def _record(self, request, response, recorder, start):
+        wall_ms = (time.perf_counter() - start) * 1000
+
+        match = getattr(request, 'resolver_match', None)
+        view_name = (match.view_name if match else None) or 'unresolved'
+        repeated = recorder.repeated()
+        sql_ms = recorder.seconds * 1000
+        record_request(view_name, recorder.count, sql_ms, wall_ms, repeated)
+
+        if RESPONSE_HEADER:
+            response['X-Query-Count'] = str(recorder.count)
+            response['X-Query-Time'] = f'{sql_ms:.1f}ms'
+            response['X-Query-Duplicates'] = str(sum(repeated.values()))
+        return response
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.18 on 2026-10-19 02:45
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0002_pdf_courses_and_progress'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CoursePage',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('page_number', models.PositiveIntegerField()),
+                ('pdf_file', models.FileField(upload_to='courses/pages/')),
+                ('preview', models.FileField(blank=True, upload_to='courses/previews/')),
+                ('size_bytes', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('course', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='pages', to='core.course')),
+            ],
+            options={
+                'ordering': ['course', 'page_number'],
+                'unique_together': {('course', 'page_number')},
+            },
+        ),
+    ]
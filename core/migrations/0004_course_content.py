@@ -0,0 +1,27 @@
+# Generated by Django 5.2.18 on 2026-10-19 02:46
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0003_course_pages'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CourseContent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source_path', models.CharField(max_length=500, unique=True)),
+                ('content_hash', models.CharField(max_length=64)),
+                ('page_count', models.PositiveIntegerField(default=0)),
+                ('page_text', models.BinaryField(default=bytes)),
+                ('outline', models.JSONField(blank=True, default=list)),
+                ('ingested_at', models.DateTimeField(auto_now=True)),
+                ('course', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='content', to='core.course')),
+            ],
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-19 02:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0005_background_jobs'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SegmentRecommendation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('interest', models.CharField(blank=True, max_length=100)),
+                ('skill_level', models.CharField(choices=[('beginner', 'Beginner'), ('intermediate', 'Intermediate'), ('advanced', 'Advanced')], max_length=20)),
+                ('content_type', models.CharField(max_length=50)),
+                ('catalog_version', models.CharField(max_length=40)),
+                ('entries', models.JSONField(blank=True, default=list)),
+                ('generated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'unique_together': {('interest', 'skill_level', 'content_type')},
+            },
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-19 02:55
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_segment_recommendations'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='course',
+            name='popularity_score',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.CreateModel(
+            name='CourseTrend',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('enroll_score', models.FloatField(default=0.0)),
+                ('read_score', models.FloatField(default=0.0)),
+                ('completion_score', models.FloatField(default=0.0)),
+                ('course', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='trend', to='core.course')),
+            ],
+        ),
+    ]
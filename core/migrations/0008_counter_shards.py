@@ -0,0 +1,37 @@
+# Generated by Django 5.2.18 on 2026-10-19 02:56
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_course_trends'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='course',
+            name='completion_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='course',
+            name='page_view_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.CreateModel(
+            name='CounterShard',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('field', models.CharField(choices=[('enrolled_count', 'Enrollments'), ('completion_count', 'Completions'), ('page_view_count', 'Page views')], max_length=30)),
+                ('shard', models.PositiveSmallIntegerField()),
+                ('delta', models.BigIntegerField(default=0)),
+                ('course', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='counter_shards', to='core.course')),
+            ],
+            options={
+                'unique_together': {('course', 'field', 'shard')},
+            },
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.2.18 on 2026-10-19 03:01
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_counter_shards'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserNeighbors',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('neighbors', models.JSONField(blank=True, default=list)),
+                ('built_at', models.DateTimeField()),
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='neighbors', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 5.2.18 on 2026-10-19 03:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0009_user_neighbors'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='course',
+            index=models.Index(fields=['category', 'total_pages'], name='core_course_categor_5b58c6_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='course',
+            index=models.Index(condition=models.Q(('summary_for_chat', ''), _negated=True), fields=['id'], name='core_course_chat_ready_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='enrollment',
+            index=models.Index(condition=models.Q(('is_completed', True)), fields=['user'], name='core_enrollment_completed_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='enrollment',
+            index=models.Index(fields=['user', '-enrolled_at'], name='core_enroll_user_id_31d6ac_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='feedback',
+            index=models.Index(condition=models.Q(('is_read', False)), fields=['user'], name='core_feedback_unread_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='feedback',
+            index=models.Index(fields=['user', '-created_at'], name='core_feedba_user_id_7fe6d8_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='quizattempt',
+            index=models.Index(fields=['user', '-attempted_at'], name='core_quizat_user_id_842b72_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='readingsession',
+            index=models.Index(fields=['user', '-started_at'], name='core_readin_user_id_4130ce_idx'),
+        ),
+    ]
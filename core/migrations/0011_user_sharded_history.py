@@ -0,0 +1,60 @@
+# Generated by Django 5.2.18 on 2026-10-19 03:27
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0010_query_pattern_indexes'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='activity',
+            name='user',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, related_name='activities', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterField(
+            model_name='chatmessage',
+            name='course',
+            field=models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='chat_messages', to='core.course'),
+        ),
+        migrations.AlterField(
+            model_name='chatmessage',
+            name='user',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, related_name='chat_messages', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterField(
+            model_name='pdfreadingprogress',
+            name='course',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, related_name='pdf_progress', to='core.course'),
+        ),
+        migrations.AlterField(
+            model_name='pdfreadingprogress',
+            name='user',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, related_name='pdf_progress', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterField(
+            model_name='quizattempt',
+            name='quiz',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, related_name='attempts', to='core.quiz'),
+        ),
+        migrations.AlterField(
+            model_name='quizattempt',
+            name='user',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, related_name='quiz_attempts', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterField(
+            model_name='readingsession',
+            name='course',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, related_name='reading_sessions', to='core.course'),
+        ),
+        migrations.AlterField(
+            model_name='readingsession',
+            name='user',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, related_name='reading_sessions', to=settings.AUTH_USER_MODEL),
+        ),
+    ]
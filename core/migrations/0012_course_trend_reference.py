@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-19 03:45
+
+import datetime
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0011_user_sharded_history'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='coursetrend',
+            name='reference',
+            field=models.DateTimeField(default=datetime.datetime(2025, 1, 1, 0, 0, tzinfo=datetime.timezone.utc)),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-19 03:47
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0012_course_trend_reference'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='coursetrend',
+            name='shard',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.AlterField(
+            model_name='coursetrend',
+            name='course',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='trends', to='core.course'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='coursetrend',
+            unique_together={('course', 'shard')},
+        ),
+    ]
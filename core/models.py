@@ -1,6 +1,11 @@
 from django.db import models
+from django.db.models import Q
 from django.contrib.auth.models import AbstractUser
 import json
+import zlib
+from datetime import datetime, timezone as dt_timezone
+
+from .sharding import UserShardedQuerySet
 
 class User(AbstractUser):
     """Extended User model with learning profile"""
@@ -68,7 +73,11 @@ class Course(models.Model):
     
     # Popularity metrics
     enrolled_count = models.IntegerField(default=0)
+    completion_count = models.IntegerField(default=0)
+    page_view_count = models.IntegerField(default=0)
     rating = models.FloatField(default=0.0)
+    # Rating blended with time-decayed activity (core.trending.fold_popularity); read as is by the engine
+    popularity_score = models.FloatField(null=True, blank=True)
     
     # Content metadata
     topics = models.JSONField(default=list, blank=True)
@@ -85,6 +94,12 @@ class Course(models.Model):
     
     class Meta:
         ordering = ['-rating', '-enrolled_count']
+        indexes = [
+            # Related-course lookups: category__in plus total_pages__gte
+            models.Index(fields=['category', 'total_pages']),
+            # Chat-ready PDF courses in id order; only the few courses with a summary are indexed
+            models.Index(fields=['id'], condition=~models.Q(summary_for_chat=''), name='core_course_chat_ready_idx'),
+        ]
     
     def __str__(self):
         return self.title
@@ -109,6 +124,12 @@ class Enrollment(models.Model):
     class Meta:
         unique_together = ['user', 'course']
         ordering = ['-enrolled_at']
+        # (user, course) joins to Course use the unique_together index
+        # Boolean filters compile to a bare column test, so they need a partial index rather than a composite one
+        indexes = [
+            models.Index(fields=['user'], condition=models.Q(is_completed=True), name='core_enrollment_completed_idx'),
+            models.Index(fields=['user', '-enrolled_at']),
+        ]
     
     def __str__(self):
         return f"{self.user.username} - {self.course.title}"
@@ -162,16 +183,22 @@ class Quiz(models.Model):
 class QuizAttempt(models.Model):
     """User quiz attempts with scoring"""
     
-    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='quiz_attempts')
-    quiz = models.ForeignKey(Quiz, on_delete=models.CASCADE, related_name='attempts')
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='quiz_attempts', db_constraint=False)
+    quiz = models.ForeignKey(Quiz, on_delete=models.CASCADE, related_name='attempts', db_constraint=False)
     selected_answer = models.IntegerField()
     is_correct = models.BooleanField(default=False)
     score = models.FloatField(default=0.0)
     
     attempted_at = models.DateTimeField(auto_now_add=True)
     
+    # Stored in the user's shard (core.sharding); foreign keys are not enforced by the database
+    objects = UserShardedQuerySet.as_manager()
+    
     class Meta:
         ordering = ['-attempted_at']
+        indexes = [
+            models.Index(fields=['user', '-attempted_at']),
+        ]
     
     def __str__(self):
         return f"{self.user.username} - Quiz Attempt ({self.score}%)"
@@ -189,7 +216,7 @@ class Activity(models.Model):
         ('content_viewed', 'Content Viewed'),
     ]
     
-    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='activities')
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='activities', db_constraint=False)
     activity_type = models.CharField(max_length=50, choices=ACTIVITY_TYPES)
     
     # Activity details (JSON for flexibility)
@@ -199,6 +226,9 @@ class Activity(models.Model):
     timestamp = models.DateTimeField(auto_now_add=True)
     session_duration = models.FloatField(default=0.0)  # in minutes
     
+    # Stored in the user's shard (core.sharding); foreign keys are not enforced by the database
+    objects = UserShardedQuerySet.as_manager()
+    
     class Meta:
         ordering = ['-timestamp']
         indexes = [
@@ -243,11 +273,14 @@ class Recommendation(models.Model):
 
 class PDFReadingProgress(models.Model):
     """Tracks PDF reading progress page by page (persists on exit)."""
-    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='pdf_progress')
-    course = models.ForeignKey(Course, on_delete=models.CASCADE, related_name='pdf_progress')
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='pdf_progress', db_constraint=False)
+    course = models.ForeignKey(Course, on_delete=models.CASCADE, related_name='pdf_progress', db_constraint=False)
     last_page_read = models.PositiveIntegerField(default=1)
     updated_at = models.DateTimeField(auto_now=True)
     
+    # Stored in the user's shard (core.sharding); foreign keys are not enforced by the database
+    objects = UserShardedQuerySet.as_manager()
+    
     class Meta:
         unique_together = ['user', 'course']
         ordering = ['-updated_at']
@@ -256,17 +289,64 @@ class PDFReadingProgress(models.Model):
         return f"{self.user.username} - {self.course.title} (page {self.last_page_read})"
 
 
+class CoursePage(models.Model):
+    """Single page of a course PDF, split out for lazy page-by-page delivery."""
+    course = models.ForeignKey(Course, on_delete=models.CASCADE, related_name='pages')
+    page_number = models.PositiveIntegerField()
+    pdf_file = models.FileField(upload_to='courses/pages/')
+    preview = models.FileField(upload_to='courses/previews/', blank=True)
+    size_bytes = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        unique_together = ['course', 'page_number']
+        ordering = ['course', 'page_number']
+    
+    def __str__(self):
+        return f"{self.course.title} - page {self.page_number}"
+
+
+class CourseContent(models.Model):
+    """Extracted PDF text for a course: one compact row per course (see ingest_pdfs)."""
+    course = models.OneToOneField(Course, on_delete=models.CASCADE, related_name='content')
+    source_path = models.CharField(max_length=500, unique=True)
+    content_hash = models.CharField(max_length=64)
+    page_count = models.PositiveIntegerField(default=0)
+    page_text = models.BinaryField(default=bytes)  # zlib-compressed JSON list, one string per page
+    outline = models.JSONField(default=list, blank=True)  # [{'title', 'page', 'level'}]
+    ingested_at = models.DateTimeField(auto_now=True)
+    
+    def __str__(self):
+        return f"{self.course.title} ({self.page_count} pages)"
+    
+    @staticmethod
+    def pack_pages(pages):
+        return zlib.compress(json.dumps(pages).encode('utf-8'), 6)
+    
+    def get_pages(self):
+        """Page texts as a list (index 0 is page 1)."""
+        if not self.page_text:
+            return []
+        return json.loads(zlib.decompress(bytes(self.page_text)).decode('utf-8'))
+
+
 class ReadingSession(models.Model):
     """Tracks reading sessions for habits and speed (pages per minute)."""
-    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='reading_sessions')
-    course = models.ForeignKey(Course, on_delete=models.CASCADE, related_name='reading_sessions')
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='reading_sessions', db_constraint=False)
+    course = models.ForeignKey(Course, on_delete=models.CASCADE, related_name='reading_sessions', db_constraint=False)
     started_at = models.DateTimeField(auto_now_add=True)
     ended_at = models.DateTimeField(null=True, blank=True)
     pages_read = models.PositiveIntegerField(default=0)
     duration_minutes = models.FloatField(default=0.0)
     
+    # Stored in the user's shard (core.sharding); foreign keys are not enforced by the database
+    objects = UserShardedQuerySet.as_manager()
+    
     class Meta:
         ordering = ['-started_at']
+        indexes = [
+            models.Index(fields=['user', '-started_at']),
+        ]
     
     def __str__(self):
         return f"{self.user.username} - {self.course.title} ({self.pages_read} pages)"
@@ -275,12 +355,15 @@ class ReadingSession(models.Model):
 class ChatMessage(models.Model):
     """Chatbot Q&A; optional course context for answers."""
     ROLE_CHOICES = [('user', 'User'), ('assistant', 'Assistant')]
-    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='chat_messages')
-    course = models.ForeignKey(Course, on_delete=models.CASCADE, related_name='chat_messages', null=True, blank=True)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='chat_messages', db_constraint=False)
+    course = models.ForeignKey(Course, on_delete=models.CASCADE, related_name='chat_messages', null=True, blank=True, db_constraint=False)
     role = models.CharField(max_length=20, choices=ROLE_CHOICES)
     content = models.TextField()
     created_at = models.DateTimeField(auto_now_add=True)
     
+    # Stored in the user's shard (core.sharding); foreign keys are not enforced by the database
+    objects = UserShardedQuerySet.as_manager()
+    
     class Meta:
         ordering = ['created_at']
     
@@ -310,6 +393,125 @@ class Feedback(models.Model):
     
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['user'], condition=models.Q(is_read=False), name='core_feedback_unread_idx'),
+            models.Index(fields=['user', '-created_at']),
+        ]
+    
+    def __str__(self):
+        return f"{self.feedback_type.upper()}: {self.title}"
+
+
+class BackgroundJob(models.Model):
+    """Queued background work (e.g. recommendation refresh), executed by run_job_workers."""
+    
+    STATUSES = [
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    ]
+    ACTIVE_STATUSES = ['queued', 'running']
+    
+    kind = models.CharField(max_length=50)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='jobs', null=True, blank=True)
+    # Jobs sharing a dedupe key are coalesced while one of them is queued or running
+    dedupe_key = models.CharField(max_length=200, blank=True)
+    payload = models.JSONField(default=dict, blank=True)
+    
+    status = models.CharField(max_length=20, choices=STATUSES, default='queued')
+    progress = models.FloatField(default=0.0)  # 0-100
+    result = models.JSONField(default=dict, blank=True)
+    error = models.TextField(blank=True)
+    attempts = models.PositiveIntegerField(default=0)
+    worker = models.CharField(max_length=100, blank=True)
+    
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        ordering = ['created_at']
+        indexes = [
+            models.Index(fields=['status', 'created_at']),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=['dedupe_key'],
+                condition=Q(status__in=['queued', 'running']) & ~Q(dedupe_key=''),
+                name='unique_active_job_dedupe_key',
+            ),
+        ]
+    
+    def __str__(self):
+        return f"{self.kind} #{self.id} ({self.status})"
+
+
+class SegmentRecommendation(models.Model):
+    """Precomputed cold-start top-N course list for one learner profile segment."""
+    
+    # '' is the segment for learners who picked no interests
+    interest = models.CharField(max_length=100, blank=True)
+    skill_level = models.CharField(max_length=20, choices=User.SKILL_LEVELS)
+    content_type = models.CharField(max_length=50)
+    catalog_version = models.CharField(max_length=40)
+    # [{'course_id', 'total_score', 'factor_scores', 'reasons'}, ...] best first
+    entries = models.JSONField(default=list, blank=True)
+    generated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        unique_together = ['interest', 'skill_level', 'content_type']
+    
+    def __str__(self):
+        return f"{self.interest or 'No interests'} / {self.skill_level} / {self.content_type}"
+
+
+class CourseTrend(models.Model):
+    """One of a course's sharded rows of forward-decayed activity counters (see core.trending)."""
+    
+    course = models.ForeignKey(Course, on_delete=models.CASCADE, related_name='trends')
+    shard = models.PositiveSmallIntegerField(default=0)
+    enroll_score = models.FloatField(default=0.0)
+    read_score = models.FloatField(default=0.0)
+    completion_score = models.FloatField(default=0.0)
+    # Time the scores are relative to; moved forward by core.trending as time passes
+    reference = models.DateTimeField(default=datetime(2025, 1, 1, tzinfo=dt_timezone.utc))
+    
+    class Meta:
+        unique_together = ['course', 'shard']
+    
+    def __str__(self):
+        return f"Trend for {self.course.title} [{self.shard}]"
+
+
+class CounterShard(models.Model):
+    """Unreconciled increments for a hot Course counter, spread over several rows (see core.counters)."""
+    
+    FIELDS = [
+        ('enrolled_count', 'Enrollments'),
+        ('completion_count', 'Completions'),
+        ('page_view_count', 'Page views'),
+    ]
+    
+    course = models.ForeignKey(Course, on_delete=models.CASCADE, related_name='counter_shards')
+    field = models.CharField(max_length=30, choices=FIELDS)
+    shard = models.PositiveSmallIntegerField()
+    delta = models.BigIntegerField(default=0)
+    
+    class Meta:
+        unique_together = ['course', 'field', 'shard']
+    
+    def __str__(self):
+        return f"{self.course_id}.{self.field}[{self.shard}] += {self.delta}"
+
+
+class UserNeighbors(models.Model):
+    """Precomputed most similar learners for one user (see core.neighbors)."""
+    
+    user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='neighbors')
+    # [[user_id, cosine similarity], ...] most similar first
+    neighbors = models.JSONField(default=list, blank=True)
+    built_at = models.DateTimeField()
     
     def __str__(self):
-        return f"{self.feedback_type.upper()}: {self.title}"
\ No newline at end of file
+        return f"Neighbors of {self.user.username}"
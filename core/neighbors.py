@@ -0,0 +1,244 @@
+"""
+"Learners like you": offline top-k similar users from learning activity.
+
+Each learner becomes a vector over courses (enrolled, progress through the
+course or its PDF, quiz scores), L2-normalized so a dot product is cosine
+similarity. The vectors live in a disk-backed NumPy memmap; worker
+processes each take a block of query users and multiply it against the
+matrix one block of users at a time, keeping a running top-k, so memory
+per worker is O(block^2) whatever the number of users. Results are stored
+per user in UserNeighbors and read by the recommendation engine.
+
+Catalogs with more than MAX_DIMS courses are hashed into MAX_DIMS columns
+(signed feature hashing) to bound the matrix width.
+"""
+
+import os
+import zlib
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+from django.conf import settings
+from django.db.models import Count, Sum
+from django.utils import timezone
+
+from .models import Course, Enrollment, PDFReadingProgress, Quiz, QuizAttempt, UserNeighbors
+from .sharding import history_aliases
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - optional dependency
+    np = None
+
+_neighbor_settings = getattr(settings, 'USER_NEIGHBORS', {})
+TOP_K = _neighbor_settings.get('TOP_K', 20)
+BLOCK_SIZE = _neighbor_settings.get('BLOCK_SIZE', 2048)
+MAX_DIMS = _neighbor_settings.get('MAX_DIMS', 1024)
+WRITE_BATCH = 1000
+
+
+def _hashed_column(course_id, dims):
+    """Matrix column and sign for a course when the catalog is hashed."""
+    digest = zlib.crc32(str(course_id).encode('ascii'))
+    return digest % dims, (1.0 if digest & 0x80000000 else -1.0)
+
+
+def learner_signals():
+    """
+    Per (user, course) activity strength from enrollments, reading progress and quizzes
+
+    Returns:
+        Dictionary of (user_id, course_id) -> weight
+    """
+    weights = {}
+    progress = {}
+    rows = Enrollment.objects.values_list('user_id', 'course_id', 'progress_percentage', 'is_completed')
+    for user_id, course_id, percentage, is_completed in rows.iterator(chunk_size=10000):
+        weights[(user_id, course_id)] = 1.0
+        progress[(user_id, course_id)] = 1.0 if is_completed else (percentage or 0) / 100.0
+
+    # Reading progress and quiz attempts may be spread over user shards, which
+    # hold no courses or quizzes: join those in Python
+    total_pages = dict(Course.objects.values_list('id', 'total_pages'))
+    quiz_courses = dict(Quiz.objects.values_list('id', 'lesson__course_id'))
+    scores = {}
+    for alias in history_aliases():
+        reading = PDFReadingProgress.objects.using(alias).order_by().values_list('user_id', 'course_id', 'last_page_read')
+        for user_id, course_id, page in reading.iterator(chunk_size=10000):
+            key = (user_id, course_id)
+            pages = total_pages.get(course_id)
+            progress[key] = max(progress.get(key, 0.0), min(page / max(pages or 1, 1), 1.0))
+
+        quizzes = (
+            QuizAttempt.objects.using(alias).order_by().values('user_id', 'quiz_id')
+            .annotate(total=Sum('score'), attempts=Count('score')).values_list('user_id', 'quiz_id', 'total', 'attempts')
+        )
+        for user_id, quiz_id, total, attempts in quizzes.iterator(chunk_size=10000):
+            if quiz_id not in quiz_courses or not attempts:
+                continue
+            key = (user_id, quiz_courses[quiz_id])
+            score_total, score_count = scores.get(key, (0.0, 0))
+            scores[key] = (score_total + (total or 0), score_count + attempts)
+    for key, (total, attempts) in scores.items():
+        weights[key] = weights.get(key, 0.0) + 0.5 * (total / attempts) / 100.0
+
+    for key, value in progress.items():
+        weights[key] = weights.get(key, 0.0) + 0.5 * value
+    return weights
+
+
+def build_matrix(path, weights):
+    """
+    Write normalized learner vectors to a float32 memmap
+
+    Returns:
+        Tuple of (list of user ids in row order, matrix shape)
+    """
+    user_ids = sorted({user_id for user_id, _ in weights})
+    course_ids = sorted({course_id for _, course_id in weights})
+    hashed = len(course_ids) > MAX_DIMS
+    if hashed:
+        dims = MAX_DIMS
+    else:
+        dims = max(len(course_ids), 1)
+        columns = {course_id: i for i, course_id in enumerate(course_ids)}
+    rows = {user_id: i for i, user_id in enumerate(user_ids)}
+
+    shape = (max(len(user_ids), 1), dims)
+    matrix = np.lib.format.open_memmap(path, mode='w+', dtype=np.float32, shape=shape)
+    count = len(weights)
+    row_index = np.empty(count, dtype=np.int64)
+    column_index = np.empty(count, dtype=np.int64)
+    values = np.empty(count, dtype=np.float32)
+    for i, ((user_id, course_id), weight) in enumerate(weights.items()):
+        if hashed:
+            column, sign = _hashed_column(course_id, dims)
+        else:
+            column, sign = columns[course_id], 1.0
+        row_index[i] = rows[user_id]
+        column_index[i] = column
+        values[i] = sign * weight
+    # add.at accumulates hashed collisions instead of overwriting them
+    np.add.at(matrix, (row_index, column_index), values)
+
+    for start in range(0, shape[0], BLOCK_SIZE):
+        block = matrix[start:start + BLOCK_SIZE]
+        norms = np.linalg.norm(block, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        block /= norms
+    matrix.flush()
+    del matrix
+    return user_ids, shape
+
+
+def top_k_block(path, start, stop, k, block_size):
+    """
+    Top-k most similar rows for rows [start, stop) of the matrix at `path`
+
+    Runs in a worker process; only needs NumPy.
+
+    Returns:
+        Tuple of (start, neighbor row indexes, similarities), each array shaped (rows, k)
+    """
+    matrix = np.load(path, mmap_mode='r')
+    queries = np.asarray(matrix[start:stop])
+    count = stop - start
+    best_index = np.full((count, k), -1, dtype=np.int64)
+    best_score = np.full((count, k), -np.inf, dtype=np.float32)
+    local = np.arange(count)
+
+    for other in range(0, matrix.shape[0], block_size):
+        candidates = np.asarray(matrix[other:other + block_size])
+        scores = queries @ candidates.T
+        # A learner is not their own neighbor
+        overlap = (local + start >= other) & (local + start < other + candidates.shape[0])
+        scores[local[overlap], local[overlap] + start - other] = -np.inf
+
+        merged_score = np.concatenate([best_score, scores], axis=1)
+        merged_index = np.concatenate(
+            [best_index, np.broadcast_to(np.arange(other, other + candidates.shape[0]), scores.shape)], axis=1
+        )
+        keep = min(k, merged_score.shape[1])
+        top = np.argpartition(-merged_score, keep - 1, axis=1)[:, :keep]
+        best_score = np.take_along_axis(merged_score, top, axis=1)
+        best_index = np.take_along_axis(merged_index, top, axis=1)
+
+    order = np.argsort(-best_score, axis=1)
+    return start, np.take_along_axis(best_index, order, axis=1), np.take_along_axis(best_score, order, axis=1)
+
+
+def _save(rows):
+    UserNeighbors.objects.bulk_create(
+        rows,
+        update_conflicts=True,
+        unique_fields=['user'],
+        update_fields=['neighbors', 'built_at'],
+    )
+
+
+def build_neighbors(workers=None, k=TOP_K, block_size=BLOCK_SIZE, progress_callback=None):
+    """
+    Recompute and store the top-k neighbors of every learner with activity
+
+    Args:
+        workers: Worker processes (defaults to the number of CPUs)
+        k: Neighbors kept per learner
+        block_size: Users per matrix block
+        progress_callback: Optional callable receiving percent complete (0-100)
+
+    Returns:
+        Number of learners whose neighbors were stored
+    """
+    if np is None:
+        raise RuntimeError('NumPy is required to build learner neighbors (pip install numpy)')
+    workdir = Path(settings.DATA_DIR) / 'neighbors'
+    workdir.mkdir(parents=True, exist_ok=True)
+    path = str(workdir / f'vectors-{os.getpid()}.npy')
+
+    try:
+        user_ids, shape = build_matrix(path, learner_signals())
+        if not user_ids:
+            return 0
+        blocks = [(start, min(start + block_size, shape[0])) for start in range(0, shape[0], block_size)]
+        now = timezone.now()
+        stored = 0
+        with ProcessPoolExecutor(max_workers=workers or os.cpu_count() or 1) as pool:
+            futures = [pool.submit(top_k_block, path, start, stop, k, block_size) for start, stop in blocks]
+            for done, future in enumerate(as_completed(futures), start=1):
+                start, indexes, scores = future.result()
+                rows = []
+                for offset in range(indexes.shape[0]):
+                    neighbors = [
+                        [user_ids[index], round(float(score), 4)]
+                        for index, score in zip(indexes[offset], scores[offset])
+                        if index >= 0 and score > 0
+                    ]
+                    rows.append(UserNeighbors(user_id=user_ids[start + offset], neighbors=neighbors, built_at=now))
+                for batch_start in range(0, len(rows), WRITE_BATCH):
+                    _save(rows[batch_start:batch_start + WRITE_BATCH])
+                stored += len(rows)
+                if progress_callback:
+                    progress_callback(100.0 * done / len(futures))
+        return stored
+    finally:
+        Path(path).unlink(missing_ok=True)
+
+
+def neighbor_courses(user, exclude=()):
+    """
+    Courses taken by the user's precomputed neighbors
+
+    Returns:
+        Dictionary of course id -> share of neighbor similarity (0.0 to 1.0)
+    """
+    row = UserNeighbors.objects.filter(user=user).values_list('neighbors', flat=True).first()
+    if not row:
+        return {}
+    similarity = {user_id: score for user_id, score in row}
+    total = sum(similarity.values()) or 1.0
+    courses = {}
+    taken = Enrollment.objects.filter(user_id__in=similarity).values_list('user_id', 'course_id')
+    for neighbor_id, course_id in taken:
+        if course_id not in exclude:
+            courses[course_id] = courses.get(course_id, 0.0) + similarity[neighbor_id] / total
+    return courses
@@ -0,0 +1,142 @@
+"""
+PDF page splitting for course PDFs.
+
+Splits a course PDF into one single-page PDF per page (plus an optional
+low-resolution PNG preview) so the reader can fetch page N on its own
+instead of downloading the whole document up front.
+"""
+
+import io
+import posixpath
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.utils import timezone
+
+from .catalog import bump_catalog_version
+from .models import Course, CoursePage
+
+try:
+    from pypdf import PdfReader, PdfWriter
+except ImportError:  # pragma: no cover - optional dependency
+    PdfReader = PdfWriter = None
+
+try:
+    import fitz  # PyMuPDF, only used for preview renders
+except ImportError:  # pragma: no cover - optional dependency
+    fitz = None
+
+
+PREVIEW_DPI = 48
+
+
+class PDFSplitError(Exception):
+    """Raised when a course PDF cannot be split into pages."""
+
+
+def page_asset_name(course_id, page_number, ext):
+    """Storage name for a split page asset, e.g. courses/pages/3/page-0007.pdf"""
+    folder = 'pages' if ext == 'pdf' else 'previews'
+    return posixpath.join('courses', folder, str(course_id), f'page-{page_number:04d}.{ext}')
+
+
+def page_version(course):
+    """
+    Token for the URLs of a course's split pages
+
+    Page assets keep their names across re-splits, so the URLs carry this
+    token instead; a split moves Course.updated_at and with it the token.
+    """
+    return format(int(course.updated_at.timestamp() * 1e6), 'x')
+
+
+def _save_asset(name, data):
+    """Write bytes to storage under a fixed name, replacing any previous file."""
+    if default_storage.exists(name):
+        default_storage.delete(name)
+    return default_storage.save(name, ContentFile(data))
+
+
+def _remove_stale_assets(course_id, keep):
+    """Delete page assets of a course that are not in `keep`, e.g. after a re-split into fewer pages."""
+    for folder in ('pages', 'previews'):
+        directory = posixpath.join('courses', folder, str(course_id))
+        if not default_storage.exists(directory):
+            continue
+        for filename in default_storage.listdir(directory)[1]:
+            name = posixpath.join(directory, filename)
+            if name not in keep:
+                default_storage.delete(name)
+
+
+def _render_previews(pdf_bytes):
+    """Render a small PNG for every page. Returns a list (empty without PyMuPDF)."""
+    if fitz is None:
+        return []
+    previews = []
+    with fitz.open(stream=pdf_bytes, filetype='pdf') as doc:
+        for page in doc:
+            previews.append(page.get_pixmap(dpi=PREVIEW_DPI).tobytes('png'))
+    return previews
+
+
+def split_course_pdf(course, force=False):
+    """
+    Split a course PDF into per-page assets and CoursePage rows
+
+    Args:
+        course: Course with a pdf_file
+        force: Re-split even if pages already exist
+
+    Returns:
+        Number of pages written (0 if the course was already split)
+    """
+    if PdfReader is None:
+        raise PDFSplitError('pypdf is required to split course PDFs (pip install pypdf)')
+    if not course.pdf_file:
+        raise PDFSplitError(f'Course {course.id} has no PDF file')
+    if not force and course.pages.exists():
+        return 0
+
+    with course.pdf_file.open('rb') as fh:
+        pdf_bytes = fh.read()
+    try:
+        reader = PdfReader(io.BytesIO(pdf_bytes))
+        page_count = len(reader.pages)
+    except Exception as e:
+        raise PDFSplitError(f'Could not read {course.pdf_file.name}: {e}')
+
+    previews = _render_previews(pdf_bytes)
+
+    pages = []
+    for index, page in enumerate(reader.pages):
+        page_number = index + 1
+        writer = PdfWriter()
+        writer.add_page(page)
+        buf = io.BytesIO()
+        writer.write(buf)
+        data = buf.getvalue()
+
+        pdf_name = _save_asset(page_asset_name(course.id, page_number, 'pdf'), data)
+        preview_name = ''
+        if index < len(previews):
+            preview_name = _save_asset(page_asset_name(course.id, page_number, 'png'), previews[index])
+
+        pages.append(CoursePage(
+            course=course,
+            page_number=page_number,
+            pdf_file=pdf_name,
+            preview=preview_name,
+            size_bytes=len(data),
+        ))
+
+    with transaction.atomic():
+        CoursePage.objects.filter(course=course).delete()
+        CoursePage.objects.bulk_create(pages)
+        # A queryset update skips auto_now and post_save; move updated_at so the catalog version changes
+        Course.objects.filter(id=course.id).update(total_pages=page_count, updated_at=timezone.now())
+    bump_catalog_version()
+    course.total_pages = page_count
+    _remove_stale_assets(course.id, {name for page in pages for name in (page.pdf_file.name, page.preview.name) if name})
+    return page_count
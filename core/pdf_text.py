@@ -0,0 +1,80 @@
+"""
+PDF text extraction used by the ingest_pdfs command.
+
+Everything here is plain Python (no ORM access) so it can run inside
+worker processes of a process pool.
+"""
+
+import hashlib
+
+try:
+    from pypdf import PdfReader
+except ImportError:  # pragma: no cover - optional dependency
+    PdfReader = None
+
+
+CHUNK_SIZE = 1024 * 1024
+
+
+def file_sha256(path):
+    """Hex SHA-256 of a file's content."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as fh:
+        for chunk in iter(lambda: fh.read(CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _flatten_outline(reader, items, level=0):
+    """Turn pypdf's nested outline into [{'title', 'page', 'level'}]."""
+    entries = []
+    for item in items:
+        if isinstance(item, list):
+            entries.extend(_flatten_outline(reader, item, level + 1))
+            continue
+        try:
+            page = reader.get_destination_page_number(item) + 1
+        except Exception:
+            page = None
+        title = (getattr(item, 'title', '') or '').strip()
+        if title:
+            entries.append({'title': title, 'page': page, 'level': level})
+    return entries
+
+
+def extract_pdf(path):
+    """
+    Extract page count, per-page text and outline from a PDF
+
+    Args:
+        path: Filesystem path of the PDF
+
+    Returns:
+        Dictionary with 'path', 'page_count', 'pages', 'outline', 'title'
+        and 'error' (None on success)
+    """
+    result = {'path': path, 'page_count': 0, 'pages': [], 'outline': [], 'title': '', 'error': None}
+    if PdfReader is None:
+        result['error'] = 'pypdf is not installed'
+        return result
+    try:
+        reader = PdfReader(path)
+        pages = []
+        for page in reader.pages:
+            try:
+                text = page.extract_text() or ''
+            except Exception:
+                text = ''
+            pages.append(' '.join(text.split()))
+        result['pages'] = pages
+        result['page_count'] = len(pages)
+        try:
+            result['outline'] = _flatten_outline(reader, reader.outline)
+        except Exception:
+            result['outline'] = []
+        metadata = reader.metadata
+        if metadata and metadata.title:
+            result['title'] = str(metadata.title).strip()
+    except Exception as e:
+        result['error'] = str(e)
+    return result
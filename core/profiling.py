@@ -0,0 +1,339 @@
+"""
+Opt-in request profiling and named timing spans.
+
+ProfilingMiddleware profiles a request when one of these applies:
+
+* a staff user adds `?profile=1` (or `?profile=cprofile` / `?profile=sample`),
+* the request carries `X-Profile: <PROFILING['HEADER_TOKEN']>`,
+* the URL name is listed in PROFILING['SAMPLE_RATES'] and the request is sampled.
+
+The view runs under cProfile or a lightweight stack sampler and the result
+is written as collapsed stacks (`frame;frame;frame count`, the input format
+of flamegraph.pl and speedscope) into a bounded on-disk ring buffer under
+PROFILING['DIR']. Staff can list and download profiles from `/api/profiles/`.
+
+`span(name)` / `@timed(name)` time engine internals. Span durations always
+feed per-process rolling histograms (shown next to the query metrics); on a
+profiled request they are also returned in a `Server-Timing` header.
+"""
+
+import contextvars
+import cProfile
+import functools
+import os
+import pstats
+import random
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from pathlib import Path
+
+from asgiref.sync import async_to_sync, iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+
+from .middleware import MS_BUCKETS, RollingHistogram
+
+_profiling_settings = getattr(settings, 'PROFILING', {})
+# 'sample' (stack sampler, low overhead) or 'cprofile' (deterministic, slower)
+DEFAULT_MODE = _profiling_settings.get('MODE', 'sample')
+SAMPLE_RATES = _profiling_settings.get('SAMPLE_RATES', {})
+HEADER_TOKEN = _profiling_settings.get('HEADER_TOKEN', '')
+SAMPLE_INTERVAL = _profiling_settings.get('INTERVAL', 0.005)
+PROFILE_DIR = Path(_profiling_settings.get('DIR', Path(settings.DATA_DIR) / 'profiles'))
+MAX_PROFILES = _profiling_settings.get('MAX_FILES', 200)
+MODES = ('sample', 'cprofile')
+# Deepest stack written; deeper frames are cut at the root end
+MAX_DEPTH = 128
+
+_PROFILE_NAME_RE = re.compile(r'^[\w.-]+\.folded$')
+_SERVER_TIMING_NAME_RE = re.compile(r'[^\w.-]')
+
+
+# ==================== Spans ====================
+
+_span_histograms = {}
+_span_lock = threading.Lock()
+# (name, milliseconds) spans of the current profiled request, None otherwise
+_request_spans = contextvars.ContextVar('request_spans', default=None)
+
+
+def record_span(name, ms):
+    with _span_lock:
+        histogram = _span_histograms.get(name)
+        if histogram is None:
+            histogram = _span_histograms[name] = RollingHistogram(MS_BUCKETS)
+        histogram.observe(ms)
+    collected = _request_spans.get()
+    if collected is not None:
+        collected.append((name, ms))
+
+
+@contextmanager
+def span(name):
+    """Time the enclosed block as a named span."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_span(name, (time.perf_counter() - start) * 1000)
+
+
+def timed(name):
+    """Decorator form of span()."""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def span_snapshot():
+    """Dictionary of span name -> rolling histogram snapshot (milliseconds)."""
+    now = time.time()
+    with _span_lock:
+        return {name: histogram.snapshot(now) for name, histogram in sorted(_span_histograms.items())}
+
+
+# ==================== Profilers ====================
+
+def _frame_label(code):
+    return f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})'
+
+
+class StackSampler:
+    """Sample the stack of the thread that starts it every `interval` seconds from a background thread."""
+
+    def __init__(self, interval=SAMPLE_INTERVAL):
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        target = threading.get_ident()
+        self._thread = threading.Thread(target=self._run, args=(target,), daemon=True, name='stack-sampler')
+        self._thread.start()
+
+    def _run(self, target):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(target)
+            labels = []
+            while frame is not None and len(labels) < MAX_DEPTH:
+                labels.append(_frame_label(frame.f_code))
+                frame = frame.f_back
+            if labels:
+                self.stacks[';'.join(reversed(labels))] += 1
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def collapsed(self):
+        """Collapsed stacks weighted by sample count."""
+        return [f'{stack} {count}' for stack, count in self.stacks.most_common()]
+
+
+class CProfiler:
+    """
+    cProfile around the view, exported as collapsed stacks
+
+    cProfile only records caller/callee pairs, so each function's own time
+    is attributed to the path through its most expensive callers. This is an
+    approximation of the real stacks that is good enough for a flamegraph.
+    """
+
+    def __init__(self):
+        self.profile = cProfile.Profile()
+
+    def start(self):
+        self.profile.enable()
+
+    def stop(self):
+        self.profile.disable()
+
+    def collapsed(self):
+        """Collapsed stacks weighted by own time in microseconds."""
+        stats = pstats.Stats(self.profile).stats
+        lines = []
+        for func, (_, _, own_time, _, callers) in stats.items():
+            weight = int(own_time * 1e6)
+            if weight <= 0:
+                continue
+            path, seen = [func], {func}
+            while callers and len(path) < MAX_DEPTH:
+                caller = max(callers, key=lambda c: callers[c][3])
+                if caller in seen:
+                    break
+                path.append(caller)
+                seen.add(caller)
+                callers = stats.get(caller, (0, 0, 0, 0, {}))[4]
+            labels = [f'{name} ({os.path.basename(filename)}:{line})' for filename, line, name in reversed(path)]
+            lines.append(f"{';'.join(labels)} {weight}")
+        return lines
+
+
+# ==================== On-disk ring buffer ====================
+
+class ProfileStore:
+    """Collapsed-stack files in one directory, keeping only the newest `max_files`."""
+
+    def __init__(self, directory=PROFILE_DIR, max_files=MAX_PROFILES):
+        self.directory = Path(directory)
+        self.max_files = max_files
+
+    def save(self, view_name, mode, lines):
+        """
+        Write one profile and drop the oldest beyond max_files
+
+        Returns:
+            File name of the new profile
+        """
+        self.directory.mkdir(parents=True, exist_ok=True)
+        slug = re.sub(r'[^\w.-]+', '_', view_name)
+        # Time first so names sort oldest to newest across processes
+        name = f'{time.time_ns()}-{os.getpid()}-{slug}-{mode}.folded'
+        tmp = self.directory / f'.{name}.tmp'
+        tmp.write_text('\n'.join(lines) + '\n')
+        os.replace(tmp, self.directory / name)
+        self._prune()
+        return name
+
+    def _prune(self):
+        names = self.names()
+        for name in names[:max(0, len(names) - self.max_files)]:
+            (self.directory / name).unlink(missing_ok=True)
+
+    def names(self):
+        """Profile file names, oldest first."""
+        if not self.directory.is_dir():
+            return []
+        return sorted(name for name in os.listdir(self.directory) if _PROFILE_NAME_RE.match(name))
+
+    def read(self, name):
+        """Contents of a stored profile, or None for unknown names."""
+        if not _PROFILE_NAME_RE.match(name):
+            return None
+        try:
+            return (self.directory / name).read_text()
+        except FileNotFoundError:
+            return None
+
+
+profile_store = ProfileStore()
+# One profiler per process at a time: cProfile and the sampler both watch a single thread
+_profiler_lock = threading.Lock()
+
+
+class ProfilingMiddleware:
+    """
+    Profile selected requests around the view; place after AuthenticationMiddleware
+
+    A profiled view is called from process_view so the profiler runs in the
+    thread that executes it: the request thread under WSGI, the request's
+    thread-sensitive worker for sync views under ASGI, the event loop for
+    async views (where other requests' coroutines can show up in samples).
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+            self.process_view = self._aprocess_view
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return self.get_response(request)
+
+    async def __acall__(self, request):
+        return await self.get_response(request)
+
+    def _mode(self, request, user):
+        """Profiling mode for this request, or None when it is not profiled."""
+        requested = request.GET.get('profile')
+        if requested and user is not None and user.is_staff:
+            return requested if requested in MODES else DEFAULT_MODE
+        if HEADER_TOKEN and request.headers.get('X-Profile') == HEADER_TOKEN:
+            return DEFAULT_MODE
+        rate = SAMPLE_RATES.get(request.resolver_match.view_name) if SAMPLE_RATES else None
+        if rate and random.random() < rate:
+            return DEFAULT_MODE
+        return None
+
+    def _claim(self, request, user):
+        """Mode to profile this request with, holding the profiler lock, or None."""
+        mode = self._mode(request, user)
+        if mode is None or not _profiler_lock.acquire(blocking=False):
+            return None
+        return mode
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        mode = self._claim(request, getattr(request, 'user', None))
+        if mode is None:
+            return None
+        if iscoroutinefunction(view_func):
+            return async_to_sync(self._profile_async_view)(mode, request, view_func, view_args, view_kwargs)
+        return self._profile_view(mode, request, view_func, view_args, view_kwargs)
+
+    async def _aprocess_view(self, request, view_func, view_args, view_kwargs):
+        # request.user would query the database from the event loop; only resolve it when asked to
+        user = await request.auser() if request.GET.get('profile') and hasattr(request, 'auser') else None
+        mode = self._claim(request, user)
+        if mode is None:
+            return None
+        if iscoroutinefunction(view_func):
+            return await self._profile_async_view(mode, request, view_func, view_args, view_kwargs)
+        return await sync_to_async(self._profile_view)(mode, request, view_func, view_args, view_kwargs)
+
+    def _profile_view(self, mode, request, view_func, view_args, view_kwargs):
+        profiler, spans_token = self._start(mode)
+        try:
+            response = view_func(request, *view_args, **view_kwargs)
+        finally:
+            spans = self._stop(profiler, spans_token)
+        return self._finish(request, response, profiler, mode, spans)
+
+    async def _profile_async_view(self, mode, request, view_func, view_args, view_kwargs):
+        profiler, spans_token = self._start(mode)
+        try:
+            response = await view_func(request, *view_args, **view_kwargs)
+        finally:
+            spans = self._stop(profiler, spans_token)
+        return await sync_to_async(self._finish)(request, response, profiler, mode, spans)
+
+    def _start(self, mode):
+        """Start a profiler on the calling thread (the lock is already held)."""
+        profiler = CProfiler() if mode == 'cprofile' else StackSampler()
+        spans_token = _request_spans.set([])
+        profiler.start()
+        return profiler, spans_token
+
+    def _stop(self, profiler, spans_token):
+        """
+        Stop the profiler and release the lock
+
+        Returns:
+            (name, milliseconds) spans recorded while it ran
+        """
+        try:
+            profiler.stop()
+            return _request_spans.get() or []
+        finally:
+            _request_spans.reset(spans_token)
+            _profiler_lock.release()
+
+    def _finish(self, request, response, profiler, mode, spans):
+        response['X-Profile-Id'] = profile_store.save(request.resolver_match.view_name, mode, profiler.collapsed())
+        if spans:
+            response['Server-Timing'] = ', '.join(
+                f'{_SERVER_TIMING_NAME_RE.sub("_", span_name)};dur={ms:.1f}' for span_name, ms in spans
+            )
+        return response
@@ -0,0 +1,84 @@
+"""
+Database routers.
+
+ReadWriteRouter: read/write split for the SQLite production profile (settings.DATABASE_PROFILE).
+
+Reads go to the 'replica' alias, a query-only connection on the same
+database file; in WAL mode readers see the last commit and never wait for
+the writer. Writes go to 'default', whose transactions begin IMMEDIATE, so
+writers take SQLite's single write lock one after another. While
+'default' has a transaction open, reads stay on it so code sees its own
+uncommitted writes.
+
+UserShardRouter: user-sharded history tables (core.sharding); listed first.
+"""
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from .sharding import SHARDED_APP, SHARDED_MODELS, is_sharded, shard_aliases, shard_for_user
+
+REPLICA_ALIAS = 'replica'
+ALIASES = {DEFAULT_DB_ALIAS, REPLICA_ALIAS}
+
+
+class ReadWriteRouter:
+    def db_for_read(self, model, **hints):
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return REPLICA_ALIAS
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Both aliases are the same database
+        if {obj1._state.db, obj2._state.db} <= ALIASES:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db == REPLICA_ALIAS:
+            return False
+        return None
+
+
+class UserShardRouter:
+    """
+    Send sharded models to the shard of the user found in the hints
+
+    The instance hint is either a row of the sharded model (save, delete,
+    refresh) or a user (`user.quiz_attempts`). Without one the router has no
+    opinion; use for_user() or fan_out() for such queries. Other models
+    stay off the shards, also when reached from a sharded row.
+    """
+
+    def _db(self, model, hints):
+        instance = hints.get('instance')
+        if instance is None:
+            return None
+        if is_sharded(model):
+            if isinstance(instance, model):
+                return shard_for_user(instance.user_id) if instance.user_id is not None else None
+            if instance._meta.label == settings.AUTH_USER_MODEL:
+                return shard_for_user(instance.pk) if instance.pk is not None else None
+            return None
+        if instance._state.db in shard_aliases():
+            return DEFAULT_DB_ALIAS
+        return None
+
+    def db_for_read(self, model, **hints):
+        return self._db(model, hints)
+
+    def db_for_write(self, model, **hints):
+        return self._db(model, hints)
+
+    def allow_relation(self, obj1, obj2, **hints):
+        if {obj1._state.db, obj2._state.db} & set(shard_aliases()):
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db in shard_aliases():
+            return app_label == SHARDED_APP and model_name in SHARDED_MODELS
+        return None
@@ -3,11 +3,181 @@ AI Recommendation Engine for LearnAI Platform
 Implements multi-factor recommendation algorithm with behavior analysis
 """
 
+import asyncio
+import hashlib
+import json
+import logging
+import threading
+from array import array
+from bisect import bisect_left
+from collections import OrderedDict
+from types import SimpleNamespace
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
 from django.db.models import Avg, Count, Q
-from .models import User, Course, Activity, Enrollment, Recommendation, Feedback
+from .bitsets import iter_bits, to_bitset
+from . import metrics
+from .catalog import catalog_snapshot, scoring_version
+from .models import User, Course, Lesson, Activity, Enrollment, Recommendation, Feedback, SegmentRecommendation
+from .neighbors import neighbor_courses
+from .profiling import timed
+from .transitions import transition_model
 from django.utils import timezone
 from datetime import timedelta
 
+try:
+    import requests
+except ImportError:  # pragma: no cover - optional dependency
+    requests = None
+
+try:
+    import httpx
+except ImportError:  # pragma: no cover - optional dependency
+    httpx = None
+
+try:
+    from bs4 import BeautifulSoup
+except ImportError:  # pragma: no cover - optional dependency
+    BeautifulSoup = None
+
+logger = logging.getLogger(__name__)
+
+SEARCH_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
+}
+SEARCH_TIMEOUT = 10
+# Concurrent outbound lookups per async recommendation refresh
+ASYNC_SEARCH_CONCURRENCY = 8
+
+# Factors that only depend on the learner profile and the course (memoized per profile signature)
+PROFILE_FACTORS = ('interest_match', 'skill_level', 'content_match', 'popularity')
+
+
+class ProfileScoreVector:
+    """
+    PROFILE_FACTORS scores for many courses, stored compactly
+
+    Course ids are kept in a sorted array and the scores in one flat array
+    beside them, 40 bytes per course instead of a nested dictionary's few
+    hundred. A cached vector is never changed; with_scores() returns an
+    extended copy.
+    """
+
+    WIDTH = len(PROFILE_FACTORS)
+
+    def __init__(self, ids=(), scores=()):
+        self.ids = array('q', ids)
+        self.scores = array('d', scores)
+
+    def _index(self, course_id):
+        index = bisect_left(self.ids, course_id)
+        if index < len(self.ids) and self.ids[index] == course_id:
+            return index
+        return None
+
+    def __contains__(self, course_id):
+        return self._index(course_id) is not None
+
+    def __getitem__(self, course_id):
+        """Factor scores of one course as a dictionary."""
+        index = self._index(course_id)
+        if index is None:
+            raise KeyError(course_id)
+        start = index * self.WIDTH
+        return dict(zip(PROFILE_FACTORS, self.scores[start:start + self.WIDTH]))
+
+    def __len__(self):
+        return len(self.ids)
+
+    def with_scores(self, new_scores):
+        """
+        Copy of this vector with more courses
+
+        Args:
+            new_scores: Dictionary of course id -> factor scores dictionary
+        """
+        width = self.WIDTH
+        rows = {course_id: self.scores[i * width:(i + 1) * width] for i, course_id in enumerate(self.ids)}
+        rows.update((course_id, [scores[factor] for factor in PROFILE_FACTORS]) for course_id, scores in new_scores.items())
+        ids = sorted(rows)
+        scores = array('d')
+        for course_id in ids:
+            scores.extend(rows[course_id])
+        return ProfileScoreVector(ids, scores)
+
+    @property
+    def nbytes(self):
+        return len(self.ids) * self.ids.itemsize + len(self.scores) * self.scores.itemsize
+
+
+class ProfileScoreCache:
+    """
+    Bounded LRU of user-independent score vectors keyed by profile signature
+
+    All entries belong to one catalog version; the cache empties itself
+    when asked for a different version. It holds at most `max_entries`
+    vectors and `max_bytes` of scores, whichever is reached first (the
+    newest vector is always kept).
+    """
+
+    def __init__(self, max_entries=64, max_bytes=64 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.version = None
+        self.hits = 0
+        self.misses = 0
+        self.nbytes = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, version, signature):
+        with self._lock:
+            if version != self.version:
+                self._clear()
+                self.version = version
+            vector = self._data.get(signature)
+            if vector is None:
+                self.misses += 1
+            else:
+                self._data.move_to_end(signature)
+                self.hits += 1
+        metrics.cache_requests.inc(cache='profile_scores', result='miss' if vector is None else 'hit')
+        return vector
+
+    def set(self, version, signature, vector):
+        with self._lock:
+            if version != self.version:
+                self._clear()
+                self.version = version
+            previous = self._data.pop(signature, None)
+            if previous is not None:
+                self.nbytes -= previous.nbytes
+            self._data[signature] = vector
+            self.nbytes += vector.nbytes
+            while len(self._data) > 1 and (len(self._data) > self.max_entries or self.nbytes > self.max_bytes):
+                _, evicted = self._data.popitem(last=False)
+                self.nbytes -= evicted.nbytes
+
+    def _clear(self):
+        self._data.clear()
+        self.nbytes = 0
+
+    def clear(self):
+        with self._lock:
+            self._clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+_score_cache_settings = getattr(settings, 'RECOMMENDATION_SCORE_CACHE', {})
+profile_score_cache = ProfileScoreCache(
+    max_entries=_score_cache_settings.get('MAX_ENTRIES', 64),
+    max_bytes=_score_cache_settings.get('MAX_BYTES', 64 * 1024 * 1024),
+)
+
 
 class AIRecommendationEngine:
     """
@@ -15,35 +185,122 @@ class AIRecommendationEngine:
     performance, and preferences to generate personalized recommendations.
     """
     
-    def __init__(self):
+    # Progress factor for a course in a category the learner has not started
+    NEW_LEARNER_PROGRESS_FACTOR = 0.7
+    # Courses fully scored per request, picked by profile score; next-course and
+    # "learners like you" candidates are always added on top
+    CANDIDATE_POOL = 100
+
+    def __init__(self, internet_lookups=True):
+        # Off for benchmarks and offline use: recommendations carry no online resources
+        self.internet_lookups = internet_lookups
         self.factor_weights = {
-            'interest_match': 0.30,
+            'interest_match': 0.25,
             'skill_level': 0.25,
-            'content_match': 0.20,
+            'content_match': 0.15,
             'progress_factor': 0.15,
-            'popularity': 0.10
+            'popularity': 0.10,
+            'next_course': 0.10
         }
     
-    def generate_recommendations(self, user, limit=6):
+    def generate_recommendations(self, user, limit=6, progress_callback=None):
         """
         Generate personalized recommendations for a user
 
         Args:
             user: User object
             limit: Maximum number of recommendations to return
+            progress_callback: Optional callable receiving percent complete (0-100)
 
         Returns:
             List of Recommendation objects
         """
-        # Get all courses not yet enrolled by user
-        enrolled_courses = Enrollment.objects.filter(user=user).values_list('course_id', flat=True)
-        available_courses = Course.objects.exclude(id__in=enrolled_courses)
-
         recommendations = []
 
+        with metrics.recommendation_seconds.time(mode='sync'):
+            scored = self._score_courses(user)
+            for index, (course, scores, total_score, reasons) in enumerate(scored, start=1):
+                # Get internet research results
+                internet_resources = (
+                    self._get_internet_resources(course.title, course.category) if self.internet_lookups else []
+                )
+                recommendations.append(
+                    self._build_recommendation(user, course, scores, total_score, reasons, internet_resources)
+                )
+                if progress_callback:
+                    progress_callback(100.0 * index / len(scored))
+
+            Recommendation.objects.bulk_create(recommendations)
+
+        # Sort by score and return top recommendations
+        recommendations.sort(key=lambda x: x.total_score, reverse=True)
+        return recommendations[:limit]
+
+    async def agenerate_recommendations(self, user, limit=6):
+        """
+        Async version of generate_recommendations
+
+        Scoring runs in a worker thread; the internet lookups for all
+        candidate courses run concurrently and the rows are written with
+        the async ORM.
+        """
+        with metrics.recommendation_seconds.time(mode='async'):
+            scored = await sync_to_async(self._score_courses)(user)
+
+            semaphore = asyncio.Semaphore(ASYNC_SEARCH_CONCURRENCY)
+
+            async def lookup(course, client):
+                async with semaphore:
+                    return await self.aget_internet_resources(course.title, course.category, client=client)
+
+            if not self.internet_lookups:
+                resources = [[] for _ in scored]
+            elif httpx is not None:
+                async with httpx.AsyncClient(headers=SEARCH_HEADERS, timeout=SEARCH_TIMEOUT, follow_redirects=True) as client:
+                    resources = await asyncio.gather(*(lookup(course, client) for course, *_ in scored))
+            else:
+                resources = await asyncio.gather(*(lookup(course, None) for course, *_ in scored))
+
+            recommendations = [
+                self._build_recommendation(user, course, scores, total_score, reasons, internet_resources)
+                for (course, scores, total_score, reasons), internet_resources in zip(scored, resources)
+            ]
+            await Recommendation.objects.abulk_create(recommendations)
+
+        recommendations.sort(key=lambda x: x.total_score, reverse=True)
+        return recommendations[:limit]
+
+    @timed('engine.score_courses')
+    def _score_courses(self, user):
+        """
+        Score every course the user is not enrolled in
+
+        Profile-dependent scores come from the memoized vector for the user's
+        profile signature; only the progress factor is computed per user.
+
+        Returns:
+            List of (course, factor scores, total weighted score, reasons) tuples
+        """
+        # One pass over the user's enrollments gives the progress factors and latest course
+        enrolled_courses, progress_factors, last_course_id = self._enrollment_state(user)
+        next_courses = transition_model.successors(last_course_id) if last_course_id else {}
+        peer_courses = neighbor_courses(user, exclude=enrolled_courses)
+        # Candidate filtering is a mask over the in-memory catalog, no course query
+        catalog_bits, catalog = catalog_snapshot()
+        # The enrolled set comes from the query above, never from another process's stale cached bitset
+        available_courses = [catalog[course_id] for course_id in iter_bits(catalog_bits & ~to_bitset(enrolled_courses))]
+        profile_vector = self._profile_score_vector(user, available_courses)
+        available_courses = self._candidate_courses(available_courses, profile_vector, next_courses, peer_courses)
+        metrics.recommendation_candidates.observe(len(available_courses))
+
+        scored = []
         for course in available_courses:
             # Calculate scores for each factor
-            scores = self._calculate_all_scores(user, course)
+            scores = dict(profile_vector[course.id])
+            scores['progress_factor'] = progress_factors.get(course.category, self.NEW_LEARNER_PROGRESS_FACTOR)
+            scores['next_course'] = next_courses.get(course.id, 0.0)
+            # Candidate source only, not weighted
+            scores['learners_like_you'] = peer_courses.get(course.id, 0.0)
 
             # Calculate total weighted score
             total_score = sum(
@@ -53,30 +310,152 @@ class AIRecommendationEngine:
 
             # Generate reasons for this recommendation
             reasons = self._generate_reasons(course, scores, user)
+            scored.append((course, scores, total_score, reasons))
+        return scored
 
-            # Get internet research results
-            internet_resources = self._get_internet_resources(course.title, course.category)
+    def _candidate_courses(self, courses, profile_vector, *sources):
+        """
+        Limit full scoring to the best CANDIDATE_POOL courses by profile score
 
-            # Create recommendation record
-            recommendation = Recommendation.objects.create(
-                user=user,
-                course=course,
-                total_score=round(total_score * 100, 2),
-                factor_scores={k: round(v * 100, 2) for k, v in scores.items()},
-                reasons=reasons
-            )
+        Args:
+            courses: Courses the user is not enrolled in
+            profile_vector: Profile scores per course id
+            sources: Dictionaries keyed by course id whose courses are always kept
 
-            # Add internet resources to reasons
-            if internet_resources:
-                recommendation.reasons.extend([f"Online resource: {res['title']} - {res['url']}" for res in internet_resources[:3]])
-                recommendation.save()
+        Returns:
+            List of candidate courses
+        """
+        if len(courses) <= self.CANDIDATE_POOL:
+            return courses
+        weights = {factor: weight for factor, weight in self.factor_weights.items() if factor in PROFILE_FACTORS}
 
-            recommendations.append(recommendation)
+        def profile_score(course):
+            scores = profile_vector[course.id]
+            return sum(scores[factor] * weight for factor, weight in weights.items())
 
-        # Sort by score and return top recommendations
-        recommendations.sort(key=lambda x: x.total_score, reverse=True)
-        return recommendations[:limit]
+        ranked = sorted(courses, key=profile_score, reverse=True)
+        extra = [course for course in ranked[self.CANDIDATE_POOL:] if any(course.id in source for source in sources)]
+        return ranked[:self.CANDIDATE_POOL] + extra
+
+    def _enrollment_state(self, user):
+        """
+        Enrolled course ids, per-category progress factors and the latest enrollment from one query
+
+        Returns:
+            Tuple of (set of course ids, dict of category -> progress factor, last enrolled course id or None)
+        """
+        enrolled = set()
+        factors = {}
+        last_course_id = None
+        rows = Enrollment.objects.filter(user=user).order_by('enrolled_at', 'id').values_list(
+            'course_id', 'course__category', 'is_completed', 'progress_percentage'
+        )
+        for course_id, category, is_completed, progress in rows:
+            enrolled.add(course_id)
+            last_course_id = course_id
+            # A course in progress in the category favors it most, any other enrollment in it a little less
+            if not is_completed and progress > 0:
+                factors[category] = 0.9
+            else:
+                factors.setdefault(category, 0.8)
+        return enrolled, factors, last_course_id
+
+    @staticmethod
+    def profile_signature(profile):
+        """Hash of the profile fields the user-independent scores depend on."""
+        raw = json.dumps([
+            sorted(str(interest) for interest in (profile.interests or [])),
+            profile.skill_level,
+            profile.preferred_content_type,
+        ])
+        return hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+    @timed('engine.profile_score_vector')
+    def _profile_score_vector(self, profile, courses):
+        """
+        Profile scores per course id, memoized across users with the same signature
+
+        Args:
+            profile: User (or profile-like object)
+            courses: Courses that must be present in the returned vector
+
+        Returns:
+            ProfileScoreVector: course id -> factor scores without 'progress_factor'
+        """
+        version = scoring_version()
+        signature = self.profile_signature(profile)
+        vector = profile_score_cache.get(version, signature) or ProfileScoreVector()
+        missing = [course for course in courses if course.id not in vector]
+        if missing:
+            # Copy on write: other threads may be reading the cached vector
+            vector = vector.with_scores({course.id: self._calculate_profile_scores(profile, course) for course in missing})
+            profile_score_cache.set(version, signature, vector)
+        return vector
+
+    def _build_recommendation(self, user, course, scores, total_score, reasons, internet_resources):
+        """Unsaved Recommendation row for a scored course."""
+        reasons = list(reasons)
+        # Add internet resources to reasons
+        if internet_resources:
+            reasons.extend([f"Online resource: {res['title']} - {res['url']}" for res in internet_resources[:3]])
+        return Recommendation(
+            user=user,
+            course=course,
+            total_score=round(total_score * 100, 2),
+            factor_scores={k: round(v * 100, 2) for k, v in scores.items()},
+            reasons=reasons
+        )
+
+    def _search_urls(self, course_title, category, limit):
+        """Google and Coursera search URLs for a course lookup."""
+        query = f"{course_title} {category} online course tutorial"
+        coursera_query = f"{course_title} {category}".replace(' ', '+')
+        return (
+            f"https://www.google.com/search?q={query}&num={limit}",
+            f"https://www.coursera.org/search?query={coursera_query}",
+        )
+
+    def _parse_search_results(self, html, limit):
+        """Extract learning resources from a Google results page."""
+        resources = []
+        soup = BeautifulSoup(html, 'html.parser')
+
+        # Extract search results
+        for result in soup.find_all('div', class_='g')[:limit]:
+            title_elem = result.find('h3')
+            link_elem = result.find('a')
+
+            if title_elem and link_elem:
+                title = title_elem.get_text()
+                url = link_elem.get('href')
 
+                # Filter out unwanted results
+                if url and 'google.com' not in url and 'youtube.com' in url or 'coursera.org' in url or 'udemy.com' in url or 'edX.org' in url:
+                    resources.append({
+                        'title': title,
+                        'url': url
+                    })
+        return resources
+
+    def _parse_coursera_results(self, html):
+        """Extract course cards from a Coursera search page."""
+        resources = []
+        coursera_soup = BeautifulSoup(html, 'html.parser')
+        course_cards = coursera_soup.find_all('div', {'data-testid': 'course-card'})[:5]
+
+        for card in course_cards:
+            title_elem = card.find('h3')
+            link_elem = card.find('a')
+            if title_elem and link_elem:
+                title = title_elem.get_text().strip()
+                url = "https://www.coursera.org" + link_elem.get('href')
+                resources.append({
+                    'title': f"Coursera: {title}",
+                    'url': url
+                })
+        return resources
+
+    @timed('engine.internet_resources')
     def _get_internet_resources(self, course_title, category, limit=10):
         """
         Perform internet research to find related courses and resources
@@ -90,58 +469,21 @@ class AIRecommendationEngine:
             List of dictionaries with 'title' and 'url' keys
         """
         resources = []
+        if requests is None or BeautifulSoup is None:
+            return resources
 
         try:
-            # Search query for related courses
-            query = f"{course_title} {category} online course tutorial"
-            search_url = f"https://www.google.com/search?q={query}&num={limit}"
+            search_url, coursera_url = self._search_urls(course_title, category, limit)
 
-            headers = {
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-            }
-
-            response = requests.get(search_url, headers=headers, timeout=10)
+            response = requests.get(search_url, headers=SEARCH_HEADERS, timeout=SEARCH_TIMEOUT)
             response.raise_for_status()
-
-            soup = BeautifulSoup(response.text, 'html.parser')
-
-            # Extract search results
-            for result in soup.find_all('div', class_='g')[:limit]:
-                title_elem = result.find('h3')
-                link_elem = result.find('a')
-
-                if title_elem and link_elem:
-                    title = title_elem.get_text()
-                    url = link_elem.get('href')
-
-                    # Filter out unwanted results
-                    if url and 'google.com' not in url and 'youtube.com' in url or 'coursera.org' in url or 'udemy.com' in url or 'edX.org' in url:
-                        resources.append({
-                            'title': title,
-                            'url': url
-                        })
+            resources.extend(self._parse_search_results(response.text, limit))
 
             # If not enough results, try additional searches
             if len(resources) < 5:
-                # Search on Coursera
-                coursera_query = f"{course_title} {category}".replace(' ', '+')
-                coursera_url = f"https://www.coursera.org/search?query={coursera_query}"
-
-                coursera_response = requests.get(coursera_url, headers=headers, timeout=10)
+                coursera_response = requests.get(coursera_url, headers=SEARCH_HEADERS, timeout=SEARCH_TIMEOUT)
                 if coursera_response.status_code == 200:
-                    coursera_soup = BeautifulSoup(coursera_response.text, 'html.parser')
-                    course_cards = coursera_soup.find_all('div', {'data-testid': 'course-card'})[:5]
-
-                    for card in course_cards:
-                        title_elem = card.find('h3')
-                        link_elem = card.find('a')
-                        if title_elem and link_elem:
-                            title = title_elem.get_text().strip()
-                            url = "https://www.coursera.org" + link_elem.get('href')
-                            resources.append({
-                                'title': f"Coursera: {title}",
-                                'url': url
-                            })
+                    resources.extend(self._parse_coursera_results(coursera_response.text))
 
         except Exception as e:
             # If internet search fails, return empty list
@@ -150,13 +492,56 @@ class AIRecommendationEngine:
 
         return resources[:limit]
 
-    def _calculate_all_scores(self, user, course):
-        """Calculate scores for all recommendation factors"""
+    async def aget_internet_resources(self, course_title, category, limit=10, client=None):
+        """
+        Async version of _get_internet_resources using httpx
+
+        Google and Coursera are queried concurrently. Without httpx the
+        blocking version runs in a worker thread instead.
+        """
+        if httpx is None:
+            return await sync_to_async(self._get_internet_resources, thread_sensitive=False)(
+                course_title, category, limit
+            )
+        if BeautifulSoup is None:
+            return []
+
+        search_url, coursera_url = self._search_urls(course_title, category, limit)
+        owns_client = client is None
+        if owns_client:
+            client = httpx.AsyncClient(headers=SEARCH_HEADERS, timeout=SEARCH_TIMEOUT, follow_redirects=True)
+        resources = []
+        try:
+            search_response, coursera_response = await asyncio.gather(
+                client.get(search_url), client.get(coursera_url), return_exceptions=True
+            )
+            if isinstance(search_response, httpx.Response) and search_response.status_code == 200:
+                resources.extend(self._parse_search_results(search_response.text, limit))
+            if len(resources) < 5 and isinstance(coursera_response, httpx.Response) and coursera_response.status_code == 200:
+                resources.extend(self._parse_coursera_results(coursera_response.text))
+        except Exception:
+            logger.warning('Internet research failed for %r', course_title, exc_info=True)
+        finally:
+            if owns_client:
+                await client.aclose()
+
+        return resources[:limit]
+
+    def _calculate_profile_scores(self, profile, course):
+        """
+        Scores for the factors that only depend on the learner profile
+
+        Args:
+            profile: User, or any object with interests, skill_level and preferred_content_type
+            course: Course object
+
+        Returns:
+            Dictionary of factor scores without 'progress_factor'
+        """
         return {
-            'interest_match': self._calculate_interest_match(user, course),
-            'skill_level': self._calculate_skill_level_match(user, course),
-            'content_match': self._calculate_content_match(user, course),
-            'progress_factor': self._calculate_progress_factor(user, course),
+            'interest_match': self._calculate_interest_match(profile, course),
+            'skill_level': self._calculate_skill_level_match(profile, course),
+            'content_match': self._calculate_content_match(profile, course),
             'popularity': self._calculate_popularity_factor(course)
         }
     
@@ -232,38 +617,16 @@ class AIRecommendationEngine:
         
         return content_scores.get(user.preferred_content_type, 0.7)
     
-    def _calculate_progress_factor(self, user, course):
-        """
-        Calculate factor based on user's progress with similar courses
-        
-        Returns score between 0.0 and 1.0
-        """
-        # Check if user has enrolled courses in same category
-        enrollments = Enrollment.objects.filter(
-            user=user,
-            course__category=course.category
-        )
-        
-        # Encourage continuing in same category with in-progress courses
-        in_progress = enrollments.filter(
-            is_completed=False,
-            progress_percentage__gt=0
-        ).count()
-        
-        if in_progress > 0:
-            return 0.9
-        elif enrollments.count() > 0:
-            return 0.8
-        
-        # Slightly prefer new categories to explore
-        return 0.7
-    
-    def _calculate_popularity_factor(self, user, course):
+    def _calculate_popularity_factor(self, course):
         """
         Calculate popularity factor based on rating and enrollment
         
         Returns score between 0.0 and 1.0
         """
+        # Trending popularity folded periodically by `manage.py fold_trending`
+        if course.popularity_score is not None:
+            return course.popularity_score
+
         # Normalize rating (0-5 to 0-1)
         rating_score = course.rating / 5.0 if course.rating > 0 else 0.5
         
@@ -295,6 +658,14 @@ class AIRecommendationEngine:
         if scores['progress_factor'] > 0.85:
             reasons.append("Continue your progress in this area")
         
+        # Sequential pattern
+        if scores.get('next_course', 0.0) >= 0.5:
+            reasons.append("Often taken next by learners on the same path")
+        
+        # Similar learners
+        if scores.get('learners_like_you', 0.0) >= 0.2:
+            reasons.append("Popular with learners like you")
+        
         # Popularity
         if scores['popularity'] > 0.8:
             reasons.append(f"Highly rated by {course.enrolled_count}+ learners")
@@ -306,11 +677,211 @@ class AIRecommendationEngine:
         return reasons
 
 
+class ColdStartRecommender:
+    """
+    Precomputed recommendation lists for learners with no enrollments yet.
+
+    A new learner's scores only depend on their interests, skill level and
+    preferred content type, so the catalog is scored once per
+    (interest, skill level, content type) segment and the top courses are
+    stored in SegmentRecommendation and the cache. A learner's list is the
+    merge of the segments for each of their interests. Lists built for an
+    older catalog version are still served while a rebuild job runs.
+    """
+
+    SEGMENT_SIZE = 12
+    CACHE_TIMEOUT = 60 * 60 * 24
+
+    def __init__(self, engine=None):
+        self.engine = engine or AIRecommendationEngine()
+
+    @staticmethod
+    def segment_interests():
+        """Interest values offered at registration, plus '' for none."""
+        return [''] + [label for _, label in Course.CATEGORIES]
+
+    @staticmethod
+    def segment_content_types():
+        return [key for key, _ in Lesson.CONTENT_TYPES]
+
+    def segments(self):
+        """All (interest, skill level, content type) segments that get a list."""
+        return [
+            (interest, skill_level, content_type)
+            for interest in self.segment_interests()
+            for skill_level, _ in User.SKILL_LEVELS
+            for content_type in self.segment_content_types()
+        ]
+
+    def user_segments(self, user):
+        """
+        Segments whose lists make up this user's cold-start list
+
+        Returns:
+            List of segment tuples, or None when the profile has no precomputed segment
+        """
+        if user.skill_level not in dict(User.SKILL_LEVELS):
+            return None
+        if user.preferred_content_type not in self.segment_content_types():
+            return None
+        known = set(self.segment_interests())
+        interests = [interest for interest in (user.interests or []) if interest in known] or ['']
+        return [(interest, user.skill_level, user.preferred_content_type) for interest in dict.fromkeys(interests)]
+
+    @staticmethod
+    def _cache_key(version, segment):
+        interest, skill_level, content_type = segment
+        digest = hashlib.md5(interest.encode('utf-8')).hexdigest()[:8]
+        return f'coldstart:{version}:{digest}:{skill_level}:{content_type}'
+
+    def score_segment(self, segment, courses):
+        """
+        Top courses for one segment
+
+        Returns:
+            List of entry dictionaries, best first
+        """
+        interest, skill_level, content_type = segment
+        profile = SimpleNamespace(
+            interests=[interest] if interest else [],
+            skill_level=skill_level,
+            preferred_content_type=content_type,
+        )
+        weights = self.engine.factor_weights
+        profile_vector = self.engine._profile_score_vector(profile, courses)
+        entries = []
+        for course in courses:
+            scores = dict(profile_vector[course.id])
+            scores['progress_factor'] = self.engine.NEW_LEARNER_PROGRESS_FACTOR
+            scores['next_course'] = 0.0
+            total_score = sum(scores[factor] * weights[factor] for factor in weights)
+            entries.append({
+                'course_id': course.id,
+                'total_score': round(total_score * 100, 2),
+                'factor_scores': {k: round(v * 100, 2) for k, v in scores.items()},
+                'reasons': self.engine._generate_reasons(course, scores, profile),
+            })
+        entries.sort(key=lambda entry: entry['total_score'], reverse=True)
+        return entries[:self.SEGMENT_SIZE]
+
+    def build_all(self, progress_callback=None):
+        """
+        Rebuild every segment list for the current catalog
+
+        Args:
+            progress_callback: Optional callable receiving percent complete (0-100)
+
+        Returns:
+            Number of segments written
+        """
+        version = scoring_version()
+        courses = list(Course.objects.all())
+        segments = self.segments()
+        rows = []
+        for index, segment in enumerate(segments, start=1):
+            interest, skill_level, content_type = segment
+            rows.append(SegmentRecommendation(
+                interest=interest,
+                skill_level=skill_level,
+                content_type=content_type,
+                catalog_version=version,
+                entries=self.score_segment(segment, courses),
+                generated_at=timezone.now(),
+            ))
+            if progress_callback:
+                progress_callback(90.0 * index / len(segments))
+
+        SegmentRecommendation.objects.bulk_create(
+            rows,
+            update_conflicts=True,
+            unique_fields=['interest', 'skill_level', 'content_type'],
+            update_fields=['catalog_version', 'entries', 'generated_at'],
+        )
+        cache.set_many(
+            {self._cache_key(version, (r.interest, r.skill_level, r.content_type)): r.entries for r in rows},
+            self.CACHE_TIMEOUT,
+        )
+        return len(rows)
+
+    def _segment_entries(self, segments):
+        """Entries per segment: cache first, then the table. Missing segments are left out."""
+        version = scoring_version()
+        keys = {self._cache_key(version, segment): segment for segment in segments}
+        found = {keys[key]: entries for key, entries in cache.get_many(list(keys)).items()}
+        missing = [segment for segment in segments if segment not in found]
+        metrics.cache_requests.inc(len(found), cache='segment_recommendations', result='hit')
+        metrics.cache_requests.inc(len(missing), cache='segment_recommendations', result='miss')
+        if missing:
+            query = Q()
+            for interest, skill_level, content_type in missing:
+                query |= Q(interest=interest, skill_level=skill_level, content_type=content_type)
+            stale = False
+            fresh = {}
+            for row in SegmentRecommendation.objects.filter(query):
+                segment = (row.interest, row.skill_level, row.content_type)
+                found[segment] = row.entries
+                if row.catalog_version == version:
+                    fresh[self._cache_key(version, segment)] = row.entries
+                else:
+                    stale = True
+            if fresh:
+                cache.set_many(fresh, self.CACHE_TIMEOUT)
+            if stale or len(found) < len(segments):
+                self._schedule_rebuild()
+        return found
+
+    def _schedule_rebuild(self):
+        from .jobs import enqueue  # jobs imports this module
+        try:
+            enqueue('build_segment_recommendations', dedupe_key='build_segment_recommendations')
+        except Exception:
+            # Serving the (stale) list matters more than scheduling the refresh
+            pass
+
+    def recommend(self, user, limit=6):
+        """
+        Cold-start list for a user with no enrollments
+
+        Returns:
+            List of unsaved Recommendation objects, or None if the user's segments are not built yet
+        """
+        segments = self.user_segments(user)
+        if not segments:
+            return None
+        found = self._segment_entries(segments)
+        if len(found) < len(segments):
+            return None
+
+        # A course in several of the user's segments keeps its best score
+        best = {}
+        for entries in found.values():
+            for entry in entries:
+                current = best.get(entry['course_id'])
+                if current is None or entry['total_score'] > current['total_score']:
+                    best[entry['course_id']] = entry
+        ranked = sorted(best.values(), key=lambda entry: entry['total_score'], reverse=True)
+
+        # Courses deleted since the lists were built are skipped
+        courses = Course.objects.in_bulk([entry['course_id'] for entry in ranked[:limit * 2]])
+        recommendations = [
+            Recommendation(
+                user=user,
+                course=courses[entry['course_id']],
+                total_score=entry['total_score'],
+                factor_scores=entry['factor_scores'],
+                reasons=entry['reasons'],
+            )
+            for entry in ranked[:limit * 2] if entry['course_id'] in courses
+        ]
+        return recommendations[:limit]
+
+
 class BehaviorAnalyzer:
     """
     Analyzes user behavior to update learning profiles and provide insights
     """
     
+    @metrics.behavior_analysis_seconds.time()
     def analyze_user_behavior(self, user):
         """
         Analyze user's recent behavior and update learning profile
@@ -320,8 +891,7 @@ class BehaviorAnalyzer:
         """
         # Get recent activities (last 30 days)
         thirty_days_ago = timezone.now() - timedelta(days=30)
-        recent_activities = Activity.objects.filter(
-            user=user,
+        recent_activities = Activity.objects.for_user(user).filter(
             timestamp__gte=thirty_days_ago
         )
         
@@ -399,8 +969,7 @@ class BehaviorAnalyzer:
         """Analyze recent quiz performance"""
         from .models import QuizAttempt
         
-        recent_attempts = QuizAttempt.objects.filter(
-            user=user,
+        recent_attempts = QuizAttempt.objects.for_user(user).filter(
             attempted_at__gte=since_date
         )
         
@@ -483,7 +1052,7 @@ class FeedbackGenerator:
         recent_quiz_performance = self._get_recent_quiz_performance(user)
         
         # Get recent activity
-        last_activity = Activity.objects.filter(user=user).first()
+        last_activity = Activity.objects.for_user(user).first()
         
         # Generate positive feedback
         feedback_items.extend(self._generate_positive_feedback(progress, recent_quiz_performance))
@@ -494,32 +1063,34 @@ class FeedbackGenerator:
         # Generate informational feedback
         feedback_items.extend(self._generate_info_feedback(progress, last_activity))
         
-        # Save feedback to database
-        saved_feedback = []
-        for item in feedback_items:
-            feedback = Feedback.objects.create(
+        # Save feedback to database in one statement
+        saved_feedback = Feedback.objects.bulk_create([
+            Feedback(
                 user=user,
                 feedback_type=item['type'],
                 title=item['title'],
                 message=item['message']
             )
-            saved_feedback.append(feedback)
+            for item in feedback_items
+        ])
+        for item in feedback_items:
+            metrics.feedback_generated.inc(type=item['type'])
         
         return saved_feedback
     
     def _calculate_user_progress(self, enrollments):
         """Calculate user's overall progress metrics"""
+        enrollments = list(enrollments)
+        course_ids = [e.course_id for e in enrollments]
         return {
-            'courses_enrolled': enrollments.count(),
-            'courses_completed': enrollments.filter(is_completed=True).count(),
+            'courses_enrolled': len(enrollments),
+            'courses_completed': sum(1 for e in enrollments if e.is_completed),
             'lessons_completed': sum(e.lessons_completed for e in enrollments),
-            'total_learning_hours': sum(
-                Activity.objects.filter(
-                    user=e.user,
-                    activity_type='learning_time',
-                    details__course_id=e.course.id
-                ).count() for e in enrollments
-            )
+            # Learning-time entries for any enrolled course, counted in one query
+            'total_learning_hours': Activity.objects.for_user(enrollments[0].user_id).filter(
+                activity_type='learning_time',
+                details__course_id__in=course_ids
+            ).count() if enrollments else 0
         }
     
     def _get_recent_quiz_performance(self, user):
@@ -528,8 +1099,7 @@ class FeedbackGenerator:
         from datetime import timedelta
         
         seven_days_ago = timezone.now() - timedelta(days=7)
-        recent_attempts = QuizAttempt.objects.filter(
-            user=user,
+        recent_attempts = QuizAttempt.objects.for_user(user).filter(
             attempted_at__gte=seven_days_ago
         )
         
@@ -0,0 +1,276 @@
+"""
+User-sharded history tables.
+
+With settings.USER_SHARDS = N > 0 the rows of the per-user history models
+(SHARDED_MODELS) live in N SQLite databases, shard_0 ... shard_{N-1}; all
+rows of one learner are in shard `user_id % N`. Users, the catalog and
+every other table stay in 'default'. Each shard has its own write lock, so
+writes of learners on different shards no longer wait for each other.
+
+* One learner's rows: Model.objects.for_user(user).
+* Saves, deletes and `user.<related manager>` are routed from the instance
+  by core.routers.UserShardRouter. create(), get_or_create() and
+  update_or_create() go to the shard of their `user`/`user_id` argument;
+  bulk_create groups rows by shard.
+* Rows of many learners (admin, offline jobs): fan_out(queryset).
+* A shard holds no users or courses, so sharded querysets cannot join
+  them: filter on `*_id` columns and load related rows with
+  prefetch_related. Primary keys are only unique within a shard.
+
+After changing USER_SHARDS, move the rows with `manage.py reshard --from <old N>`.
+With USER_SHARDS = 0 everything stays in 'default' and for_user() only filters.
+"""
+
+import heapq
+from functools import total_ordering
+from itertools import islice
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections, models
+from django.db.models.expressions import BaseExpression
+
+SHARDED_MODELS = ('activity', 'pdfreadingprogress', 'readingsession', 'chatmessage', 'quizattempt')
+SHARDED_APP = 'core'
+
+
+def shard_count():
+    return getattr(settings, 'USER_SHARDS', 0)
+
+
+def shard_alias(index):
+    return f'shard_{index}'
+
+
+def shard_aliases(count=None):
+    """Database aliases of the shards (empty when sharding is off)."""
+    return [shard_alias(index) for index in range(shard_count() if count is None else count)]
+
+
+def history_aliases(count=None):
+    """Databases holding sharded-model rows: the shards, or 'default' when sharding is off."""
+    return shard_aliases(count) or [DEFAULT_DB_ALIAS]
+
+
+def shard_for_user(user_id, count=None):
+    """Database alias holding a learner's rows."""
+    count = shard_count() if count is None else count
+    return shard_alias(user_id % count) if count else DEFAULT_DB_ALIAS
+
+
+def shard_database(index):
+    """DATABASES entry of a shard, also for shards no longer listed in settings."""
+    database = {key: value for key, value in settings.DATABASES[DEFAULT_DB_ALIAS].items() if key != 'TEST'}
+    database['NAME'] = settings.USER_SHARD_NAME.format(index)
+    return database
+
+
+def ensure_alias(alias, database):
+    """Register a database alias at runtime unless it is configured already."""
+    if alias not in connections.settings:
+        configured = connections.configure_settings({
+            DEFAULT_DB_ALIAS: connections.settings[DEFAULT_DB_ALIAS], alias: database,
+        })
+        connections.settings[alias] = configured[alias]
+
+
+def is_sharded(model):
+    return model._meta.app_label == SHARDED_APP and model._meta.model_name in SHARDED_MODELS
+
+
+def sharded_models():
+    from django.apps import apps
+    return [apps.get_model(SHARDED_APP, name) for name in SHARDED_MODELS]
+
+
+class UserShardedQuerySet(models.QuerySet):
+    """QuerySet of a model whose rows are stored in the shard of their user."""
+
+    def for_user(self, user):
+        """Rows of one learner, read from that learner's shard."""
+        user_id = getattr(user, 'pk', user)
+        queryset = self.using(shard_for_user(user_id)) if shard_count() and self._db is None else self
+        return queryset.filter(user_id=user_id)
+
+    def _on_user_shard(self, values):
+        """This queryset on the shard of the user in create/lookup `values`; the router sees no row there."""
+        if self._db is not None or not shard_count():
+            return self
+        user_id = getattr(values.get('user'), 'pk', values.get('user_id'))
+        return self if user_id is None else self.using(shard_for_user(user_id))
+
+    def create(self, **kwargs):
+        queryset = self._on_user_shard(kwargs)
+        if queryset is not self:
+            return queryset.create(**kwargs)
+        return super().create(**kwargs)
+
+    def get_or_create(self, defaults=None, **kwargs):
+        queryset = self._on_user_shard({**(defaults or {}), **kwargs})
+        if queryset is not self:
+            return queryset.get_or_create(defaults, **kwargs)
+        return super().get_or_create(defaults, **kwargs)
+
+    def update_or_create(self, defaults=None, create_defaults=None, **kwargs):
+        queryset = self._on_user_shard({**(create_defaults or defaults or {}), **kwargs})
+        if queryset is not self:
+            return queryset.update_or_create(defaults, create_defaults, **kwargs)
+        return super().update_or_create(defaults, create_defaults, **kwargs)
+
+    def bulk_create(self, objs, *args, **kwargs):
+        if self._db is not None or not shard_count():
+            return super().bulk_create(objs, *args, **kwargs)
+        objs = list(objs)
+        by_shard = {}
+        for obj in objs:
+            by_shard.setdefault(shard_for_user(obj.user_id), []).append(obj)
+        for alias, group in by_shard.items():
+            super(UserShardedQuerySet, self.using(alias)).bulk_create(group, *args, **kwargs)
+        return objs
+
+
+# ==================== Fan-out ====================
+
+@total_ordering
+class _Descending:
+    __slots__ = ('value',)
+
+    def __init__(self, value):
+        self.value = value
+
+    def __eq__(self, other):
+        return self.value == other.value
+
+    def __lt__(self, other):
+        return other.value < self.value
+
+
+def _merge_key(queryset):
+    """Sort key reproducing the queryset's ordering on fetched rows, or None if it cannot be rebuilt."""
+    ordering = list(queryset.query.order_by or (queryset.query.default_ordering and queryset.model._meta.ordering))
+    if not ordering:
+        return None
+    getters = []
+    for item in ordering:
+        if isinstance(item, BaseExpression) or '__' in item or item == '?':
+            return None
+        descending = item.startswith('-')
+        name = item.lstrip('-+')
+        if name == 'pk':
+            attname = queryset.model._meta.pk.attname
+        else:
+            attname = queryset.model._meta.get_field(name).attname
+        getters.append((attname, descending))
+
+    def key(row):
+        values = []
+        for attname, descending in getters:
+            value = row[attname] if isinstance(row, dict) else getattr(row, attname)
+            # None sorts first ascending, as in SQLite
+            value = (value is not None, value)
+            values.append(_Descending(value) if descending else value)
+        return values
+    return key
+
+
+class FanOut:
+    """
+    One queryset run on every shard
+
+    Chainable QuerySet methods apply to each shard's queryset. count(),
+    exists(), update() and delete() combine the shards' results; iterating
+    and slicing merge the shards' rows in the queryset's ordering (when it
+    only names fields of the model, otherwise shard by shard).
+    """
+
+    def __init__(self, querysets):
+        self.querysets = list(querysets)
+        self.model = self.querysets[0].model
+
+    @property
+    def query(self):
+        return self.querysets[0].query
+
+    def __getattr__(self, name):
+        attr = getattr(self.querysets[0], name)
+        if not callable(attr):
+            return attr
+
+        def method(*args, **kwargs):
+            results = [getattr(queryset, name)(*args, **kwargs) for queryset in self.querysets]
+            if not isinstance(results[0], models.QuerySet):
+                raise TypeError(f'{name}() cannot be merged across shards')
+            return FanOut(results)
+        return method
+
+    def _clone(self):
+        return FanOut(queryset._clone() for queryset in self.querysets)
+
+    def count(self):
+        return sum(queryset.count() for queryset in self.querysets)
+
+    def exists(self):
+        return any(queryset.exists() for queryset in self.querysets)
+
+    def update(self, **kwargs):
+        return sum(queryset.update(**kwargs) for queryset in self.querysets)
+
+    def delete(self):
+        deleted, per_model = 0, {}
+        for queryset in self.querysets:
+            count, counts = queryset.delete()
+            deleted += count
+            for label, n in counts.items():
+                per_model[label] = per_model.get(label, 0) + n
+        return deleted, per_model
+
+    def _merged(self, querysets):
+        key = _merge_key(self.querysets[0])
+        if key is None:
+            return (row for queryset in querysets for row in queryset)
+        return heapq.merge(*querysets, key=key)
+
+    def __iter__(self):
+        return iter(self._merged(self.querysets))
+
+    def __len__(self):
+        return self.count()
+
+    def __bool__(self):
+        return self.exists()
+
+    def __getitem__(self, k):
+        if isinstance(k, int):
+            rows = self[k:k + 1]
+            if not rows:
+                raise IndexError('FanOut index out of range')
+            return rows[0]
+        if k.step is not None or (k.start or 0) < 0 or (k.stop is not None and k.stop < 0):
+            raise ValueError('FanOut only supports non-negative slices without a step')
+        start = k.start or 0
+        # Each shard contributes at most `stop` rows to the merged prefix
+        querysets = self.querysets if k.stop is None else [queryset[:k.stop] for queryset in self.querysets]
+        return list(islice(self._merged(querysets), start, k.stop))
+
+
+def fan_out(queryset, aliases=None):
+    """
+    Run a sharded-model queryset on every database that holds its rows
+
+    Args:
+        queryset: QuerySet of one of the sharded models
+        aliases: Databases to query (default: all shards, or 'default' when sharding is off)
+
+    Returns:
+        FanOut over the per-shard querysets
+    """
+    return FanOut(queryset.using(alias) for alias in (aliases or history_aliases()))
+
+
+def delete_shard_rows(related_model, pk):
+    """Delete sharded rows pointing at a deleted user, course or quiz (the cascade in 'default' misses the shards)."""
+    if not shard_count():
+        return
+    for model in sharded_models():
+        for field in model._meta.concrete_fields:
+            if field.is_relation and field.related_model is related_model:
+                fan_out(model._base_manager.filter(**{field.attname: pk})).delete()
@@ -0,0 +1,41 @@
+"""Signal receivers connected in CoreConfig.ready()."""
+
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .bitsets import refresh_enrolled_bitset
+from .catalog import bump_catalog_version
+from .middleware import dispatch_query
+from .models import Course, Enrollment, Quiz, User
+from .sharding import delete_shard_rows
+
+
+@receiver(post_save, sender=Course)
+@receiver(post_delete, sender=Course)
+def course_changed(sender, **kwargs):
+    """Any course write makes catalog-derived precomputed data stale."""
+    bump_catalog_version()
+
+
+@receiver(post_save, sender=Enrollment)
+@receiver(post_delete, sender=Enrollment)
+def enrollment_changed(sender, instance, created=True, **kwargs):
+    """Keep the user's cached enrolled-course bitset current."""
+    if created:
+        refresh_enrolled_bitset(instance.user_id)
+
+
+@receiver(post_delete, sender=User)
+@receiver(post_delete, sender=Course)
+@receiver(post_delete, sender=Quiz)
+def delete_sharded_history(sender, instance, **kwargs):
+    """Cascade deletes of users and catalog rows to the history rows in the user shards."""
+    delete_shard_rows(sender, instance.pk)
+
+
+@receiver(connection_created)
+def install_query_recorder(sender, connection, **kwargs):
+    """Let QueryMetricsMiddleware see the queries of every connection, in whichever thread it is opened."""
+    if dispatch_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(dispatch_query)
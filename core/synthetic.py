@@ -0,0 +1,260 @@
+"""
+Reproducible synthetic catalogs and learner histories for benchmarks and load tests.
+
+The same seed and sizes always produce the same rows (apart from ids and
+timestamps), so benchmark runs can be compared against a stored baseline.
+Rows are written in bulk; no signals fire, so callers should clear caches
+afterwards.
+"""
+
+import bisect
+import itertools
+import math
+import random
+from datetime import timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.utils import timezone
+
+from .models import Activity, Course, Enrollment, Lesson, PDFReadingProgress, Quiz, QuizAttempt, ReadingSession, User
+
+CATEGORY_KEYS = [key for key, _ in Course.CATEGORIES]
+CATEGORY_LABELS = [label for _, label in Course.CATEGORIES]
+LEVEL_KEYS = [key for key, _ in Course.LEVELS]
+CONTENT_TYPES = [key for key, _ in Lesson.CONTENT_TYPES]
+TOPIC_WORDS = [
+    'python', 'javascript', 'django', 'react', 'pandas', 'statistics', 'regression', 'neural', 'networks',
+    'android', 'swift', 'kubernetes', 'docker', 'aws', 'azure', 'nlp', 'vision', 'sql', 'spark', 'testing',
+]
+BATCH_SIZE = 5000
+LESSONS_PER_COURSE = 2
+
+
+def _bulk(model, objects):
+    return model.objects.bulk_create(objects, batch_size=BATCH_SIZE)
+
+
+def generate_catalog(n_courses, seed=0):
+    """
+    Create courses, each with LESSONS_PER_COURSE lessons and one quiz
+
+    Returns:
+        Tuple of (courses, quizzes)
+    """
+    rng = random.Random(seed)
+    courses = _bulk(Course, [
+        Course(
+            title=f"{' '.join(rng.sample(TOPIC_WORDS, 2)).title()} {i}",
+            description='Synthetic course',
+            category=rng.choice(CATEGORY_KEYS),
+            level=rng.choice(LEVEL_KEYS),
+            duration_hours=rng.randint(1, 40),
+            lessons_count=LESSONS_PER_COURSE,
+            total_pages=rng.randint(20, 400),
+            enrolled_count=rng.randint(0, 3000),
+            rating=round(rng.uniform(2.5, 5.0), 1),
+            topics=rng.sample(TOPIC_WORDS, 3),
+            content_types=rng.sample(CONTENT_TYPES, rng.randint(1, 3)),
+        )
+        for i in range(n_courses)
+    ])
+    lessons = _bulk(Lesson, [
+        Lesson(course=course, title=f'Lesson {order}', content_type=rng.choice(CONTENT_TYPES), order=order)
+        for course in courses
+        for order in range(1, LESSONS_PER_COURSE + 1)
+    ])
+    quizzes = _bulk(Quiz, [
+        Quiz(lesson=lesson, question='Synthetic question?', options=['a', 'b', 'c', 'd'], correct_answer=0)
+        for lesson in lessons[::LESSONS_PER_COURSE]
+    ])
+    return courses, quizzes
+
+
+def generate_users(n_users, seed=0, prefix='bench'):
+    """Create learners with random interests, skill levels and content preferences."""
+    rng = random.Random(seed + 1)
+    password = make_password(None)
+    return _bulk(User, [
+        User(
+            username=f'{prefix}{i}',
+            password=password,
+            skill_level=rng.choice(LEVEL_KEYS),
+            preferred_content_type=rng.choice(CONTENT_TYPES),
+            interests=rng.sample(CATEGORY_LABELS, rng.randint(0, 3)),
+        )
+        for i in range(n_users)
+    ])
+
+
+def generate_history(users, courses, quizzes, n_activities, seed=0):
+    """
+    Create about n_activities rows of learner history
+
+    Roughly 10% enrollments, 10% quiz attempts and 80% Activity rows
+    (lesson completions, learning time, views).
+
+    Returns:
+        Dictionary of model name -> rows created
+    """
+    rng = random.Random(seed + 2)
+    n_enrollments = n_activities // 10
+    n_attempts = n_activities // 10
+    n_events = n_activities - n_enrollments - n_attempts
+
+    pairs = set()
+    max_pairs = len(users) * len(courses)
+    while len(pairs) < min(n_enrollments, max_pairs):
+        pairs.add((rng.randrange(len(users)), rng.randrange(len(courses))))
+    enrollments = []
+    for user_index, course_index in sorted(pairs):
+        progress = rng.choice([0.0, 0.0, rng.uniform(1, 99), 100.0])
+        enrollments.append(Enrollment(
+            user=users[user_index],
+            course=courses[course_index],
+            progress_percentage=progress,
+            lessons_completed=round(progress / 100 * LESSONS_PER_COURSE),
+            is_completed=progress == 100.0,
+        ))
+    _bulk(Enrollment, enrollments)
+
+    attempts = []
+    for _ in range(n_attempts):
+        correct = rng.random() < 0.7
+        attempts.append(QuizAttempt(
+            user=rng.choice(users), quiz=rng.choice(quizzes),
+            selected_answer=0 if correct else 1, is_correct=correct, score=100.0 if correct else 0.0,
+        ))
+    _bulk(QuizAttempt, attempts)
+
+    events = []
+    for _ in range(n_events):
+        kind = rng.choice(['lesson_completed', 'learning_time', 'content_viewed', 'login'])
+        if kind == 'learning_time':
+            details = {'hours': round(rng.uniform(0.25, 3), 2)}
+        elif kind == 'login':
+            details = {}
+        else:
+            details = {'course_id': rng.choice(courses).id, 'content_type': rng.choice(CONTENT_TYPES)}
+        events.append(Activity(user=rng.choice(users), activity_type=kind, details=details))
+    _bulk(Activity, events)
+
+    return {'enrollments': len(enrollments), 'quiz_attempts': len(attempts), 'activities': len(events)}
+
+
+# ==================== Load-test histories ====================
+
+# Columns written for each history table, in tuple order
+LOAD_COLUMNS = {
+    'enrollments': ['user_id', 'course_id', 'enrolled_at', 'lessons_completed', 'progress_percentage',
+                    'current_lesson', 'completed_at', 'is_completed'],
+    'progress': ['user_id', 'course_id', 'last_page_read', 'updated_at'],
+    'sessions': ['user_id', 'course_id', 'started_at', 'ended_at', 'pages_read', 'duration_minutes'],
+    'quiz_attempts': ['user_id', 'quiz_id', 'selected_answer', 'is_correct', 'score', 'attempted_at'],
+    'activities': ['user_id', 'activity_type', 'details', 'timestamp', 'session_duration'],
+}
+LOAD_MODELS = {
+    'enrollments': Enrollment,
+    'progress': PDFReadingProgress,
+    'sessions': ReadingSession,
+    'quiz_attempts': QuizAttempt,
+    'activities': Activity,
+}
+ACTIVITY_MIX = [
+    ('content_viewed', 40), ('lesson_completed', 25), ('learning_time', 15), ('login', 15), ('quiz_completed', 5),
+]
+HISTORY_DAYS = 365
+
+
+def zipf_cumulative(n, exponent=1.1):
+    """Cumulative Zipf weights: a few courses get most enrollments, as in real catalogs."""
+    return list(itertools.accumulate(1.0 / (rank ** exponent) for rank in range(1, n + 1)))
+
+
+def _lognormal_count(rng, mean, sigma=1.0):
+    """Heavy-tailed per-learner count with the given mean (most learners do little, a few do a lot)."""
+    if mean <= 0:
+        return 0
+    return int(rng.lognormvariate(math.log(mean) - sigma * sigma / 2, sigma) + 0.5)
+
+
+def learner_history(user_ids, catalog, means, seed=0, now=None):
+    """
+    History rows for a set of learners, as plain tuples (see LOAD_COLUMNS)
+
+    Pure Python so it can run in worker processes.
+
+    Args:
+        user_ids: Learner ids to generate history for
+        catalog: Dictionary with 'course_ids' (most popular first), 'cumulative' Zipf weights,
+            'pages' (course id -> total pages) and 'quizzes' (course id -> quiz ids)
+        means: Average rows per learner for 'enrollments', 'sessions', 'quiz_attempts' and 'activities'
+        seed: Random seed (combine with a shard number for independent shards)
+        now: Latest timestamp (aware datetime)
+
+    Returns:
+        Dictionary of table key -> list of tuples
+    """
+    rng = random.Random(seed)
+    now = now or timezone.now()
+    course_ids = catalog['course_ids']
+    cumulative = catalog['cumulative']
+    total_weight = cumulative[-1] if cumulative else 0
+    activity_kinds, activity_weights = zip(*ACTIVITY_MIX)
+    rows = {key: [] for key in LOAD_COLUMNS}
+
+    def pick_course():
+        return course_ids[bisect.bisect_left(cumulative, rng.random() * total_weight)]
+
+    def moment(after=None):
+        if after is None:
+            return now - timedelta(seconds=rng.random() * HISTORY_DAYS * 86400)
+        return after + (now - after) * rng.random()
+
+    for user_id in user_ids:
+        wanted = min(len(course_ids), _lognormal_count(rng, means['enrollments']))
+        taken = {}
+        for _ in range(wanted * 3):
+            if len(taken) >= wanted:
+                break
+            course_id = pick_course()
+            if course_id not in taken:
+                taken[course_id] = moment()
+
+        for course_id, enrolled_at in taken.items():
+            roll = rng.random()
+            progress = 0.0 if roll < 0.3 else (100.0 if roll > 0.8 else round(rng.uniform(1, 99), 1))
+            lessons = round(progress / 100 * LESSONS_PER_COURSE)
+            completed_at = moment(enrolled_at) if progress == 100.0 else None
+            rows['enrollments'].append((
+                user_id, course_id, enrolled_at, lessons, progress, max(lessons, 1), completed_at, progress == 100.0,
+            ))
+            if progress > 0:
+                pages = catalog['pages'].get(course_id, 1)
+                rows['progress'].append((user_id, course_id, max(1, round(pages * progress / 100)), moment(enrolled_at)))
+
+        enrolled = list(taken) or None
+        for _ in range(_lognormal_count(rng, means['sessions']) if enrolled else 0):
+            started = moment()
+            minutes = round(rng.uniform(2, 90), 1)
+            rows['sessions'].append((
+                user_id, rng.choice(enrolled), started, started + timedelta(minutes=minutes),
+                max(1, int(minutes * rng.uniform(0.3, 1.5))), minutes,
+            ))
+
+        quizzes = [quiz for course_id in (enrolled or []) for quiz in catalog['quizzes'].get(course_id, [])]
+        for _ in range(_lognormal_count(rng, means['quiz_attempts']) if quizzes else 0):
+            correct = rng.random() < 0.7
+            rows['quiz_attempts'].append((
+                user_id, rng.choice(quizzes), 0 if correct else 1, correct, 100.0 if correct else 0.0, moment(),
+            ))
+
+        for _ in range(_lognormal_count(rng, means['activities'])):
+            kind = rng.choices(activity_kinds, weights=activity_weights)[0]
+            if kind == 'learning_time':
+                details = {'hours': round(rng.uniform(0.25, 3), 2)}
+            elif kind == 'login' or not enrolled:
+                details = {}
+            else:
+                details = {'course_id': rng.choice(enrolled), 'content_type': rng.choice(CONTENT_TYPES)}
+            rows['activities'].append((user_id, kind, details, moment(), round(rng.uniform(0, 60), 1)))
+    return rows
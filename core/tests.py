@@ -1,3 +1,816 @@
-from django.test import TestCase
+"""
+Query-count regression tests for every route in core/urls.py.
 
-# Create your tests here.
+Each route is requested for learners with 1, 10 and 100 enrollments,
+reading sessions, quiz attempts (and the matching progress, activity,
+recommendation and feedback rows). The number of queries per request
+must not depend on that size, which locks in the N+1 fixes. The queries
+of the largest learner are also run through SQLite's EXPLAIN QUERY PLAN
+and must not scan the big history tables in full.
+"""
+
+import io
+import json
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import timedelta
+from io import StringIO
+from pathlib import Path
+from types import SimpleNamespace
+from unittest import addModuleCleanup, mock, skipIf, skipUnless
+
+from asgiref.sync import async_to_sync, iscoroutinefunction
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.db import IntegrityError, OperationalError, connection
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import URLPattern, reverse
+from django.utils import timezone
+
+from . import metrics, urls as core_urls
+from .bitsets import iter_bits, to_bitset
+from .catalog import catalog_snapshot, catalog_version, counter_version, scoring_version
+from .chatbot import ChatHistoryWriter
+from .counters import COUNTER_FIELDS, SHARD_COUNT, increment as increment_counter, reconcile
+from .jobs import enqueue
+from .middleware import QueryMetricsMiddleware, query_metrics_snapshot, reset_query_metrics
+from .models import (
+    Activity, BackgroundJob, ChatMessage, CounterShard, Course, CourseTrend, Enrollment, Feedback, Lesson, PDFReadingProgress,
+    Quiz, QuizAttempt, ReadingSession, Recommendation, User,
+)
+from .media import versioned_media_url
+from .pdf_pages import PdfWriter, page_asset_name, page_version, split_course_pdf
+from .profiling import ProfileStore, ProfilingMiddleware, profile_store
+from .routers import REPLICA_ALIAS, ReadWriteRouter, UserShardRouter
+from .services import (
+    PROFILE_FACTORS, AIRecommendationEngine, ProfileScoreCache, ProfileScoreVector, profile_score_cache,
+)
+from .transitions import build_transitions
+from .trending import decayed_counts, fold_popularity, record_event
+from .sharding import FanOut, fan_out, history_aliases, shard_count
+
+TIERED_CACHES = {
+    'default': {
+        'BACKEND': 'core.cache.TieredCache',
+        'LOCATION': tempfile.mkdtemp(),
+        'OPTIONS': {'LOCAL_TIMEOUT': 60},
+    },
+}
+
+METRICS_DIR = Path(tempfile.mkdtemp())
+PROFILE_DIR = Path(tempfile.mkdtemp())
+
+
+def setUpModule():
+    """Keep every test off the developer's var/cache, var/metrics and var/profiles."""
+    caches_override = override_settings(CACHES=TIERED_CACHES)
+    caches_override.enable()
+    addModuleCleanup(caches_override.disable)
+    for patcher in (
+        mock.patch('core.metrics.METRICS_DIR', METRICS_DIR),
+        mock.patch.object(profile_store, 'directory', PROFILE_DIR),
+    ):
+        patcher.start()
+        addModuleCleanup(patcher.stop)
+
+
+# 'default' plus the user shards when sharding is on (LEARNAI_USER_SHARDS)
+DATABASES = {'default', *history_aliases()}
+SIZES = (1, 10, 100)
+MEDIA_ROOT = tempfile.mkdtemp()
+# History tables that grow with traffic; a full scan of one of them does not scale
+HISTORY_TABLES = ('core_activity', 'core_recommendation', 'core_readingsession', 'core_quizattempt')
+FULL_SCAN_RE = re.compile(r'^SCAN (%s)\b' % '|'.join(HISTORY_TABLES))
+
+
+def pdf_bytes(pages):
+    """A PDF with `pages` blank pages."""
+    writer = PdfWriter()
+    for _ in range(pages):
+        writer.add_blank_page(width=200, height=200)
+    buf = io.BytesIO()
+    writer.write(buf)
+    return buf.getvalue()
+
+
+def build_learner(size, catalog):
+    """
+    A learner with `size` enrollments, progress rows, reading sessions, quiz attempts,
+    recommendations and feedback items, plus `size` activities of each type
+
+    Returns:
+        SimpleNamespace with the user and the objects routes refer to
+    """
+    user = User.objects.create_user(
+        f'learner{size}', password='pw', is_staff=True, interests=['Programming', 'Data Science'],
+    )
+    courses = catalog[:size]
+    lessons = {lesson.course_id: lesson for lesson in Lesson.objects.filter(course__in=courses)}
+    quizzes = {quiz.lesson.course_id: quiz for quiz in Quiz.objects.filter(lesson__course__in=courses).select_related('lesson')}
+    now = timezone.now()
+
+    Enrollment.objects.bulk_create([
+        Enrollment(user=user, course=course, lessons_completed=i % 3, progress_percentage=(i * 7) % 100)
+        for i, course in enumerate(courses)
+    ])
+    PDFReadingProgress.objects.bulk_create([
+        PDFReadingProgress(user=user, course=course, last_page_read=i + 1) for i, course in enumerate(courses)
+    ])
+    ReadingSession.objects.bulk_create([
+        ReadingSession(user=user, course=course, pages_read=3, duration_minutes=4.0) for course in courses
+    ])
+    QuizAttempt.objects.bulk_create([
+        QuizAttempt(user=user, quiz=quizzes[course.id], selected_answer=0, is_correct=True, score=100.0)
+        for course in courses
+    ])
+    Recommendation.objects.bulk_create([
+        Recommendation(user=user, course=course, total_score=0.5, reasons=['Matches your interests'])
+        for course in catalog[size:size * 2]
+    ])
+    Feedback.objects.bulk_create([
+        Feedback(user=user, feedback_type='info', title=f'Tip {i}', message='Keep going') for i in range(size)
+    ])
+    activities = []
+    for i, course in enumerate(courses):
+        activities.extend([
+            Activity(user=user, activity_type='lesson_completed', details={'course_id': course.id, 'content_type': 'pdf'}),
+            Activity(user=user, activity_type='content_viewed', details={'course_id': course.id, 'content_type': 'video'}),
+            Activity(user=user, activity_type='learning_time', details={'course_id': course.id, 'hours': 1.5}),
+            Activity(user=user, activity_type='login', details={}),
+        ])
+    Activity.objects.bulk_create(activities)
+    Activity.objects.for_user(user).update(timestamp=now - timedelta(days=1))
+
+    course = courses[0]
+    return SimpleNamespace(
+        user=user,
+        course=course,
+        lesson=lessons[course.id],
+        quiz=quizzes[course.id],
+        other_course=catalog[-1],
+        job=BackgroundJob.objects.create(kind='refresh_recommendations', user=user),
+        feedback=Feedback.objects.filter(user=user).first(),
+    )
+
+
+# URL name -> function(fixture) returning (method, url, body); POST bodies are sent as JSON
+ROUTES = {
+    'index': lambda f: ('get', reverse('core:index'), None),
+    'register': lambda f: ('get', reverse('core:register'), None),
+    'login': lambda f: ('get', reverse('core:login'), None),
+    'logout': lambda f: ('get', reverse('core:logout'), None),
+    'dashboard': lambda f: ('get', reverse('core:dashboard'), None),
+    'courses': lambda f: ('get', reverse('core:courses'), None),
+    'course_detail': lambda f: ('get', reverse('core:course_detail', args=[f.course.id]), None),
+    'enroll_course': lambda f: ('post', reverse('core:enroll_course', args=[f.other_course.id]), None),
+    'pdf_learn': lambda f: ('get', reverse('core:pdf_learn', args=[f.course.id]), None),
+    'pdf_page': lambda f: ('get', reverse('core:pdf_page', args=[f.course.id, 1]), None),
+    'api_save_progress': lambda f: ('post', reverse('core:api_save_progress'), {'course_id': f.course.id, 'page': 2}),
+    'api_chat': lambda f: ('post', reverse('core:api_chat'), {'course_id': f.course.id, 'message': 'What is Python?'}),
+    'api_chat_stream': lambda f: (
+        'post', reverse('core:api_chat_stream'), {'course_id': f.course.id, 'message': 'What is Python?'},
+    ),
+    'lesson': lambda f: ('get', reverse('core:lesson', args=[f.course.id, f.lesson.id]), None),
+    'complete_lesson': lambda f: ('post', reverse('core:complete_lesson', args=[f.course.id, f.lesson.id]), None),
+    'submit_quiz': lambda f: ('form', reverse('core:submit_quiz', args=[f.quiz.id]), {'answer': 0}),
+    'recommendations': lambda f: ('get', reverse('core:recommendations'), None),
+    'refresh_recommendations': lambda f: ('post', reverse('core:refresh_recommendations'), None),
+    'job_status': lambda f: ('get', reverse('core:job_status', args=[f.job.id]), None),
+    'feedback': lambda f: ('get', reverse('core:feedback'), None),
+    'dismiss_feedback': lambda f: ('post', reverse('core:dismiss_feedback', args=[f.feedback.id]), None),
+    'api_stats': lambda f: ('get', reverse('core:api_stats'), None),
+    'api_progress': lambda f: ('get', reverse('core:api_progress'), None),
+    'search_internet': lambda f: ('form', reverse('core:search_internet'), {'query': 'python'}),
+    'query_metrics': lambda f: ('get', reverse('core:query_metrics'), None),
+    'profiles': lambda f: ('get', reverse('core:profiles'), None),
+    'profile_detail': lambda f: ('get', reverse('core:profile_detail', args=['missing.folded']), None),
+    'api_stats_async': lambda f: ('get', reverse('core:api_stats_async'), None),
+    'api_progress_async': lambda f: ('get', reverse('core:api_progress_async'), None),
+    'search_internet_async': lambda f: ('form', reverse('core:search_internet_async'), {'query': 'python'}),
+    'refresh_recommendations_async': lambda f: ('post', reverse('core:refresh_recommendations_async'), None),
+}
+
+
+def _no_internet(*args, **kwargs):
+    return []
+
+
+async def _ano_internet(*args, **kwargs):
+    return []
+
+
+@override_settings(CHAT_INDEX_DIR=tempfile.mkdtemp(), COURSE_TRANSITIONS_PATH=tempfile.mktemp())
+@mock.patch.object(AIRecommendationEngine, '_get_internet_resources', _no_internet)
+@mock.patch.object(AIRecommendationEngine, 'aget_internet_resources', _ano_internet)
+class ViewQueryCountTests(TestCase):
+    """Query counts per route are independent of how much history a learner has."""
+
+    databases = DATABASES
+
+    @classmethod
+    def setUpTestData(cls):
+        categories = [key for key, _ in Course.CATEGORIES]
+        catalog = Course.objects.bulk_create([
+            Course(
+                title=f'Course {i}', description='Python programming and data analysis',
+                category=categories[i % len(categories)], level='beginner', duration_hours=5,
+                lessons_count=1, total_pages=200, topics=['python'], content_types=['pdf'],
+            )
+            for i in range(2 * max(SIZES) + 1)
+        ])
+        lessons = Lesson.objects.bulk_create([
+            Lesson(course=course, title='Lesson 1', content_type='pdf', order=1) for course in catalog
+        ])
+        Quiz.objects.bulk_create([
+            Quiz(lesson=lesson, question='Question?', options=['a', 'b'], correct_answer=0) for lesson in lessons
+        ])
+        # Steady state: counter shards and trend rows already exist, so writes are plain updates
+        CounterShard.objects.bulk_create([
+            CounterShard(course=course, field=field, shard=shard)
+            for course in catalog for field in COUNTER_FIELDS for shard in range(SHARD_COUNT)
+        ])
+        CourseTrend.objects.bulk_create([
+            CourseTrend(course=course, shard=shard) for course in catalog for shard in range(SHARD_COUNT)
+        ])
+        # Moves the trend rows to the current reference time
+        fold_popularity()
+        cls.fixtures = {size: build_learner(size, catalog) for size in SIZES}
+
+    def setUp(self):
+        cache.clear()
+        profile_score_cache.clear()
+        catalog_snapshot()
+
+    def _request(self, name, fixture):
+        method, url, body = ROUTES[name](fixture)
+        self.client.force_login(fixture.user)
+        # Every measured request starts from the same cache state
+        cache.clear()
+        profile_score_cache.clear()
+        with CaptureQueriesContext(connection) as captured:
+            if method == 'get':
+                response = self.client.get(url)
+            elif method == 'form':
+                response = self.client.post(url, body)
+            else:
+                response = self.client.post(url, json.dumps(body or {}), content_type='application/json')
+            if response.streaming:
+                list(response)
+        self.assertLess(response.status_code, 500, f'{name} failed')
+        return captured.captured_queries
+
+    def test_every_route_is_covered(self):
+        names = {pattern.name for pattern in core_urls.urlpatterns if isinstance(pattern, URLPattern)}
+        self.assertEqual(names, set(ROUTES))
+
+    def test_query_count_is_constant(self):
+        for name in ROUTES:
+            with self.subTest(route=name):
+                counts = {size: len(self._request(name, fixture)) for size, fixture in self.fixtures.items()}
+                self.assertEqual(len(set(counts.values())), 1, f'{name}: queries per learner size {counts}')
+
+    def test_no_full_scans_of_history_tables(self):
+        fixture = self.fixtures[max(SIZES)]
+        for name in ROUTES:
+            with self.subTest(route=name):
+                scans = []
+                for query in self._request(name, fixture):
+                    sql = query['sql']
+                    if not sql.lstrip().upper().startswith('SELECT'):
+                        continue
+                    with connection.cursor() as cursor:
+                        cursor.execute('EXPLAIN QUERY PLAN ' + sql)
+                        scans.extend(f'{row[3]} <- {sql}' for row in cursor.fetchall() if FULL_SCAN_RE.match(row[3]))
+                self.assertEqual(scans, [], f'{name} scans a history table')
+
+
+class QueryPlanTests(TestCase):
+    """The hot queries listed in verify_query_plans use the indexes meant for them."""
+
+    def test_hot_queries_use_their_indexes(self):
+        out = StringIO()
+        call_command('verify_query_plans', stdout=out)
+        self.assertNotIn('FAIL', out.getvalue())
+
+
+class CatalogCacheTests(TestCase):
+    """Anonymous catalog pages query the database once per catalog version."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.course = Course.objects.create(
+            title='Python Basics', description='Learn Python', category='programming', level='beginner',
+            duration_hours=5, total_pages=120, summary_for_chat='Python',
+        )
+
+    def setUp(self):
+        cache.clear()
+
+    def _queries(self, url):
+        with CaptureQueriesContext(connection) as captured:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(captured.captured_queries), response.content.decode()
+
+    def test_pages_are_cached_per_catalog_version(self):
+        for url in (reverse('core:courses'), reverse('core:course_detail', args=[self.course.id])):
+            with self.subTest(url=url):
+                cache.clear()
+                first, _ = self._queries(url)
+                self.assertGreater(first, 0)
+                self.assertEqual(self._queries(url)[0], 0)
+
+                self.course.title = 'Python Fundamentals'
+                self.course.save()
+                queries, content = self._queries(url)
+                self.assertGreater(queries, 0)
+                self.assertIn('Python Fundamentals', content)
+                self.assertEqual(self._queries(url)[0], 0)
+
+    def test_reconciling_counters_keeps_the_catalog_version(self):
+        version, counters = catalog_version(), counter_version()
+        increment_counter(self.course.id, 'page_view_count')
+        self.assertEqual(reconcile(), 1)
+        self.assertEqual(catalog_version(), version)
+        self.assertNotEqual(counter_version(), counters)
+
+    def test_local_tier_reads_through_and_writes_through(self):
+        tiered = caches['default']
+        tiered.set('key', {'a': 1})
+        self.assertEqual(tiered.shared.get('key'), {'a': 1})
+        # Values are copied, so mutating a result does not change the cache
+        tiered.get('key')['a'] = 2
+        self.assertEqual(tiered.get('key'), {'a': 1})
+
+        tiered.local.clear()
+        self.assertEqual(tiered.get_many(['key', 'missing']), {'key': {'a': 1}})
+        self.assertEqual(len(tiered.local), 1)
+
+        tiered.delete('key')
+        self.assertIsNone(tiered.get('key'))
+        self.assertIsNone(tiered.shared.get('key'))
+
+
+class ReadWriteRouterTests(TestCase):
+    """Reads go to the query-only replica unless the writer has a transaction open."""
+
+    def test_routing(self):
+        router = ReadWriteRouter()
+        idle = {'default': SimpleNamespace(in_atomic_block=False)}
+        with mock.patch('core.routers.connections', idle):
+            self.assertEqual(router.db_for_read(Course), REPLICA_ALIAS)
+        # TestCase runs every test inside a transaction on 'default'
+        self.assertEqual(router.db_for_read(Course), 'default')
+        self.assertEqual(router.db_for_write(Course), 'default')
+        self.assertFalse(router.allow_migrate(REPLICA_ALIAS, 'core'))
+        self.assertIsNone(router.allow_migrate('default', 'core'))
+
+
+class UserShardingTests(TestCase):
+    """History rows are routed to their user's shard and read back across shards."""
+
+    databases = DATABASES
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser('admin', password='pw')
+        cls.learners = [User.objects.create_user(f'learner{i}', password='pw') for i in range(3)]
+        now = timezone.now()
+        Activity.objects.bulk_create([
+            Activity(user=user, activity_type='login', details={'n': i})
+            for i in range(4) for user in cls.learners
+        ])
+        for i, activity in enumerate(fan_out(Activity.objects.order_by('id'))):
+            Activity.objects.using(activity._state.db).filter(pk=activity.pk).update(timestamp=now - timedelta(minutes=i))
+
+    def test_router(self):
+        router = UserShardRouter()
+        with override_settings(USER_SHARDS=2):
+            self.assertEqual(router.db_for_write(Activity, instance=Activity(user_id=3)), 'shard_1')
+            self.assertEqual(router.db_for_read(QuizAttempt, instance=User(pk=4)), 'shard_0')
+            self.assertIsNone(router.db_for_read(Activity))
+            on_shard = Activity(user_id=3)
+            on_shard._state.db = 'shard_1'
+            self.assertEqual(router.db_for_read(Course, instance=on_shard), 'default')
+            self.assertTrue(router.allow_migrate('shard_0', 'core', 'activity'))
+            self.assertFalse(router.allow_migrate('shard_0', 'core', 'course'))
+            self.assertIsNone(router.allow_migrate('default', 'core', 'course'))
+
+    def test_for_user_reads_one_learner(self):
+        user = self.learners[1]
+        rows = list(Activity.objects.for_user(user))
+        self.assertEqual({row.user_id for row in rows}, {user.id})
+        self.assertEqual(len(rows), 4)
+        self.assertEqual(user.activities.count(), 4)
+
+    def test_fan_out_merges_in_order(self):
+        expected = sorted(fan_out(Activity.objects.all()), key=lambda row: row.timestamp, reverse=True)
+        # Split every database in two, so rows are merged from several querysets also without shards
+        merged = FanOut(
+            queryset for alias in history_aliases() for queryset in (
+                Activity.objects.using(alias).filter(user=self.learners[0]),
+                Activity.objects.using(alias).exclude(user=self.learners[0]),
+            )
+        )
+        self.assertEqual(merged.count(), 12)
+        self.assertEqual([row.pk for row in merged], [row.pk for row in expected])
+        self.assertEqual([row.pk for row in merged[2:5]], [row.pk for row in expected[2:5]])
+        self.assertEqual(merged.filter(details__n=0).count(), 3)
+
+    def test_admin_change_list_and_change_form(self):
+        self.client.force_login(self.admin)
+        response = self.client.get(reverse('admin:core_activity_changelist'), {'q': 'learner1'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['cl'].result_count, 4)
+
+        activity = Activity.objects.for_user(self.learners[1]).first()
+        url = reverse('admin:core_activity_change', args=[activity.pk])
+        response = self.client.get(url, {'_shard': activity._state.db})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['original'], activity)
+
+    @skipUnless(shard_count() == 2, 'run with LEARNAI_USER_SHARDS=2')
+    def test_view_writes_land_on_the_users_shard(self):
+        user = self.learners[1]
+        course = Course.objects.create(
+            title='Sharded', description='Rows', category='programming', level='beginner', duration_hours=1,
+        )
+        self.client.force_login(user)
+        self.client.post(reverse('core:enroll_course', args=[course.id]))
+        self.assertEqual(Activity.objects.for_user(user).filter(activity_type='course_enrolled').count(), 1)
+        self.assertFalse(Activity.objects.using('default').filter(activity_type='course_enrolled').exists())
+        _, created = Activity.objects.get_or_create(user=user, activity_type='course_enrolled')
+        self.assertFalse(created)
+
+
+
+@skipIf(PdfWriter is None, 'pypdf is not installed')
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class SplitPDFTests(TestCase):
+    """Split course PDFs are served page by page to enrolled learners."""
+
+    databases = DATABASES
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('reader', password='pw')
+        cls.course = Course.objects.create(
+            title='Split Course', description='Pages', category='programming', level='beginner', duration_hours=1,
+        )
+        Enrollment.objects.create(user=cls.user, course=cls.course)
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def _attach(self, pages):
+        self.course.pdf_file = default_storage.save(f'courses/split-{self.course.id}.pdf', ContentFile(pdf_bytes(pages)))
+        self.course.save()
+
+    def _split(self, pages):
+        self._attach(pages)
+        return split_course_pdf(self.course, force=True)
+
+    def test_reader_gets_page_url_template(self):
+        self._split(2)
+        response = self.client.get(reverse('core:pdf_learn', args=[self.course.id]))
+        template = response.context['page_url_template']
+        self.course.refresh_from_db()
+        self.assertEqual(
+            template.replace('{page}', '2'),
+            f"{reverse('core:pdf_page', args=[self.course.id, 2])}?v={page_version(self.course)}",
+        )
+
+    def test_resplit_pages_are_not_served_from_the_old_url(self):
+        self._split(2)
+        template = self.client.get(reverse('core:pdf_learn', args=[self.course.id])).context['page_url_template']
+        old_url = template.replace('{page}', '1')
+        self.assertIn('immutable', self.client.get(old_url)['Cache-Control'])
+        self._split(2)
+        self.assertIn('must-revalidate', self.client.get(old_url)['Cache-Control'])
+        template = self.client.get(reverse('core:pdf_learn', args=[self.course.id])).context['page_url_template']
+        self.assertNotEqual(template.replace('{page}', '1'), old_url)
+
+    def test_resplit_into_fewer_pages_removes_stale_pages(self):
+        self._split(3)
+        stale = page_asset_name(self.course.id, 3, 'pdf')
+        self.assertTrue(default_storage.exists(stale))
+        self.assertEqual(self._split(2), 2)
+        self.assertFalse(default_storage.exists(stale))
+        self.assertTrue(default_storage.exists(page_asset_name(self.course.id, 2, 'pdf')))
+
+    def test_split_refreshes_the_cached_course_page(self):
+        cache.clear()
+        self._attach(3)
+        url = reverse('core:course_detail', args=[self.course.id])
+        self.assertEqual(self.client.get(url).context['course'].total_pages, 1)
+        split_course_pdf(self.course, force=True)
+        self.assertEqual(self.client.get(url).context['course'].total_pages, 3)
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class CourseMediaTests(TestCase):
+    """Course PDFs and split pages are only served to learners enrolled in the course."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.enrolled = User.objects.create_user('enrolled', password='pw')
+        cls.outsider = User.objects.create_user('outsider', password='pw')
+        cls.course = Course.objects.create(
+            title='Media Course', description='Files', category='programming', level='beginner', duration_hours=1,
+        )
+        Enrollment.objects.create(user=cls.enrolled, course=cls.course)
+
+    def setUp(self):
+        self.course.pdf_file = default_storage.save(f'courses/media-{self.course.id}.pdf', ContentFile(b'%PDF-1.4'))
+        self.course.save()
+        if not default_storage.exists(page_asset_name(self.course.id, 1, 'pdf')):
+            default_storage.save(page_asset_name(self.course.id, 1, 'pdf'), ContentFile(b'%PDF-1.4'))
+
+    def test_only_enrolled_learners_get_course_files(self):
+        paths = [self.course.pdf_file.name, page_asset_name(self.course.id, 1, 'pdf')]
+        for name in paths:
+            url = settings.MEDIA_URL + name
+            with self.subTest(path=name):
+                self.client.force_login(self.enrolled)
+                self.assertEqual(self.client.get(url).status_code, 200)
+                self.client.force_login(self.outsider)
+                self.assertEqual(self.client.get(url).status_code, 404)
+
+    def test_only_the_current_version_is_cached_for_good(self):
+        self.client.force_login(self.enrolled)
+        current = versioned_media_url(self.course.pdf_file)
+        self.assertIn('immutable', self.client.get(current)['Cache-Control'])
+        stale = self.client.get(settings.MEDIA_URL + self.course.pdf_file.name, {'v': 'stale'})
+        self.assertEqual(stale['Cache-Control'], 'private, max-age=0, must-revalidate')
+
+
+class ChatHistoryWriterTests(TestCase):
+    """Buffered chat messages survive failed writes, up to max_attempts."""
+
+    databases = DATABASES
+
+    def _messages(self, user):
+        return [ChatMessage(user=user, role='user', content=f'Question {i}') for i in range(3)]
+
+    def test_failed_write_is_retried(self):
+        user = User.objects.create_user('chatter', password='pw')
+        writer = ChatHistoryWriter(max_attempts=3)
+        writer._buffer.extend(self._messages(user))
+        bulk_create = ChatMessage.objects.bulk_create
+        with mock.patch.object(ChatMessage.objects, 'bulk_create',
+                               side_effect=[OperationalError('database is locked'), bulk_create]):
+            self.assertEqual(writer.flush(), 0)
+            self.assertEqual(writer.depth(), 3)
+        self.assertEqual(writer.flush(), 3)
+        self.assertEqual(ChatMessage.objects.for_user(user).count(), 3)
+
+    def test_batch_is_dropped_after_max_attempts(self):
+        user = User.objects.create_user('chatter', password='pw')
+        writer = ChatHistoryWriter(max_attempts=2)
+        writer._buffer.extend(self._messages(user))
+        with mock.patch.object(ChatMessage.objects, 'bulk_create', side_effect=OperationalError('database is locked')):
+            writer.flush()
+            writer.flush()
+        self.assertEqual(writer.depth(), 0)
+
+
+class EnqueueTests(TestCase):
+    """Enqueue survives losing the dedupe race to a job that has already finished."""
+
+    def test_insert_is_retried_when_the_competing_job_finished(self):
+        user = User.objects.create_user('queued', password='pw')
+        BackgroundJob.objects.create(kind='refresh_recommendations', user=user, dedupe_key='k', status='done')
+        create = BackgroundJob.objects.create
+        results = iter([IntegrityError('unique'), None])
+
+        def lose_first_race(**kwargs):
+            error = next(results)
+            if error:
+                raise error
+            return create(**kwargs)
+
+        with mock.patch.object(BackgroundJob.objects, 'create', side_effect=lose_first_race):
+            job = enqueue('refresh_recommendations', user=user, dedupe_key='k')
+        self.assertEqual(job.status, 'queued')
+
+    def test_async_refresh_shares_the_queued_job(self):
+        user = User.objects.create_user('queued', password='pw')
+        self.client.force_login(user)
+        url = reverse('core:refresh_recommendations_async')
+        first, second = self.client.post(url).json(), self.client.post(url).json()
+        self.assertEqual(first['job_id'], second['job_id'])
+        self.assertEqual(BackgroundJob.objects.get(id=first['job_id']).dedupe_key, f'refresh_recommendations:{user.id}')
+
+    def test_falls_back_to_the_latest_job_for_the_key(self):
+        user = User.objects.create_user('queued', password='pw')
+        done = BackgroundJob.objects.create(kind='refresh_recommendations', user=user, dedupe_key='k', status='done')
+        with mock.patch.object(BackgroundJob.objects, 'create', side_effect=IntegrityError('unique')):
+            self.assertEqual(enqueue('refresh_recommendations', user=user, dedupe_key='k'), done)
+
+
+class TrendingTests(TestCase):
+    """Forward-decayed trending counters stay finite for any half-life, however far in the future."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.course = Course.objects.create(
+            title='Trending', description='Hot', category='programming', level='beginner', duration_hours=1, rating=4.0,
+        )
+
+    def _counts(self, now):
+        totals = {}
+        for trend in CourseTrend.objects.filter(course=self.course):
+            for kind, count in decayed_counts(trend, now).items():
+                totals[kind] = totals.get(kind, 0.0) + count
+        return totals
+
+    def test_small_half_life_far_in_the_future(self):
+        now = timezone.now()
+        with mock.patch('core.trending.HALF_LIFE_DAYS', 0.5):
+            record_event(self.course.id, 'enroll', when=now)
+            later = now + timedelta(days=3650)
+            record_event(self.course.id, 'enroll', when=later)
+            record_event(self.course.id, 'complete', when=later)
+            counts = self._counts(later)
+            self.assertAlmostEqual(counts['enroll'], 1.0)
+            self.assertAlmostEqual(counts['complete'], 1.0)
+            # A fold years after the last event rebases the row instead of overflowing
+            self.assertEqual(fold_popularity(later + timedelta(days=3650)), 1)
+            counts = self._counts(later + timedelta(days=3650))
+        self.assertEqual(counts['enroll'], 0.0)
+
+    def test_fold_keeps_the_catalog_version(self):
+        record_event(self.course.id, 'enroll')
+        version, scoring = catalog_version(), scoring_version()
+        self.assertEqual(fold_popularity(), 1)
+        self.assertEqual(catalog_version(), version)
+        self.assertNotEqual(scoring_version(), scoring)
+
+
+class QueryMetricsMiddlewareTests(TestCase):
+    """The query metrics middleware stays async under ASGI and still counts the queries of async views."""
+
+    def setUp(self):
+        reset_query_metrics()
+        self.addCleanup(reset_query_metrics)
+
+    def test_async_view_queries_are_recorded(self):
+        async def view(request):
+            await Course.objects.acount()
+            await Course.objects.acount()
+            return HttpResponse()
+
+        middleware = QueryMetricsMiddleware(view)
+        middleware.sample_rate = 1
+        self.assertTrue(iscoroutinefunction(middleware))
+        async_to_sync(middleware)(RequestFactory().get('/'))
+        metrics = query_metrics_snapshot()['unresolved']
+        self.assertEqual(metrics['queries']['count'], 1)
+        self.assertEqual(metrics['queries']['sum'], 2)
+        self.assertEqual(metrics['repeated_signatures'][0]['extra_executions'], 1)
+
+
+class ProfilingMiddlewareTests(TestCase):
+    """Under ASGI the profiler runs in the thread that executes the view, sync or async."""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.store = ProfileStore(directory.name)
+        patcher = mock.patch('core.profiling.profile_store', self.store)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _profile(self, view):
+        async def get_response(request):
+            raise AssertionError('the profiled view is called by the middleware')
+
+        middleware = ProfilingMiddleware(get_response)
+        self.assertTrue(iscoroutinefunction(middleware))
+        request = RequestFactory().get('/', {'profile': 'cprofile'})
+        request.resolver_match = SimpleNamespace(view_name='core:profiled')
+
+        async def auser():
+            return SimpleNamespace(is_staff=True)
+
+        request.auser = auser
+        response = async_to_sync(middleware.process_view)(request, view, (), {})
+        return self.store.read(response['X-Profile-Id'])
+
+    def test_sync_view_is_profiled_in_its_worker_thread(self):
+        def busy_sync_view(request):
+            sum(i * i for i in range(200000))
+            return HttpResponse()
+
+        self.assertIn('busy_sync_view', self._profile(busy_sync_view))
+
+    def test_async_view_is_profiled(self):
+        async def busy_async_view(request):
+            sum(i * i for i in range(200000))
+            return HttpResponse()
+
+        self.assertIn('busy_async_view', self._profile(busy_async_view))
+
+
+class MetricsEndpointTests(TestCase):
+    """/metrics needs the scrape token or a staff session; exited workers' files are folded into merged.db."""
+
+    def test_anonymous_scrape_is_refused(self):
+        with mock.patch('core.metrics.SCRAPE_TOKEN', 'secret'):
+            self.assertEqual(self.client.get('/metrics').status_code, 401)
+            self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer wrong').status_code, 401)
+
+    def test_token_and_staff_can_scrape(self):
+        with mock.patch('core.metrics.SCRAPE_TOKEN', 'secret'):
+            self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer secret').status_code, 200)
+        self.client.force_login(User.objects.create_user('ops', password='pw', is_staff=True))
+        self.assertEqual(self.client.get('/metrics').status_code, 200)
+
+    @skipIf(metrics.fcntl is None, 'needs fcntl')
+    def test_dead_process_files_are_folded(self):
+        exited = [subprocess.Popen([sys.executable, '-c', '']) for _ in range(2)]
+        for process in exited:
+            process.wait()
+        with tempfile.TemporaryDirectory() as directory, mock.patch('core.metrics.METRICS_DIR', Path(directory)):
+            for pid in [process.pid for process in exited]:
+                values = metrics.MmapValues(Path(directory) / f'{pid}.db')
+                values.add(metrics.progress_saves._key('learnai_progress_saves_total', {}), 2)
+                values.close()
+            metrics.fold_dead_processes()
+            self.assertEqual(sorted(os.listdir(directory)), ['.lock', metrics.MERGED_NAME])
+            metrics.fold_dead_processes()
+            totals = metrics.collect()
+        self.assertEqual(totals[('learnai_progress_saves', 'learnai_progress_saves_total', ())], 4)
+
+
+class BitsetTests(TestCase):
+    """Course id bitsets round-trip at catalog scale in linear time."""
+
+    def test_round_trip_at_catalog_scale(self):
+        ids = list(range(3, 10 ** 6, 3))
+        start = time.perf_counter()
+        bits = to_bitset(reversed(ids))
+        self.assertEqual(list(iter_bits(bits & ~to_bitset(ids[:5]))), ids[5:])
+        # Copying the int per bit took several seconds here
+        self.assertLess(time.perf_counter() - start, 2)
+        self.assertEqual(list(iter_bits(to_bitset([]))), [])
+
+
+class ProfileScoreCacheTests(TestCase):
+    """Memoized profile score vectors are compact and bounded by total size."""
+
+    def _vector(self, courses):
+        return ProfileScoreVector().with_scores({
+            course_id: {factor: course_id / 10 for factor in PROFILE_FACTORS} for course_id in courses
+        })
+
+    def test_vector_lookup_and_extension(self):
+        vector = self._vector([5, 1]).with_scores({3: dict.fromkeys(PROFILE_FACTORS, 0.5)})
+        self.assertEqual(list(vector.ids), [1, 3, 5])
+        self.assertEqual(vector[5]['popularity'], 0.5)
+        self.assertEqual(vector[3]['interest_match'], 0.5)
+        self.assertNotIn(2, vector)
+        self.assertEqual(vector.nbytes, 3 * 40)
+
+    def test_bounded_by_bytes(self):
+        score_cache = ProfileScoreCache(max_entries=10, max_bytes=100 * 40)
+        for signature in 'abc':
+            score_cache.set('v1', signature, self._vector(range(40)))
+        self.assertEqual(len(score_cache), 2)
+        self.assertIsNone(score_cache.get('v1', 'a'))
+        self.assertEqual(score_cache.nbytes, 2 * 40 * 40)
+        # A vector larger than the budget is still kept on its own
+        score_cache.set('v1', 'd', self._vector(range(200)))
+        self.assertEqual(len(score_cache), 1)
+
+
+@override_settings(COURSE_TRANSITIONS_PATH=tempfile.mktemp())
+class TransitionBuildTests(TestCase):
+    """Incremental transition builds count every enrollment exactly once."""
+
+    def test_enrollment_at_the_high_water_timestamp_is_counted(self):
+        user = User.objects.create_user('sequence', password='pw')
+        first, second, third = [
+            Course.objects.create(
+                title=f'Step {i}', description='Path', category='programming', level='beginner', duration_hours=1,
+            ) for i in range(3)
+        ]
+        enrolled_at = timezone.now()
+        Enrollment.objects.create(user=user, course=first)
+        Enrollment.objects.create(user=user, course=second)
+        Enrollment.objects.filter(user=user).update(enrolled_at=enrolled_at)
+        self.assertEqual(build_transitions(full=True), 1)
+        # Commits after the build with the same timestamp as the last counted enrollment
+        late = Enrollment.objects.create(user=user, course=third)
+        Enrollment.objects.filter(id=late.id).update(enrolled_at=enrolled_at)
+        self.assertEqual(build_transitions(), 1)
+        self.assertEqual(build_transitions(), 0)
@@ -0,0 +1,150 @@
+"""
+First-order "what learners take next" model over enrollment sequences.
+
+For every course, the model counts which course the same learner enrolled
+in next (ordered by Enrollment.enrolled_at). Counts are stored sparsely as
+gzip JSON under DATA_DIR together with the (enrolled_at, id) high-water
+mark of the last build, so `manage.py build_course_transitions` only reads
+enrollments made since then. Each process loads the file once and keeps
+per-course successor scores in memory.
+"""
+
+import gzip
+import json
+import os
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+
+from django.conf import settings
+from django.db.models import Q
+
+from .models import Enrollment
+
+# Seconds between checks for a newer model file
+RELOAD_INTERVAL = 60
+# Successors kept per course when loading (the long tail adds nothing to rankings)
+MAX_SUCCESSORS = 50
+
+
+def model_path():
+    return Path(getattr(settings, 'COURSE_TRANSITIONS_PATH', Path(settings.DATA_DIR) / 'course_transitions.json.gz'))
+
+
+def _read(path):
+    try:
+        with gzip.open(path, 'rt', encoding='utf-8') as fh:
+            return json.load(fh)
+    except (OSError, ValueError):
+        return None
+
+
+def build_transitions(full=False):
+    """
+    Update the stored transition counts with enrollments since the high-water mark
+
+    Args:
+        full: Ignore the stored model and rebuild from every enrollment
+
+    Returns:
+        Number of transitions added
+    """
+    path = model_path()
+    data = None if full else _read(path)
+    counts = {} if data is None else data['counts']
+    # (enrolled_at, id) of the last enrollment counted: enrollments sharing its timestamp
+    # that commit after a build are told apart by id
+    high_water = None
+    if data is not None and data['high_water']:
+        # Files from before the id was stored: only later timestamps are new
+        high_water = (datetime.fromisoformat(data['high_water']), data.get('high_water_id', float('inf')))
+
+    new = Enrollment.objects.all()
+    if high_water is not None:
+        new = new.filter(_after(high_water))
+    rows = list(new.order_by('user_id', 'enrolled_at', 'id').values_list('user_id', 'course_id', 'enrolled_at', 'id'))
+    if not rows:
+        return 0
+
+    # Continue each learner's sequence from their last enrollment already counted
+    previous = {}
+    if high_water is not None:
+        earlier = (
+            Enrollment.objects.filter(user_id__in={row[0] for row in rows})
+            .exclude(_after(high_water))
+            .order_by('user_id', 'enrolled_at', 'id')
+            .values_list('user_id', 'course_id')
+        )
+        for user_id, course_id in earlier:
+            previous[user_id] = course_id
+
+    added = 0
+    for user_id, course_id, enrolled_at, enrollment_id in rows:
+        before = previous.get(user_id)
+        if before is not None and before != course_id:
+            successors = counts.setdefault(str(before), {})
+            successors[str(course_id)] = successors.get(str(course_id), 0) + 1
+            added += 1
+        previous[user_id] = course_id
+        if high_water is None or (enrolled_at, enrollment_id) > high_water:
+            high_water = (enrolled_at, enrollment_id)
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(f'.tmp{os.getpid()}')
+    with gzip.open(tmp, 'wt', encoding='utf-8') as fh:
+        json.dump(
+            {'high_water': high_water[0].isoformat(), 'high_water_id': high_water[1], 'counts': counts},
+            fh, separators=(',', ':'),
+        )
+    os.replace(tmp, path)
+    return added
+
+
+def _after(high_water):
+    """Enrollments ordered after an (enrolled_at, id) high-water mark."""
+    enrolled_at, enrollment_id = high_water
+    if enrollment_id == float('inf'):
+        return Q(enrolled_at__gt=enrolled_at)
+    return Q(enrolled_at__gt=enrolled_at) | Q(enrolled_at=enrolled_at, id__gt=enrollment_id)
+
+
+class TransitionModel:
+    """In-memory successor scores: course id -> {next course id: score in (0, 1]}."""
+
+    def __init__(self):
+        self._successors = {}
+        self._mtime = None
+        self._checked = None
+        self._lock = threading.Lock()
+
+    def _load(self):
+        path = model_path()
+        try:
+            mtime = path.stat().st_mtime
+        except OSError:
+            mtime = None
+        if mtime == self._mtime:
+            return
+        successors = {}
+        data = _read(path) if mtime is not None else None
+        for before, nexts in (data or {}).get('counts', {}).items():
+            top = sorted(nexts.items(), key=lambda item: item[1], reverse=True)[:MAX_SUCCESSORS]
+            best = top[0][1]
+            # Relative to the most common next course, which scores 1.0
+            successors[int(before)] = {int(course_id): count / best for course_id, count in top}
+        self._successors = successors
+        self._mtime = mtime
+
+    def successors(self, course_id):
+        """Scores of the courses learners took after `course_id` (empty if none)."""
+        now = time.monotonic()
+        if self._checked is None or now - self._checked > RELOAD_INTERVAL:
+            with self._lock:
+                if self._checked is None or now - self._checked > RELOAD_INTERVAL:
+                    self._load()
+                    self._checked = now
+        return self._successors.get(course_id, {})
+
+
+transition_model = TransitionModel()
@@ -0,0 +1,159 @@
+"""
+Time-decayed trending counters per course.
+
+Each course has up to COUNTER_SHARDS CourseTrend rows and an event goes
+to a random one, so concurrent events on a popular course rarely update
+the same row (as with core.counters); readers sum the rows.
+
+Counters use forward decay: an event at time t adds exp(rate * (t - R))
+to the course's running total, where R is the row's reference time, so
+recording an event is a single atomic `F()` increment with no read, and
+every stored total decays at the same rate. Multiplying a total by
+exp(-rate * (now - R)) gives the exponentially decayed count as of `now`.
+
+Reference times lie on a grid starting at EPOCH with a step of
+REBASE_HALF_LIVES half-lives. A row whose reference time is behind the
+grid step of an event is rebased first (totals scaled down, reference
+moved forward), so a weight never exceeds 2 ** REBASE_HALF_LIVES whatever
+the half-life and however far in the future.
+
+`fold_popularity` (run periodically through `manage.py fold_trending`)
+turns the totals into `Course.popularity_score`, which the recommendation
+engine reads as is.
+"""
+
+import math
+import random
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.db.models import F
+from django.utils import timezone
+
+from .catalog import bump_popularity_version
+from .counters import SHARD_COUNT
+from .models import Course, CourseTrend
+
+_trending_settings = getattr(settings, 'TRENDING', {})
+HALF_LIFE_DAYS = _trending_settings.get('HALF_LIFE_DAYS', 7)
+# Origin of the grid of reference times
+EPOCH = _trending_settings.get('EPOCH', datetime(2025, 1, 1, tzinfo=dt_timezone.utc))
+# Grid step of reference times, in half-lives
+REBASE_HALF_LIVES = 64
+
+# How much one event of each kind counts towards trending popularity
+EVENT_FIELDS = {
+    'enroll': 'enroll_score',
+    'read': 'read_score',
+    'complete': 'completion_score',
+}
+EVENT_WEIGHTS = {
+    'enroll': 1.0,
+    'read': 0.2,
+    'complete': 2.0,
+}
+
+# Share of course rating vs trending activity in the folded popularity score
+RATING_WEIGHT = 0.6
+TREND_WEIGHT = 0.4
+
+
+def _decay_rate():
+    return math.log(2) / (HALF_LIFE_DAYS * 86400)
+
+
+def _reference(when):
+    """Reference time of the grid step containing `when`."""
+    step = REBASE_HALF_LIVES * HALF_LIFE_DAYS * 86400
+    return EPOCH + timedelta(seconds=math.floor((when - EPOCH).total_seconds() / step) * step)
+
+
+def _weight(when, reference):
+    return math.exp(_decay_rate() * (when - reference).total_seconds())
+
+
+def _rebase(queryset, old, new):
+    """Move rows on reference time `old` to `new`, scaling their totals to match."""
+    factor = math.exp(-_decay_rate() * (new - old).total_seconds())
+    return queryset.filter(reference=old).update(
+        reference=new, **{field: F(field) * factor for field in EVENT_FIELDS.values()}
+    )
+
+
+def record_event(course_id, kind, count=1, when=None):
+    """
+    Add a decayed event to a course's trending counters
+
+    Args:
+        course_id: Course id
+        kind: 'enroll', 'read' or 'complete'
+        count: Number of events
+        when: Event time (defaults to now)
+    """
+    field = EVENT_FIELDS[kind]
+    when = when or timezone.now()
+    target = _reference(when)
+    shard = random.randrange(SHARD_COUNT)
+    rows = CourseTrend.objects.filter(course_id=course_id, shard=shard)
+    reference = target
+    # Usually the first UPDATE matches; each retry follows a rebase or a concurrent change of the row
+    while not rows.filter(reference=reference).update(**{field: F(field) + count * _weight(when, reference)}):
+        current = rows.values_list('reference', flat=True).first()
+        if current is None:
+            CourseTrend.objects.get_or_create(course_id=course_id, shard=shard, defaults={'reference': target})
+        elif current < target:
+            _rebase(rows, current, target)
+        else:
+            reference = current
+
+
+def decayed_counts(trend, now=None):
+    """
+    Decayed event counts for a CourseTrend row as of `now`
+
+    Returns:
+        Dictionary of event kind -> decayed count
+    """
+    # Multiplying by the inverse weight underflows to 0 for long-idle rows instead of overflowing
+    scale = math.exp(-_decay_rate() * ((now or timezone.now()) - trend.reference).total_seconds())
+    return {kind: getattr(trend, field) * scale for kind, field in EVENT_FIELDS.items()}
+
+
+def fold_popularity(now=None):
+    """
+    Recompute Course.popularity_score from ratings and trending counters
+
+    Trending activity is normalized by the most active course, then blended
+    with the normalized rating. Courses with no recent activity only get
+    the rating share.
+
+    Returns:
+        Number of courses whose score changed
+    """
+    now = now or timezone.now()
+    # Keep idle rows on a current reference time too
+    target = _reference(now)
+    for old in CourseTrend.objects.filter(reference__lt=target).values_list('reference', flat=True).distinct():
+        _rebase(CourseTrend.objects.all(), old, target)
+
+    activity = {}
+    for trend in CourseTrend.objects.all():
+        counts = decayed_counts(trend, now)
+        activity[trend.course_id] = activity.get(trend.course_id, 0.0) + sum(
+            counts[kind] * EVENT_WEIGHTS[kind] for kind in counts
+        )
+    top = max(activity.values(), default=0.0)
+
+    changed = []
+    for course in Course.objects.only('id', 'rating', 'popularity_score'):
+        rating_score = course.rating / 5.0 if course.rating > 0 else 0.5
+        trend_score = activity.get(course.id, 0.0) / top if top > 0 else 0.0
+        score = round(rating_score * RATING_WEIGHT + trend_score * TREND_WEIGHT, 4)
+        if score != course.popularity_score:
+            course.popularity_score = score
+            changed.append(course)
+    if changed:
+        # Popularity has its own version (core.catalog.scoring_version), so catalog pages stay cached
+        Course.objects.bulk_update(changed, ['popularity_score'], batch_size=500)
+        bump_popularity_version()
+    return len(changed)
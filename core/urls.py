@@ -1,5 +1,5 @@
 from django.urls import path
-from . import views
+from . import async_views, views
 
 app_name = 'core'
 
@@ -18,10 +18,12 @@ urlpatterns = [
     path('courses/<int:course_id>/', views.course_detail_view, name='course_detail'),
     path('courses/<int:course_id>/enroll/', views.enroll_course, name='enroll_course'),
     path('courses/<int:course_id>/learn/', views.pdf_learn_view, name='pdf_learn'),
+    path('courses/<int:course_id>/pages/<int:page_number>/', views.pdf_page_view, name='pdf_page'),
     
     # API: progress & chatbot
     path('api/save-progress/', views.api_save_progress, name='api_save_progress'),
     path('api/chat/', views.api_chat, name='api_chat'),
+    path('api/chat/stream/', async_views.api_chat_stream, name='api_chat_stream'),
     
     # Lessons
     path('courses/<int:course_id>/lessons/<int:lesson_id>/', views.lesson_view, name='lesson'),
@@ -33,6 +35,7 @@ urlpatterns = [
     # Recommendations
     path('recommendations/', views.recommendations_view, name='recommendations'),
     path('recommendations/refresh/', views.refresh_recommendations, name='refresh_recommendations'),
+    path('jobs/<int:job_id>/', views.job_status, name='job_status'),
     
     # Feedback
     path('feedback/', views.feedback_view, name='feedback'),
@@ -42,4 +45,13 @@ urlpatterns = [
     path('api/stats/', views.api_stats, name='api_stats'),
     path('api/progress/', views.api_progress, name='api_progress'),
     path('api/search/', views.search_internet, name='search_internet'),
+    path('api/query-metrics/', views.query_metrics_view, name='query_metrics'),
+    path('api/profiles/', views.profiles_view, name='profiles'),
+    path('api/profiles/<str:name>/', views.profile_detail_view, name='profile_detail'),
+    
+    # Async variants (serve with an ASGI server, see DJANGO_README)
+    path('api/async/stats/', async_views.api_stats_async, name='api_stats_async'),
+    path('api/async/progress/', async_views.api_progress_async, name='api_progress_async'),
+    path('api/async/search/', async_views.search_internet_async, name='search_internet_async'),
+    path('api/async/recommendations/refresh/', async_views.refresh_recommendations_async, name='refresh_recommendations_async'),
 ]
\ No newline at end of file
@@ -1,16 +1,39 @@
+import hashlib
+import os
+
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth import login, authenticate, logout
+from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.auth.decorators import login_required
-from django.http import JsonResponse
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import Http404, HttpResponse, JsonResponse
+from django.urls import reverse
+from django.utils._os import safe_join
+from django.utils.crypto import constant_time_compare
 from django.utils import timezone
 from datetime import timedelta
 from django.db import IntegrityError
 from django.db.models import Avg, Q, Sum
 from .models import (
     User, Course, Enrollment, Lesson, Quiz, QuizAttempt, Activity, Feedback, Recommendation,
-    PDFReadingProgress, ReadingSession, ChatMessage
+    PDFReadingProgress, ReadingSession, ChatMessage, CoursePage, BackgroundJob
 )
-from .services import AIRecommendationEngine, BehaviorAnalyzer, FeedbackGenerator
+from . import metrics
+from .bitsets import enrolled_course_ids as enrolled_course_ids_for
+from .catalog import cached_for_version, catalog_snapshot, catalog_version
+from .chatbot import NO_COURSE_ANSWER, answer_question, persist_exchange
+from .counters import increment as increment_counter
+from .jobs import enqueue
+from .media import serve_media_file, versioned_media_url
+from .middleware import SAMPLE_RATE as QUERY_SAMPLE_RATE, query_metrics_snapshot
+from .pdf_pages import page_version
+from .profiling import profile_store, span_snapshot
+from .services import AIRecommendationEngine, BehaviorAnalyzer, ColdStartRecommender, FeedbackGenerator
+from .trending import record_event
+
+# Page number reversed into the split-page URL, then swapped for the reader's {page} placeholder
+PAGE_URL_SENTINEL = 987654321
 
 
 # ==================== Authentication Views ====================
@@ -20,12 +43,11 @@ def index(request):
     if not request.user.is_authenticated:
         return render(request, 'core/index.html', {})
     user = request.user
-    enrollments = Enrollment.objects.filter(user=user).select_related('course')
-    courses_enrolled = enrollments.count()
-    total_pages_read = 0
-    for e in enrollments:
-        p = PDFReadingProgress.objects.filter(user=user, course=e.course).first()
-        total_pages_read += (p.last_page_read if p else 0)
+    courses_enrolled = Enrollment.objects.filter(user=user).count()
+    # Progress rows of enrolled courses only (cached enrolled-course ids), summed in one query
+    total_pages_read = PDFReadingProgress.objects.for_user(user).filter(
+        course_id__in=enrolled_course_ids_for(user.id)
+    ).aggregate(total=Sum('last_page_read'))['total'] or 0
     context = {
         'user': user,
         'courses_enrolled': courses_enrolled,
@@ -112,12 +134,14 @@ def logout_view(request):
 def dashboard(request):
     """User dashboard: enrolled courses with PDF progress (page X of Y)."""
     user = request.user
-    enrollments = Enrollment.objects.filter(user=user).select_related('course')
-    # Attach PDF progress for each enrollment
+    enrollments = list(Enrollment.objects.filter(user=user).select_related('course'))
+    # All of the user's PDF progress in one query
+    last_pages = dict(
+        PDFReadingProgress.objects.for_user(user).order_by().values_list('course_id', 'last_page_read')
+    )
     enrollment_list = []
     for e in enrollments:
-        prog = PDFReadingProgress.objects.filter(user=user, course=e.course).first()
-        last_page = prog.last_page_read if prog else 1
+        last_page = last_pages.get(e.course_id, 1)
         total = e.course.total_pages or 1
         pct = round((last_page / total) * 100, 1) if total else 0
         enrollment_list.append({
@@ -128,19 +152,10 @@ def dashboard(request):
             'progress_pct': pct,
         })
     stats = {
-        'courses_enrolled': enrollments.count(),
-        'total_pages_read': sum(
-            (PDFReadingProgress.objects.filter(user=user, course=e.course).first() or type('X', (), {'last_page_read': 0})()).last_page_read
-            for e in enrollments
-        ),
+        'courses_enrolled': len(enrollments),
+        'total_pages_read': sum(last_pages.get(e.course_id, 0) for e in enrollments),
     }
-    # Fix total_pages_read
-    total_read = 0
-    for e in enrollments:
-        p = PDFReadingProgress.objects.filter(user=user, course=e.course).first()
-        total_read += (p.last_page_read if p else 0)
-    stats['total_pages_read'] = total_read
-    recent_activities = Activity.objects.filter(user=user).order_by('-timestamp')[:10]
+    recent_activities = Activity.objects.for_user(user).order_by('-timestamp')[:10]
     context = {
         'user': user,
         'stats': stats,
@@ -154,8 +169,7 @@ def get_weekly_progress(user):
     """Calculate weekly progress data"""
     seven_days_ago = timezone.now() - timedelta(days=7)
     
-    activities = Activity.objects.filter(
-        user=user,
+    activities = Activity.objects.for_user(user).filter(
         timestamp__gte=seven_days_ago
     )
     
@@ -175,23 +189,32 @@ def get_weekly_progress(user):
 
 # ==================== Course Views ====================
 
+def _listed_courses():
+    # Only 4 PDF IT courses (with summary_for_chat set by populate_pdf_courses)
+    courses = list(Course.objects.exclude(summary_for_chat='').order_by('id')[:4])
+    if not courses:
+        courses = list(Course.objects.filter(total_pages__gte=1).order_by('id')[:4])
+    return courses
+
+
 def courses_view(request):
     """Browse only 4 IT PDF courses."""
-    # Only 4 PDF IT courses (with summary_for_chat set by populate_pdf_courses)
-    courses = Course.objects.exclude(summary_for_chat='').order_by('id')[:4]
-    if not courses.exists():
-        courses = Course.objects.filter(total_pages__gte=1).order_by('id')[:4]
+    # Built once per catalog version; the template caches the rendered list under the same version
+    courses = cached_for_version('courses', _listed_courses)
     context = {
         'courses': courses,
         'category': None,
-        'query': None
+        'query': None,
+        'catalog_version': catalog_version(),
     }
     return render(request, 'core/courses.html', context)
 
 
 def course_detail_view(request, course_id):
     """Course detail page (PDF course: enroll and start/continue reading)."""
-    course = get_object_or_404(Course, id=course_id)
+    course = cached_for_version(f'course:{course_id}', lambda: Course.objects.filter(id=course_id).first())
+    if course is None:
+        raise Http404('No Course matches the given query.')
     is_enrolled = False
     enrollment = None
     progress = None
@@ -199,7 +222,7 @@ def course_detail_view(request, course_id):
         try:
             enrollment = Enrollment.objects.get(user=request.user, course=course)
             is_enrolled = True
-            progress = PDFReadingProgress.objects.filter(user=request.user, course=course).first()
+            progress = PDFReadingProgress.objects.for_user(request.user).filter(course_id=course.id).first()
         except Enrollment.DoesNotExist:
             pass
     context = {
@@ -207,6 +230,7 @@ def course_detail_view(request, course_id):
         'is_enrolled': is_enrolled,
         'enrollment': enrollment,
         'progress': progress,
+        'catalog_version': catalog_version(),
     }
     return render(request, 'core/course_detail.html', context)
 
@@ -220,8 +244,8 @@ def enroll_course(request, course_id):
             return redirect('core:course_detail', course_id=course_id)
         return JsonResponse({'success': False, 'message': 'Already enrolled'})
     Enrollment.objects.create(user=request.user, course=course)
-    course.enrolled_count += 1
-    course.save()
+    increment_counter(course.id, 'enrolled_count')
+    record_event(course.id, 'enroll')
     Activity.objects.create(
         user=request.user,
         activity_type='course_enrolled',
@@ -242,21 +266,66 @@ def pdf_learn_view(request, course_id):
         enrollment = Enrollment.objects.get(user=request.user, course=course)
     except Enrollment.DoesNotExist:
         return redirect('core:course_detail', course_id=course_id)
-    progress, _ = PDFReadingProgress.objects.get_or_create(
+    progress, _ = PDFReadingProgress.objects.for_user(request.user).get_or_create(
         user=request.user, course=course,
         defaults={'last_page_read': 1}
     )
+    # Counted once per course and session, so reloads do not each write a counter row
+    viewed = request.session.get('viewed_courses', [])
+    if course.id not in viewed:
+        request.session['viewed_courses'] = viewed + [course.id]
+        increment_counter(course.id, 'page_view_count')
     total_pages = course.total_pages or 1
+    # Split courses are served one page at a time (see split_course_pdfs)
+    page_url_template = None
+    if course.pages.exists():
+        page_url = reverse('core:pdf_page', args=[course.id, PAGE_URL_SENTINEL])
+        page_url_template = f'{page_url}?v={page_version(course)}'.replace(str(PAGE_URL_SENTINEL), '{page}')
     context = {
         'course': course,
         'enrollment': enrollment,
         'current_page': min(progress.last_page_read, total_pages),
         'total_pages': total_pages,
-        'pdf_url': course.pdf_file.url if course.pdf_file else None,
+        'pdf_url': versioned_media_url(course.pdf_file),
+        'page_url_template': page_url_template,
     }
     return render(request, 'core/pdf_reader.html', context)
 
 
+@login_required
+def pdf_page_view(request, course_id, page_number):
+    """Serve a single split page of a course PDF (or its preview with ?preview=1)."""
+    if not Enrollment.objects.filter(user=request.user, course_id=course_id).exists():
+        raise Http404('Not enrolled in this course')
+    page = get_object_or_404(CoursePage.objects.select_related('course'), course_id=course_id, page_number=page_number)
+    # URLs carrying the current split's version are cached for good; a re-split changes the version
+    version = page_version(page.course)
+    if request.GET.get('preview'):
+        if not page.preview:
+            raise Http404('No preview for this page')
+        return serve_media_file(request, page.preview.path, 'image/png', version=version)
+    return serve_media_file(request, page.pdf_file.path, 'application/pdf', version=version)
+
+
+@login_required
+def course_media_view(request, path):
+    """Serve course files from MEDIA_ROOT/courses/ to enrolled learners, with Range, ETag and cache headers."""
+    try:
+        full_path = safe_join(settings.MEDIA_ROOT, 'courses', path)
+    except SuspiciousFileOperation:
+        raise Http404('File not found')
+    # Split pages and previews live under pages/<course id>/ and previews/<course id>/
+    folder, _, rest = path.partition('/')
+    course_id, _, _ = rest.partition('/')
+    if folder in ('pages', 'previews') and course_id.isdigit():
+        course_ids = [int(course_id)]
+    else:
+        course_ids = Course.objects.filter(pdf_file=f'courses/{path}').values_list('id', flat=True)
+    if not Enrollment.objects.filter(user=request.user, course_id__in=course_ids).exists():
+        raise Http404('File not found')
+    return serve_media_file(request, full_path)
+
+
 @login_required
 def api_save_progress(request):
     """Save PDF reading progress (page number). Called on page change and beforeunload."""
@@ -274,15 +343,17 @@ def api_save_progress(request):
         Enrollment.objects.get(user=request.user, course=course)
     except Enrollment.DoesNotExist:
         return JsonResponse({'success': False})
-    progress, _ = PDFReadingProgress.objects.get_or_create(
+    progress, _ = PDFReadingProgress.objects.for_user(request.user).get_or_create(
         user=request.user, course=course, defaults={'last_page_read': 1}
     )
     prev_page = progress.last_page_read
     progress.last_page_read = min(max(1, page), course.total_pages or 1)
     progress.save()
+    metrics.progress_saves.inc()
     # Optional: create or update ReadingSession for speed/habits (simplified: one session per save)
     pages_diff = max(0, progress.last_page_read - prev_page)
     if pages_diff > 0:
+        record_event(course.id, 'read')
         ReadingSession.objects.create(
             user=request.user,
             course=course,
@@ -308,34 +379,21 @@ def api_chat(request):
         return JsonResponse({'success': False, 'error': 'Message is required'})
     course = None
     if course_id:
-        try:
-            course = Course.objects.get(id=course_id)
-            Enrollment.objects.get(user=request.user, course=course)
-        except (Course.DoesNotExist, Enrollment.DoesNotExist):
-            course = None
-    # Store user message
-    ChatMessage.objects.create(user=request.user, course=course, role='user', content=message)
-    # Build answer from course summary + keywords
-    if course and course.summary_for_chat:
-        context = course.summary_for_chat + '\n' + (course.description or '')
-        answer = _answer_from_course_context(message, context, course.title)
+        # Course + enrollment check (+ content version) in one query
+        course = (
+            Course.objects.filter(id=course_id, enrollments__user=request.user)
+            .select_related('content').defer('content__page_text')
+            .first()
+        )
+    # Answer from the course's page-level retrieval index
+    sources = []
+    if course:
+        answer, passages = answer_question(course, message)
+        sources = [{'page': p['page'], 'text': p['text']} for p in passages]
     else:
-        answer = "I can only answer questions about a course you're currently learning. Open a course and ask again, or ask about one of your enrolled courses."
-    ChatMessage.objects.create(user=request.user, course=course, role='assistant', content=answer)
-    return JsonResponse({'success': True, 'answer': answer})
-
-
-def _answer_from_course_context(question, context, course_title):
-    """Generate a short answer based on course context (keyword/template fallback)."""
-    q = question.lower()
-    if 'what' in q or 'explain' in q or 'define' in q:
-        for sent in context.split('.'):
-            if any(w in sent.lower() for w in q.replace('?', '').split()[:3]):
-                return sent.strip() + '.' if sent.strip() else "This is covered in the course material. Check the relevant section in " + course_title + "."
-        return "According to " + course_title + ": " + context[:300] + "..."
-    if 'how' in q:
-        return "The course '" + course_title + "' covers this step by step. The key points: " + context[:250] + "..."
-    return "Based on " + course_title + ": " + (context[:400] + "..." if len(context) > 400 else context)
+        answer = NO_COURSE_ANSWER
+    persist_exchange(request.user, course, message, answer)
+    return JsonResponse({'success': True, 'answer': answer, 'sources': sources})
 
 
 # ==================== Lesson Views ====================
@@ -353,21 +411,20 @@ def lesson_view(request, course_id, lesson_id):
         return redirect('course_detail', course_id=course_id)
     
     # Get quizzes for this lesson
-    quizzes = lesson.quizzes.all()
+    quizzes = list(lesson.quizzes.all())
     
-    # Check if user has attempted quizzes
+    # Latest attempt per quiz, from one query (attempts are ordered newest first)
     quiz_attempts = {}
-    for quiz in quizzes:
-        attempts = QuizAttempt.objects.filter(user=request.user, quiz=quiz)
-        if attempts.exists():
-            quiz_attempts[quiz.id] = attempts.first()
+    for attempt in QuizAttempt.objects.for_user(request.user).filter(quiz_id__in=[quiz.id for quiz in quizzes]):
+        quiz_attempts.setdefault(attempt.quiz_id, attempt)
     
     context = {
         'course': course,
         'lesson': lesson,
         'enrollment': enrollment,
         'quizzes': quizzes,
-        'quiz_attempts': quiz_attempts
+        'quiz_attempts': quiz_attempts,
+        'quiz_items': [(quiz, quiz_attempts.get(quiz.id)) for quiz in quizzes],
     }
     
     # Log content view
@@ -406,6 +463,9 @@ def complete_lesson(request, course_id, lesson_id):
     
     # Check if course is complete
     if enrollment.lessons_completed >= total_lessons:
+        if not enrollment.is_completed:
+            increment_counter(course.id, 'completion_count')
+            record_event(course.id, 'complete')
         enrollment.is_completed = True
         enrollment.completed_at = timezone.now()
     
@@ -455,7 +515,7 @@ def submit_quiz(request, quiz_id):
         activity_type='quiz_completed',
         details={
             'quiz_id': quiz.id,
-            'lesson_id': quiz.lesson.id,
+            'lesson_id': quiz.lesson_id,
             'score': score,
             'correct': is_correct
         }
@@ -475,7 +535,7 @@ def submit_quiz(request, quiz_id):
 def recommendations_view(request):
     """Recommendations: reading habits, speed, related course links."""
     user = request.user
-    sessions = ReadingSession.objects.filter(user=user).select_related('course')
+    sessions = ReadingSession.objects.for_user(user)
     total_pages = sessions.aggregate(Sum('pages_read'))['pages_read__sum'] or 0
     total_mins = sum(s.duration_minutes or 0 for s in sessions)
     reading_speed = round(total_pages / total_mins, 1) if total_mins else 0  # pages per minute
@@ -486,14 +546,19 @@ def recommendations_view(request):
         hour_counts[h] = hour_counts.get(h, 0) + 1
     preferred_hour = max(hour_counts, key=hour_counts.get) if hour_counts else None
     preferred_time = f"{preferred_hour}:00" if preferred_hour is not None else "Not enough data"
-    enrolled_qs = Enrollment.objects.filter(user=user)
-    enrolled_categories = list(enrolled_qs.values_list('course__category', flat=True).distinct())
-    enrolled_course_ids = list(enrolled_qs.values_list('course_id', flat=True))
-    related_courses = Course.objects.filter(
-        total_pages__gte=1
-    ).exclude(
-        id__in=enrolled_course_ids
-    ).filter(category__in=enrolled_categories)[:6]
+    # Cached enrolled-course bitset plus the in-memory catalog: no enrollment queries
+    enrolled_course_ids = enrolled_course_ids_for(user.id)
+    _, catalog = catalog_snapshot()
+    enrolled_categories = sorted({catalog[i].category for i in enrolled_course_ids if i in catalog})
+    # Course lists below depend only on the catalog and the enrolled set, so learners share them
+    enrolled_key = hashlib.sha1(','.join(map(str, enrolled_course_ids)).encode('utf-8')).hexdigest()[:16]
+    related_courses = cached_for_version(f'related:{enrolled_key}', lambda: list(
+        Course.objects.filter(
+            total_pages__gte=1
+        ).exclude(
+            id__in=enrolled_course_ids
+        ).filter(category__in=enrolled_categories)[:6]
+    ))
     ai_engine = AIRecommendationEngine()
     day_ago = timezone.now() - timedelta(days=1)
     recent_recommendations = list(
@@ -501,6 +566,12 @@ def recommendations_view(request):
             user=user, generated_at__gte=day_ago
         ).select_related('course')[:6]
     )
+    if not recent_recommendations and not enrolled_course_ids:
+        # New learners get the merge of their precomputed segment lists
+        try:
+            recent_recommendations = ColdStartRecommender(ai_engine).recommend(user, limit=6) or []
+        except Exception:
+            recent_recommendations = []
     if not recent_recommendations:
         try:
             recent_recommendations = ai_engine.generate_recommendations(user, limit=6)
@@ -509,9 +580,9 @@ def recommendations_view(request):
     # Fallback list of courses to recommend (simple \"you might like\"), used if no AI recommendations
     fallback_courses = []
     if not recent_recommendations:
-        fallback_courses = list(
+        fallback_courses = cached_for_version(f'fallback:{enrolled_key}', lambda: list(
             Course.objects.exclude(id__in=enrolled_course_ids)[:6]
-        )
+        ))
     try:
         analyzer = BehaviorAnalyzer()
         behavior_insights = analyzer.analyze_user_behavior(user)
@@ -533,19 +604,31 @@ def recommendations_view(request):
 
 @login_required
 def refresh_recommendations(request):
-    """Refresh AI recommendations"""
+    """Queue an AI recommendation refresh; poll job_status for completion."""
     user = request.user
     
-    # Delete old recommendations
-    Recommendation.objects.filter(user=user).delete()
-    
-    # Generate new ones
-    ai_engine = AIRecommendationEngine()
-    recommendations = ai_engine.generate_recommendations(user)
+    # Repeated clicks while a refresh is pending share the same job
+    job = enqueue('refresh_recommendations', user=user, dedupe_key=f'refresh_recommendations:{user.id}')
     
     return JsonResponse({
         'success': True,
-        'count': len(recommendations)
+        'job_id': job.id,
+        'status': job.status,
+        'status_url': reverse('core:job_status', args=[job.id]),
+    })
+
+
+@login_required
+def job_status(request, job_id):
+    """Progress and outcome of one of the user's background jobs."""
+    job = get_object_or_404(BackgroundJob, id=job_id, user=request.user)
+    return JsonResponse({
+        'job_id': job.id,
+        'kind': job.kind,
+        'status': job.status,
+        'progress': job.progress,
+        'result': job.result,
+        'error': 'Job failed' if job.status == 'failed' else '',
     })
 
 
@@ -598,8 +681,7 @@ def api_stats(request):
         'lessons_completed': sum(e.lessons_completed for e in enrollments),
         'quizzes_taken': user.quiz_attempts.count(),
         'quiz_average': 0,
-        'total_learning_hours': Activity.objects.filter(
-            user=user,
+        'total_learning_hours': Activity.objects.for_user(user).filter(
             activity_type='learning_time'
         ).count(),
         'last_updated': timezone.now().isoformat()
@@ -651,3 +733,47 @@ def search_internet(request):
             'success': False,
             'error': str(e)
         })
+
+
+@staff_member_required
+def query_metrics_view(request):
+    """Per-view query count, SQL time, repeated-query and latency histograms of this process (staff only)."""
+    return JsonResponse({
+        'pid': os.getpid(),
+        'sample_rate': QUERY_SAMPLE_RATE,
+        'views': query_metrics_snapshot(),
+        'spans': span_snapshot(),
+    })
+
+
+@staff_member_required
+def profiles_view(request):
+    """Stored request profiles, newest first (staff only)."""
+    names = profile_store.names()[::-1]
+    return JsonResponse({
+        'profiles': [{'name': name, 'url': reverse('core:profile_detail', args=[name])} for name in names],
+    })
+
+
+@staff_member_required
+def profile_detail_view(request, name):
+    """One profile as collapsed stacks, ready for flamegraph.pl or speedscope (staff only)."""
+    content = profile_store.read(name)
+    if content is None:
+        raise Http404('Profile not found')
+    return HttpResponse(content, content_type='text/plain; charset=utf-8')
+
+
+def metrics_view(request):
+    """
+    Prometheus scrape endpoint: engine and pipeline metrics summed over all worker processes
+
+    Scrapers send `Authorization: Bearer <METRICS['TOKEN']>`; staff can also open it logged in.
+    """
+    token = metrics.SCRAPE_TOKEN
+    authorized = bool(token) and constant_time_compare(request.headers.get('Authorization', ''), f'Bearer {token}')
+    if not authorized and not (request.user.is_active and request.user.is_staff):
+        response = HttpResponse('Unauthorized', status=401, content_type='text/plain')
+        response['WWW-Authenticate'] = 'Bearer'
+        return response
+    return HttpResponse(metrics.render_metrics(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -2,6 +2,8 @@
 ASGI config for learnai project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+Run it with e.g. ``uvicorn learnai.asgi:application --workers 4`` to serve the
+async views in core.async_views (chat streaming, /api/async/...) concurrently.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
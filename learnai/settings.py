@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -42,11 +43,13 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'core.middleware.QueryMetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'core.profiling.ProfilingMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -81,6 +84,53 @@ DATABASES = {
     }
 }
 
+# SQLite production profile (LEARNAI_DB_PROFILE=production): WAL and the pragmas below on every connection,
+# persistent connections, and core.routers sending reads to a query-only 'replica' connection on the same
+# file while writes go to 'default'. Compare profiles with `manage.py benchmark_sqlite_concurrency`
+DATABASE_PROFILE = os.environ.get('LEARNAI_DB_PROFILE', 'development')
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    # In WAL mode NORMAL only syncs at checkpoints; a power loss may drop the last commits, never corrupt
+    'synchronous': 'NORMAL',
+    # Negative sizes are KiB: 64 MB page cache per connection
+    'cache_size': -65536,
+    'mmap_size': 256 * 1024 * 1024,
+    # Milliseconds to wait for the write lock before "database is locked"
+    'busy_timeout': 5000,
+    'temp_store': 'MEMORY',
+}
+SQLITE_INIT_COMMAND = ';'.join(f'PRAGMA {name}={value}' for name, value in SQLITE_PRAGMAS.items())
+DATABASE_ROUTERS = []
+
+if DATABASE_PROFILE == 'production':
+    DATABASES['default'].update({
+        'CONN_MAX_AGE': 600,
+        'CONN_HEALTH_CHECKS': True,
+        # Transactions take the write lock when they begin, so concurrent writers queue one at a time
+        # on busy_timeout instead of failing when a read lock cannot be upgraded
+        'OPTIONS': {'init_command': SQLITE_INIT_COMMAND, 'transaction_mode': 'IMMEDIATE'},
+    })
+    DATABASES['replica'] = {
+        **DATABASES['default'],
+        'OPTIONS': {'init_command': SQLITE_INIT_COMMAND + ';PRAGMA query_only=ON'},
+        'TEST': {'MIRROR': 'default'},
+    }
+    DATABASE_ROUTERS = ['core.routers.ReadWriteRouter']
+
+# User-sharded history tables (core.sharding): with LEARNAI_USER_SHARDS=N the Activity, PDFReadingProgress,
+# ReadingSession, ChatMessage and QuizAttempt rows of a learner live in shard_<user id % N>, one SQLite file
+# each with the same options as 'default'; users, the catalog and everything else stay in 'default'.
+# After changing N run `manage.py reshard --from <old N>`, which also migrates new shards
+USER_SHARDS = int(os.environ.get('LEARNAI_USER_SHARDS', 0))
+USER_SHARD_NAME = str(BASE_DIR / 'db_shard_{}.sqlite3')
+for _index in range(USER_SHARDS):
+    DATABASES[f'shard_{_index}'] = {
+        **{key: value for key, value in DATABASES['default'].items() if key != 'TEST'},
+        'NAME': USER_SHARD_NAME.format(_index),
+    }
+if USER_SHARDS:
+    DATABASE_ROUTERS = ['core.routers.UserShardRouter', *DATABASE_ROUTERS]
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -120,6 +170,69 @@ STATIC_URL = 'static/'
 MEDIA_URL = 'media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Course media hand-off (core.media): None streams files from Django,
+# 'nginx' sets X-Accel-Redirect under MEDIA_SENDFILE_PREFIX, 'apache' sets X-Sendfile
+MEDIA_SENDFILE_BACKEND = None
+MEDIA_SENDFILE_PREFIX = '/protected-media/'
+
+# Local runtime data (search indexes, precomputed models); not committed
+DATA_DIR = BASE_DIR / 'var'
+CHAT_INDEX_DIR = DATA_DIR / 'chat_index'
+COURSE_TRANSITIONS_PATH = DATA_DIR / 'course_transitions.json.gz'
+
+# Per-process LRU (core.cache) in front of a file cache shared by all workers. For Django's database
+# cache instead, set SHARED_BACKEND to 'django.core.cache.backends.db.DatabaseCache', LOCATION to a
+# table name and run `manage.py createcachetable`
+CACHES = {
+    'default': {
+        'BACKEND': 'core.cache.TieredCache',
+        'LOCATION': str(DATA_DIR / 'cache'),
+        'TIMEOUT': 300,
+        'OPTIONS': {
+            'SHARED_BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCAL_MAX_ENTRIES': 1024,
+            'LOCAL_TIMEOUT': 5,
+            'MAX_ENTRIES': 10000,
+        },
+    },
+}
+
+# Chatbot answer cache (per process) and optional background chat-history writes
+CHAT_ANSWER_CACHE = {'MAX_ENTRIES': 1024, 'TTL': 3600}
+CHAT_ASYNC_HISTORY = False
+
+# Memoized user-independent recommendation scores, one entry per distinct learner profile
+# (about 40 bytes per course each), bounded by entry count and total bytes per process
+RECOMMENDATION_SCORE_CACHE = {'MAX_ENTRIES': 64, 'MAX_BYTES': 64 * 1024 * 1024}
+
+# Trending popularity counters (core.trending); fold with `manage.py fold_trending`
+TRENDING = {'HALF_LIFE_DAYS': 7}
+
+# Rows per course for sharded Course counters; reconcile with `manage.py reconcile_counters`
+COUNTER_SHARDS = 8
+
+# "Learners like you" neighbor precompute (core.neighbors, needs numpy); run `manage.py build_user_neighbors`
+USER_NEIGHBORS = {'TOP_K': 20, 'BLOCK_SIZE': 2048, 'MAX_DIMS': 1024}
+
+# Per-view query/latency histograms (core.middleware); SAMPLE_RATE 0 disables recording,
+# HEADER adds X-Query-Count/-Time/-Duplicates to sampled responses; staff JSON at /api/query-metrics/
+QUERY_METRICS = {'SAMPLE_RATE': 0.0, 'HEADER': False}
+
+# Request profiling (core.profiling): staff add ?profile=1, or send X-Profile: HEADER_TOKEN, or list
+# URL names in SAMPLE_RATES. Collapsed stacks are kept in DIR (newest MAX_FILES) and listed at /api/profiles/
+PROFILING = {
+    'MODE': 'sample',
+    'SAMPLE_RATES': {},
+    'HEADER_TOKEN': '',
+    'DIR': DATA_DIR / 'profiles',
+    'MAX_FILES': 200,
+}
+
+# Prometheus metrics at /metrics (core.metrics): one mmap'd value file per process in DIR, summed on scrape;
+# exited workers' files are folded into DIR/merged.db. Scrapers authenticate with `Authorization: Bearer TOKEN`
+# (no token: staff sessions only)
+METRICS = {'ENABLED': True, 'DIR': DATA_DIR / 'metrics', 'TOKEN': os.environ.get('LEARNAI_METRICS_TOKEN', '')}
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
@@ -18,9 +18,13 @@ from django.contrib import admin
 from django.urls import path, include
 from django.conf import settings
 from django.conf.urls.static import static
+from core.views import course_media_view, metrics_view
 
 urlpatterns = [
     path('admin/', admin.site.urls),
+    path('metrics', metrics_view, name='metrics'),
+    # Course PDFs/pages: Range + ETag aware, also used in production
+    path(settings.MEDIA_URL.lstrip('/') + 'courses/<path:path>', course_media_view, name='course_media'),
     path('', include('core.urls')),
 ]
 if settings.DEBUG: